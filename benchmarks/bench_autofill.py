@@ -0,0 +1,114 @@
+"""
+Time autofilling and writing a synthetic index.bob with 5k symbols,
+comparing the previous objectify engine (which had to deannotate the whole
+tree before writing it) with the plain lxml.etree engine.
+
+Run with: python benchmarks/bench_autofill.py
+"""
+
+import tempfile
+import timeit
+from pathlib import Path
+
+from lxml import objectify
+from lxml.etree import SubElement
+
+from techui_builder.autofill import Autofiller
+from techui_builder.generate_jsonmap import _get_action_group
+from techui_builder.models import Component
+from techui_builder.utils import read_bob
+
+SYMBOLS = 5_000
+
+_objectify_parser = objectify.makeparser()
+
+
+def symbol(name: str) -> str:
+    return f"""<widget type="symbol" version="2.0.0"><name>{name}</name>
+<pv_name>placeholder</pv_name><actions><action type="open_display">
+<file>placeholder.bob</file><target>tab</target>
+<description>Open Display</description></action></actions></widget>"""
+
+
+def write_fixture(directory: Path) -> tuple[Path, dict[str, Component]]:
+    index = directory.joinpath("index.bob")
+    symbols = "".join(symbol(f"device{i}") for i in range(SYMBOLS))
+    index.write_text(f'<display version="2.0.0"><name>Index</name>{symbols}</display>')
+    components = {
+        f"device{i}": Component(
+            prefix=f"BL01T-MO-DEV-{i % 100:02}",
+            label=f"Device {i}",
+            file=f"device{i}.bob",
+            macros={"P": f"BL01T-MO-DEV-{i % 100:02}", "M": f":M{i}"},
+        )
+        for i in range(SYMBOLS)
+    }
+    return index, components
+
+
+class ObjectifyAutofiller(Autofiller):
+    """The previous engine, editing an objectified tree"""
+
+    def read_bob(self):
+        self.tree, self.widgets = read_bob(self.path)
+
+    def autofill_bob(self):
+        for symbol_name, child in self.widgets.items():
+            component = self.gui_components.get(symbol_name)
+            if component is None:
+                continue
+            self.replace_content(child, symbol_name, component)
+            child["run_actions_on_mouse_click"] = "true"
+
+    def write_bob(self, filename: Path):
+        objectify.deannotate(self.tree, cleanup_namespaces=True)
+        super().write_bob(filename)
+
+    def replace_content(self, widget, component_name: str, component: Component):
+        widget["pv_name"] = f"{component.P}:STA"
+        action = _get_action_group(widget)
+        assert action is not None
+        action["description"] = component.label or component_name
+        action["file"] = component.file or f"{component_name}.bob"
+        if component.macros is not None:
+            if hasattr(action, "macros"):
+                action.remove(action.macros)
+            macros = _objectify_parser.makeelement("macros")
+            for macro, val in component.macros.items():
+                SubElement(macros, macro)._setText(str(val))  # noqa: SLF001
+            action.append(macros)
+
+
+def autofill(autofiller_type: type[Autofiller], index: Path, components, dest: Path):
+    autofiller = autofiller_type(index, components)
+    autofiller.read_bob()
+    autofiller.autofill_bob()
+    autofiller.write_bob(dest)
+
+
+def main():
+    engines = (("objectify", ObjectifyAutofiller), ("etree", Autofiller))
+    with tempfile.TemporaryDirectory() as tmp:
+        index, components = write_fixture(Path(tmp))
+        outputs = []
+        for name, engine in engines:
+            dest = Path(tmp, f"{name}.bob")
+            autofill(engine, index, components, dest)
+            outputs.append(dest.read_bytes())
+        assert outputs[0] == outputs[1]
+
+        print(f"Autofilling {SYMBOLS} symbols")
+        for name, engine in engines:
+            dest = Path(tmp, f"{name}.bob")
+            seconds = min(
+                timeit.repeat(
+                    lambda e=engine, d=dest: autofill(e, index, components, d),
+                    number=1,
+                    repeat=5,
+                )
+            )
+            print(f"{name:>10}: {seconds * 1e3:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Time extracting 10k synthetic entities from a parsed ioc.yaml, comparing
+compiling the prefix template of every entity with the per support module
+type template cache.
+
+Run with: python benchmarks/bench_extract_entities.py
+"""
+
+import re
+import timeit
+from collections import defaultdict
+from pathlib import Path
+
+from jinja2 import Template
+
+from techui_builder.builder import Builder
+from techui_builder.models import Entity, SupportEntity, TechUiSupport
+
+TECHUI = Path(__file__).parents[1].joinpath("example/t01-services/synoptic/techui.yaml")
+ENTITIES = 10_000
+
+TECHUI_SUPPORT = TechUiSupport(
+    support_modules={
+        "pmac.GeoBrick": SupportEntity(prefix="{{ P }}", macros=["P"], screens=[]),
+        "pmac.dls_pmac_asyn_motor": SupportEntity(
+            prefix="{{ P }}{{ M }}", macros=["P", "M"], screens=[]
+        ),
+        "ADAravis.aravisCamera": SupportEntity(
+            prefix="{{ P }}{{ R }}", macros=["P", "R"], screens=[]
+        ),
+        "detectorPlugins.detectorPlugins": SupportEntity(
+            prefix="{{ P }}{{ R }}", macros=["P", "R"], screens=[]
+        ),
+    }
+)
+
+
+def synthetic_ioc_conf() -> dict[str, list[dict[str, str]]]:
+    entities = []
+    for i in range(ENTITIES):
+        p = f"BL01T-MO-DEV-{i // 100:02}"
+        match i % 4:
+            case 0:
+                entity = {"type": "pmac.GeoBrick", "P": p, "PORT": f"BRICK{i}"}
+            case 1:
+                entity = {"type": "pmac.dls_pmac_asyn_motor", "P": p, "M": f":M{i}"}
+            case 2:
+                entity = {"type": "ADAravis.aravisCamera", "P": p, "R": f":CAM{i}:"}
+            case _:
+                entity = {
+                    "type": "detectorPlugins.detectorPlugins",
+                    "P": p,
+                    "R": f":PLUGIN{i}:",
+                    "desc": "Plugins",
+                }
+        entities.append(entity)
+    return {"entities": entities}
+
+
+def add_entities_uncached(
+    builder: Builder, service_name: str, ioc_conf: dict[str, list[dict[str, str]]]
+):
+    """The previous extraction, compiling a template for every entity"""
+    for key in ioc_conf.keys():
+        _regex = re.compile(r"^(?:(entities)|(controllers))$")
+        match = _regex.match(key)
+        if match:
+            for entity in ioc_conf[match.group()]:
+                if entity["type"] in builder.techui_support.support_modules:
+                    support_mapping = builder.techui_support.support_modules[
+                        entity["type"]
+                    ]
+                    macros = {
+                        k: v for k, v in entity.items() if k in support_mapping.macros
+                    }
+                    prefix = Template(support_mapping.prefix).render(macros)
+                    new_entity = Entity(
+                        service_name=service_name,
+                        type=entity["type"],
+                        desc=entity.get("desc", None),
+                        prefix=prefix,
+                        macros=macros,
+                    )
+                    builder.entities[prefix.split(":", maxsplit=1)[0]].append(
+                        new_entity
+                    )
+            break
+
+
+def main():
+    ioc_conf = synthetic_ioc_conf()
+    builder = Builder(TECHUI)
+    builder.techui_support = TECHUI_SUPPORT
+
+    def uncached():
+        builder.entities = defaultdict(list)
+        add_entities_uncached(builder, "bl01t-mo-ioc-01", ioc_conf)
+        return builder.entities
+
+    def cached():
+        builder.entities = defaultdict(list)
+        # Start from an empty cache, as a fresh build would
+        builder._prefix_templates.clear()  # noqa: SLF001
+        builder._add_entities("bl01t-mo-ioc-01", ioc_conf)  # noqa: SLF001
+        return builder.entities
+
+    assert uncached() == cached()
+
+    print(f"Extracting {ENTITIES} entities")
+    for name, func in (("template per entity", uncached), ("template cache", cached)):
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:>20}: {seconds * 1e3:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Time serialising a synthetic 100k node JsonMap tree, comparing the old
+per-node default lookup with the precomputed default table, and writing
+the tree with dump_json_map.
+
+Run with: python benchmarks/bench_jsonmap.py
+"""
+
+import io
+import json
+import timeit
+from collections.abc import Mapping
+from dataclasses import MISSING, fields
+from typing import Any
+
+from techui_builder.generate_jsonmap import (
+    JsonMap,
+    _json_map_items,
+    dump_json_map,
+)
+
+NODES = 100_000
+# Children per node, so the tree is a few levels deep
+FAN_OUT = 10
+
+
+def synthetic_tree() -> JsonMap:
+    """A tree of NODES nodes, with a mix of default and non-default fields"""
+    root = JsonMap("index.bob", "Beamline")
+    level = [root]
+    count = 1
+    while count < NODES:
+        next_level: list[JsonMap] = []
+        for parent in level:
+            for i in range(FAN_OUT):
+                if count >= NODES:
+                    break
+                node = JsonMap(
+                    f"screen_{count}.bob",
+                    f"Screen {count}",
+                    exists=i % 3 != 0,
+                    macros={"P": f"BL01T-MO-{count:06}"} if i % 2 else {},
+                )
+                parent.children.append(node)
+                next_level.append(node)
+                count += 1
+        level = next_level
+    return root
+
+
+def serialise_per_node_defaults(map: JsonMap) -> dict[str, Any]:
+    """The previous serialiser, looking up every default for every field"""
+
+    def _check_default(key: str, value: Any):
+        field_ = JsonMap.__dataclass_fields__[key]
+        if field_.default_factory is not MISSING:
+            default = field_.default_factory()
+        else:
+            default = field_.default
+        return value == default
+
+    d = {}
+    for f in fields(map):
+        key, val = f.name, getattr(map, f.name)
+        if key == "children" and len(val) > 0:
+            val = [serialise_per_node_defaults(v) for v in val]
+        if _check_default(key, val):
+            continue
+        d[key] = val
+
+    if "display_name" in d:
+        d["displayName"] = d.pop("display_name")
+    if "back_reference" in d:
+        d["backReference"] = d.pop("back_reference")
+    return d
+
+
+def serialise_precomputed_defaults(map: JsonMap) -> dict[str, Any]:
+    """The serialiser using the precomputed default table"""
+    d: dict[str, Any] = {}
+    for key, val in _json_map_items(map):
+        if key == "children":
+            val = [serialise_precomputed_defaults(v) for v in val]
+        elif isinstance(val, Mapping):
+            val = dict(val)
+        d[key] = val
+    return d
+
+
+def main():
+    tree = synthetic_tree()
+    assert serialise_per_node_defaults(tree) == serialise_precomputed_defaults(tree)
+
+    def dump_json_map_to_string(indent: int | None) -> str:
+        f = io.StringIO()
+        dump_json_map(tree, f, indent=indent)
+        return f.getvalue()
+
+    timings = {
+        "per-node defaults": lambda: serialise_per_node_defaults(tree),
+        "precomputed defaults": lambda: serialise_precomputed_defaults(tree),
+        "json.dumps (before)": lambda: json.dumps(
+            serialise_per_node_defaults(tree), indent=4
+        ),
+        "dump_json_map": lambda: dump_json_map_to_string(4),
+        "dump_json_map compact": lambda: dump_json_map_to_string(None),
+    }
+
+    print(f"Serialising {NODES} JsonMap nodes")
+    for name, func in timings.items():
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:>22}: {seconds * 1e3:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Time extracting the screen links from large .bob files, comparing the
+previous objectify based extraction with the single XPath pass over a plain
+lxml tree used by JsonMapGenerator.
+
+Every screen has many widgets that do not open anything (labels, LEDs and
+text updates) around the symbols, embedded displays and tabs that do.
+
+Run with: python benchmarks/bench_jsonmap_extract.py
+"""
+
+import tempfile
+import timeit
+from pathlib import Path
+
+from lxml import objectify
+
+from techui_builder.generate_jsonmap import JsonMapGenerator
+
+TECHUI = Path(__file__).parents[1].joinpath("example/t01-services/synoptic/techui.yaml")
+SCREENS = 20
+# Widgets of each kind per screen
+WIDGETS = 1000
+
+
+def screen_xml(index: int) -> str:
+    widgets = []
+    for w in range(WIDGETS):
+        widgets.append(
+            f"""<widget type="symbol" version="2.0.0"><name>M{w}</name>
+<x>{w}</x><y>0</y><width>100</width><height>40</height>
+<actions><action type="open_display"><file>motor.bob</file>
+<macros><P>BL01T-MO-{index:02}</P><M>:M{w}</M></macros>
+<target>tab</target></action></actions></widget>
+<widget type="label" version="2.0.0"><name>L{w}</name><text>M{w}</text></widget>
+<widget type="led" version="2.0.0"><name>S{w}</name><pv_name>PV{w}</pv_name>
+</widget>
+<widget type="textupdate" version="2.0.0"><name>T{w}</name>
+<pv_name>PV{w}:RBV</pv_name></widget>"""
+        )
+        if w % 10 == 0:
+            widgets.append(
+                f"""<widget type="embedded" version="2.0.0"><name>E{w}</name>
+<file>embedded.bob</file><macros><P>BL01T-EA-{w}</P></macros></widget>
+<widget type="navtabs" version="2.0.0"><name>N{w}</name><tabs>
+<tab><name>One</name><file>one.bob</file></tab>
+<tab><name>Two</name><file>two.bob</file></tab></tabs></widget>"""
+            )
+    return (
+        f'<display version="2.0.0"><name>Screen {index}</name>'
+        f"{''.join(widgets)}</display>"
+    )
+
+
+def objectify_links(screen_path: Path) -> list[tuple]:
+    """The previous extraction, with objectify attribute lookups"""
+    root = objectify.parse(screen_path).getroot()
+    links = []
+    widgets = [
+        w
+        for w in root.findall(".//widget")
+        if w.get("type", default=None)
+        in ["symbol", "action_button", "embedded", "navtabs"]
+    ]
+    for widget in widgets:
+        widget_type = widget.get("type", default=None)
+        match widget_type:
+            case "symbol" | "action_button":
+                targets = [
+                    (widget.name.text, action)
+                    for action in widget.actions.iterchildren("action")
+                    if action.get("type", default=None) == "open_display"
+                ][:1]
+            case "embedded":
+                targets = [(widget.name.text, widget)]
+            case _:
+                targets = [
+                    (tab.name.text, tab) for tab in widget.tabs.iterchildren("tab")
+                ]
+        for name, target in targets:
+            file = target.file.text.strip()
+            if not file.endswith(".bob"):
+                continue
+            macros = {}
+            if hasattr(target, "macros"):
+                macros = {
+                    str(macro.tag): macro.text
+                    for macro in target.macros.getchildren()
+                    if macro.text is not None
+                }
+            links.append((widget_type, name, file, macros))
+    return links
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        screens = []
+        for index in range(SCREENS):
+            screen = Path(tmp).joinpath(f"screen{index}.bob")
+            screen.write_text(screen_xml(index))
+            screens.append(screen)
+        size = sum(screen.stat().st_size for screen in screens)
+
+        generator = JsonMapGenerator(bob_path=screens[0], techui=TECHUI)
+        parse_screen = generator._parse_screen  # noqa: SLF001
+        for screen in screens:
+            assert objectify_links(screen) == parse_screen(screen).links
+
+        timings = {
+            "objectify": lambda: [objectify_links(s) for s in screens],
+            "xpath": lambda: [parse_screen(s) for s in screens],
+        }
+
+        print(f"Extracting links from {SCREENS} screens ({size / 2**20:.1f}MiB)")
+        for name, func in timings.items():
+            seconds = min(timeit.repeat(func, number=1, repeat=5))
+            print(f"{name:>10}: {seconds * 1e3:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measure the memory used by the JsonMap tree of a large synthetic synoptic:
+an index.bob with many device screens, each opening the same support
+screens with a handful of distinct macro sets.
+
+The tree is compared with a copy where every node has its own file string
+and macros dict, which is how nodes were stored before they were shared.
+
+Run with: python benchmarks/bench_jsonmap_memory.py
+"""
+
+import resource
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from techui_builder.generate_jsonmap import JsonMap, JsonMapGenerator
+
+TECHUI = Path(__file__).parents[1].joinpath("example/t01-services/synoptic/techui.yaml")
+DEVICES = 400
+MOTORS_PER_DEVICE = 40
+
+
+def action_button(name: str, file: str, macros: dict[str, str]) -> str:
+    macro_xml = "".join(f"<{k}>{v}</{k}>" for k, v in macros.items())
+    return f"""<widget type="action_button" version="2.0.0"><name>{name}</name>
+<actions><action type="open_display"><file>{file}</file>
+<macros>{macro_xml}</macros></action></actions></widget>"""
+
+
+def write_fixture(synoptic: Path) -> Path:
+    """Write the screens, returning the path of index.bob"""
+    support = synoptic.joinpath("techui-support/bob/pmac")
+    support.mkdir(parents=True)
+    support.joinpath("motor.bob").write_text(
+        '<display version="2.0.0"><name>Motor</name></display>'
+    )
+
+    devices = []
+    for d in range(DEVICES):
+        motors = "".join(
+            action_button(
+                f"X{m}",
+                "techui-support/bob/pmac/motor.bob",
+                {"P": f"BL01T-MO-BRICK-{d % 8:02}", "M": f":X{m}", "IOC": "ioc"},
+            )
+            for m in range(MOTORS_PER_DEVICE)
+        )
+        synoptic.joinpath(f"device{d}.bob").write_text(
+            f'<display version="2.0.0"><name>Device {d}</name>{motors}</display>'
+        )
+        devices.append(action_button(f"device{d}", f"device{d}.bob", {}))
+
+    index = synoptic.joinpath("index.bob")
+    index.write_text(
+        f'<display version="2.0.0"><name>Index</name>{"".join(devices)}</display>'
+    )
+    return index
+
+
+def copy_tree(node: JsonMap, share: bool) -> JsonMap:
+    """
+    Copy a tree, either sharing file strings and macros like the generator
+    does, or giving every node its own copies
+    """
+    copy = JsonMap(
+        node.file if share else "".join(list(node.file)),
+        node.display_name,
+        exists=node.exists,
+        macros=node.macros if share else dict(node.macros),
+        error=node.error,
+        back_reference=node.back_reference,
+    )
+    copy.children = [copy_tree(child, share) for child in node.children]
+    return copy
+
+
+def traced_size(json_map: JsonMap, share: bool) -> int:
+    """Bytes allocated for a copy of the tree"""
+    tracemalloc.start()
+    copy = copy_tree(json_map, share)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del copy
+    return size
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = write_fixture(Path(tmp))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        generator = JsonMapGenerator(bob_path=index, techui=TECHUI)
+        json_map = generator.generate_json_map(index, Path(tmp))
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    nodes = 1 + DEVICES * (1 + MOTORS_PER_DEVICE)
+    print(f"JsonMap tree of {nodes} nodes")
+    for name, share in (("shared", True), ("unshared", False)):
+        print(f"{name:>16}: {traced_size(json_map, share) / 2**20:8.1f}MiB")
+    # ru_maxrss is in KiB on Linux
+    print(f"{'max RSS growth':>16}: {(rss_after - rss_before) / 1024:8.1f}MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Micro-benchmark of the widget layout strategies.
+
+Run with: python benchmarks/bench_layout.py
+"""
+
+import random
+import timeit
+
+from techui_builder.layout import DEFAULT_SETTINGS, LAYOUT_STRATEGIES
+
+# Typical support screen sizes: motors, gauges, related display buttons
+SCREEN_SIZES = [(205, 120), (100, 40), (860, 450), (300, 200), (150, 60)]
+
+
+def synthetic_sizes(n: int, seed: int = 0) -> list[tuple[int, int]]:
+    rng = random.Random(seed)
+    return [rng.choice(SCREEN_SIZES) for _ in range(n)]
+
+
+def main():
+    print(f"{'widgets':>8} " + " ".join(f"{name:>12}" for name in LAYOUT_STRATEGIES))
+    for n in (10, 100, 1_000, 10_000):
+        sizes = synthetic_sizes(n)
+        timings = []
+        for strategy in LAYOUT_STRATEGIES.values():
+            number = max(1, 10_000 // n)
+            seconds = timeit.timeit(
+                lambda s=strategy, z=sizes: s(z, DEFAULT_SETTINGS), number=number
+            )
+            timings.append(seconds / number)
+        print(f"{n:>8} " + " ".join(f"{t * 1e3:>10.3f}ms" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
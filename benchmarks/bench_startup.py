@@ -0,0 +1,70 @@
+"""
+Measure how long the techui-builder CLI takes to import, using
+python -X importtime, and the slowest modules it imports.
+
+Run with: python benchmarks/bench_startup.py [--check]
+
+With --check, exits with an error if importing the CLI takes longer than
+IMPORT_BUDGET_MS, or if it imports any of HEAVY_MODULES, which should only be
+imported by the subcommands that use them.
+"""
+
+import subprocess
+import sys
+
+# Loading the CLI took ~1s when every subcommand imported everything up front,
+# and takes ~150ms with the heavy imports deferred
+IMPORT_BUDGET_MS = 400
+HEAVY_MODULES = (
+    "epicsdbbuilder",
+    "jinja2",
+    "phoebusgen",
+    "pydantic",
+    "softioc",
+    "techui_builder.builder",
+    "techui_builder.models",
+)
+REPEAT = 5
+
+
+def import_times(module: str = "techui_builder.__main__") -> dict[str, int]:
+    """Cumulative import time in microseconds of every module imported"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    runs = [import_times() for _ in range(REPEAT)]
+    times = min(runs, key=lambda t: t["techui_builder.__main__"])
+    total_ms = times["techui_builder.__main__"] / 1e3
+
+    print(f"Importing techui_builder.__main__: {total_ms:.1f}ms (best of {REPEAT})")
+    print("Slowest modules (cumulative):")
+    for name, us in sorted(times.items(), key=lambda t: t[1], reverse=True)[1:11]:
+        print(f"{us / 1e3:10.1f}ms  {name}")
+
+    heavy = [
+        name
+        for name in times
+        if any(name == m or name.startswith(f"{m}.") for m in HEAVY_MODULES)
+    ]
+    if "--check" in sys.argv:
+        if heavy:
+            sys.exit(f"Heavy modules imported at startup: {', '.join(heavy)}")
+        if total_ms > IMPORT_BUDGET_MS:
+            sys.exit(f"Startup of {total_ms:.1f}ms is over {IMPORT_BUDGET_MS}ms")
+
+
+if __name__ == "__main__":
+    main()
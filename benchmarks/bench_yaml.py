@@ -0,0 +1,56 @@
+"""
+Compare the pure Python and libyaml YAML loaders on the example
+t01-services tree, scaled up 100x.
+
+Run with: python benchmarks/bench_yaml.py
+"""
+
+import shutil
+import tempfile
+import timeit
+from pathlib import Path
+
+import yaml
+
+EXAMPLE = Path(__file__).parents[1].joinpath("example/t01-services")
+SCALE = 100
+
+
+def scaled_services(dest: Path) -> list[Path]:
+    """Copy every service in the example tree SCALE times"""
+    yamls: list[Path] = []
+    for service in sorted(EXAMPLE.joinpath("services").iterdir()):
+        for i in range(SCALE):
+            copy = dest.joinpath(f"{service.name}-{i:03}")
+            shutil.copytree(service, copy)
+            yamls.extend(sorted(copy.joinpath("config").glob("*.yaml")))
+    shutil.copy(EXAMPLE.joinpath("synoptic/techui.yaml"), dest)
+    yamls.append(dest.joinpath("techui.yaml"))
+    return yamls
+
+
+def load_all(yamls: list[Path], loader: type) -> None:
+    for path in yamls:
+        with open(path) as f:
+            yaml.load(f, Loader=loader)
+
+
+def main():
+    loaders: dict[str, type] = {"SafeLoader": yaml.SafeLoader}
+    if yaml.__with_libyaml__:
+        loaders["CSafeLoader"] = yaml.CSafeLoader
+    else:
+        print("PyYAML was built without libyaml, only timing SafeLoader")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        yamls = scaled_services(Path(tmp))
+        print(f"Loading {len(yamls)} YAML files")
+        for name, loader in loaders.items():
+            seconds = min(
+                timeit.repeat(lambda ld=loader: load_all(yamls, ld), number=1, repeat=5)
+            )
+            print(f"{name:>12}: {seconds * 1e3:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
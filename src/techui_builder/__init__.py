@@ -6,11 +6,24 @@
     Version number as calculated by poetry-dynamic-versioning
 """
 
-from techui_builder.builder import Builder
+from typing import TYPE_CHECKING
 
 from ._version import __version__
 
+if TYPE_CHECKING:
+    from techui_builder.builder import Builder
+
 __all__ = [
     "__version__",
     "Builder",
 ]
+
+
+def __getattr__(name: str):
+    # Builder pulls in phoebusgen, jinja2 and pydantic, so it is only imported
+    # when used rather than by every subcommand (and `--version`)
+    if name == "Builder":
+        from techui_builder.builder import Builder
+
+        return Builder
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
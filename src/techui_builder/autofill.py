@@ -1,19 +1,60 @@
 import logging
 import os
 from collections import defaultdict
+from collections.abc import Iterator
 from dataclasses import dataclass, field
+from itertools import count
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from lxml import objectify
-from lxml.etree import Element, SubElement, tostring
-from lxml.objectify import ObjectifiedElement, fromstring
+from lxml import etree
 
 from techui_builder.generate_jsonmap import _get_action_group
 from techui_builder.models import Component
-from techui_builder.utils import read_bob
+from techui_builder.utils import parse_bob
+
+if TYPE_CHECKING:
+    # Only in the stubs, as what xmlfile writes to
+    from lxml.etree._serializer import _IncrementalFileWriter
 
 logger_ = logging.getLogger(__name__)
 
+# The macros filled in from a widget's open display action
+_ACTION_GROUP_MACROS = frozenset({"desc", "file", "macros"})
+
+# Pretty printing indents with two spaces per level
+_INDENT = "  "
+
+
+def _set_child_text(element: etree._Element, tag: str, text: str):
+    """
+    Sets the text of the first child with the given tag, replacing its content
+    and attributes, or adds the child at the end if there is not one
+    """
+    child = element.find(tag)
+    if child is None:
+        child = etree.SubElement(element, tag)
+    else:
+        child.clear()
+    child.text = text
+
+
+def _indent(element: etree._Element, level: int):
+    """
+    Indents the descendants of an element as pretty printing it at the given
+    level would, which leaves mixed content as it is
+    """
+    if len(element) == 0 or element.text or any(child.tail for child in element):
+        return
+
+    indent = "\n" + _INDENT * (level + 1)
+    element.text = indent
+    for child in element:
+        _indent(child, level + 1)
+        child.tail = indent
+    # Dedent the closing tag
+    element[-1].tail = indent.removesuffix(_INDENT)
+
 
 @dataclass
 class Autofiller:
@@ -22,32 +63,33 @@ class Autofiller:
     macros: list[str] = field(
         default_factory=lambda: ["prefix", "desc", "file", "macros"]
     )
-    widgets: dict[str, ObjectifiedElement] = field(
+    widgets: dict[str, etree._Element] = field(
         default_factory=defaultdict, init=False, repr=False
     )
 
     def read_bob(self) -> None:
-        self.tree, self.widgets = read_bob(self.path)
+        self.tree, self.widgets = parse_bob(self.path)
 
     def autofill_bob(self):
         # Get names from component list
 
         for symbol_name, child in self.widgets.items():
-            # If the name exists in the component list
-            if symbol_name in self.gui_components.keys():
-                # Get first copy of component (should only be one)
-                comp = next(
-                    (comp for comp in self.gui_components if comp == symbol_name),
-                )
+            self._autofill_widget(child, symbol_name)
 
-                self.replace_content(
-                    widget=child,
-                    component_name=comp,
-                    component=self.gui_components[comp],
-                )
+    def _autofill_widget(self, widget: etree._Element, symbol_name: str):
+        # If the name exists in the component list
+        component = self.gui_components.get(symbol_name)
+        if component is None:
+            return
+
+        self.replace_content(
+            widget=widget,
+            component_name=symbol_name,
+            component=component,
+        )
 
-                # Add option to allow left mouse click to run action
-                child["run_actions_on_mouse_click"] = "true"
+        # Add option to allow left mouse click to run action
+        _set_child_text(widget, "run_actions_on_mouse_click", "true")
 
     def write_bob(self, filename: Path):
         # Check if data/ dir exists and if not, make it
@@ -55,9 +97,6 @@ class Autofiller:
         if not data_dir.exists():
             os.mkdir(data_dir)
 
-        # Remove any unnecessary xmlns:py and py:pytype metadata from tags
-        objectify.deannotate(self.tree, cleanup_namespaces=True)
-
         self.tree.write(
             filename,
             pretty_print=True,
@@ -66,12 +105,167 @@ class Autofiller:
         )
         logger_.debug(f"Screen filled for {filename}")
 
+    def stream_bob(self, filename: Path):
+        """
+        Autofills the screen while copying it to filename a widget at a time,
+        rather than reading the whole screen, so that memory use does not grow
+        with the size of the screen. Writes the same file as read_bob,
+        autofill_bob and write_bob, so the screen is scanned first for the
+        last widget with each name, which is the one filled.
+        """
+        data_dir = filename.parent
+        if not data_dir.exists():
+            os.mkdir(data_dir)
+
+        # The template is often filled in place, so it cannot be written as it
+        # is read
+        tmp_file = filename.with_name(f"{filename.name}.{os.getpid()}.tmp")
+        try:
+            self._stream_to(tmp_file)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+        os.replace(tmp_file, filename)
+
+        logger_.debug(f"Screen filled for {filename}")
+
+    def _stream_to(self, filename: Path):
+        last_positions = self._last_widget_positions()
+        positions = count()
+        events = etree.iterparse(
+            self.path,
+            events=("start", "end", "comment", "pi"),
+            remove_blank_text=True,
+        )
+        with open(filename, "wb") as f:
+            with etree.xmlfile(f, encoding="UTF-8") as xf:
+                xf.write_declaration()
+                for event, element in events:
+                    if event == "start":
+                        # The <display> root
+                        with xf.element(element.tag, element.attrib):
+                            self._stream_children(
+                                xf, events, element, 1, last_positions, positions
+                            )
+                        break
+                    # Comments before the root, a line each
+                    element.tail = "\n"
+                    xf.write(element)
+
+            f.write(b"\n")
+            # xmlfile cannot write anything after the root
+            for _, element in events:
+                f.write(etree.tostring(element, encoding="UTF-8", with_tail=False))
+                f.write(b"\n")
+
+    def _last_widget_positions(self) -> dict[str, int]:
+        """
+        The position of the last widget with each name among the widgets
+        get_widgets would find, in the order they are in the screen
+        """
+        last_positions: dict[str, int] = {}
+        positions = count()
+        # Per open element, whether get_widgets looks at its children
+        searched: list[bool] = []
+        for event, element in etree.iterparse(self.path, events=("start", "end")):
+            if event == "start":
+                searched.append(
+                    not searched
+                    or (
+                        searched[-1]
+                        and element.tag == "widget"
+                        and element.get("type") == "group"
+                    )
+                )
+                continue
+
+            searched.pop()
+            # Only the children of the root and groups
+            if not searched or not searched[-1]:
+                continue
+
+            if element.tag == "widget" and element.get("type") in (
+                "action_button",
+                "symbol",
+            ):
+                name = element.findtext("name")
+                assert name
+                last_positions[name] = next(positions)
+            # Done with it, so the scan does not hold the whole screen
+            parent = element.getparent()
+            assert parent is not None
+            parent.remove(element)
+
+        return last_positions
+
+    def _stream_children(
+        self,
+        xf: "_IncrementalFileWriter",
+        events: Iterator[tuple[str, etree._Element]],
+        parent: etree._Element,
+        level: int,
+        last_positions: dict[str, int],
+        positions: Iterator[int],
+    ):
+        """
+        Copies the children of the root or a group to xf as they are parsed,
+        filling the widgets get_widgets would find, until the parent ends
+        """
+        indent = "\n" + _INDENT * level
+        has_children = False
+        for event, element in events:
+            if element is parent:
+                break
+            if element.getparent() is not parent:
+                # Part of a child, which is copied once it has all been parsed
+                continue
+
+            if event == "start":
+                if element.tag == "widget" and element.get("type") == "group":
+                    xf.write(indent)
+                    with xf.element(element.tag, element.attrib):
+                        self._stream_children(
+                            xf, events, element, level + 1, last_positions, positions
+                        )
+                    parent.remove(element)
+                    has_children = True
+                continue
+
+            if element.tag == "widget" and element.get("type") in (
+                "action_button",
+                "symbol",
+            ):
+                name = element.findtext("name")
+                assert name
+                # Only the last widget with a name, as autofill_bob fills
+                if next(positions) == last_positions[name]:
+                    self._autofill_widget(element, name)
+
+            xf.write(indent)
+            _indent(element, level)
+            xf.write(element, with_tail=False)
+            # Done with it, so only the widget being parsed is held in memory,
+            # other than the name errors about the parent's widgets give
+            if element.tag != "name":
+                parent.remove(element)
+            has_children = True
+
+        if has_children:
+            xf.write(indent.removesuffix(_INDENT))
+
     def replace_content(
         self,
-        widget: ObjectifiedElement,
+        widget: etree._Element,
         component_name: str,
         component: Component,
     ):
+        # desc, file and macros all live in the action group, so find it once
+        action_group = (
+            _get_action_group(widget)
+            if not _ACTION_GROUP_MACROS.isdisjoint(self.macros)
+            else None
+        )
+
         for macro in self.macros:
             # Fix to make sure widget is reverted back to widget that was passed in
             current_widget = widget
@@ -85,7 +279,7 @@ class Autofiller:
                     # Get current component attribute
                     component_attr = getattr(component, macro, None)
 
-                    current_widget = _get_action_group(widget)
+                    current_widget = action_group
                     match macro:
                         case "desc":
                             tag_name = "description"
@@ -113,8 +307,9 @@ class Autofiller:
 
                             assert current_widget is not None
                             # Remove all existing macros if they exist
-                            if hasattr(current_widget, "macros"):
-                                current_widget.remove(current_widget.macros)
+                            existing_macros = current_widget.find("macros")
+                            if existing_macros is not None:
+                                current_widget.remove(existing_macros)
                             # Create new macros element
                             current_widget.append(
                                 self._create_macro_element(component_attr)
@@ -133,18 +328,11 @@ class Autofiller:
                 continue
 
             # Set component's tag text to the corresponding widget tag
-            current_widget[tag_name] = component_attr
+            _set_child_text(current_widget, tag_name, str(component_attr))
 
-    def _create_macro_element(self, macros: dict):
-        # You cannot set a text tag of an ObjectifiedElement,
-        # so we need to make an etree.Element and convert it ...
-
-        macros_element = Element("macros")
+    def _create_macro_element(self, macros: dict) -> etree._Element:
+        macros_element = etree.Element("macros")
         for macro, val in macros.items():
-            macro_element = SubElement(macros_element, macro)
-            macro_element.text = str(val)
-
-        # ... which requires this horror
-        obj_macros_element = fromstring(tostring(macros_element))
+            etree.SubElement(macros_element, macro).text = str(val)
 
-        return obj_macros_element
+        return macros_element
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from techui_builder.models import Component, Entity, TechUiSupport
+
+logger_ = logging.getLogger(__name__)
+
+# Build manifest written to the synoptic dir
+CACHE_FILE = ".techui-cache.json"
+
+
+def component_digest(
+    component: Component,
+    entities: list[Entity],
+    techui_support: TechUiSupport,
+    support_path: Path,
+    settings: dict[str, Any],
+) -> str:
+    """
+    Hash everything that goes into generating a component's screen: the
+    component itself, its matched entities, the support mappings for those
+    entities and the mtimes of the support screens they use
+    """
+    support_types = sorted({entity.type for entity in entities})
+    support_modules = {
+        support_type: techui_support.support_modules[support_type].model_dump(
+            mode="json"
+        )
+        for support_type in support_types
+        if support_type in techui_support.support_modules
+    }
+
+    support_screens: dict[str, int | None] = {}
+    for support_module in support_modules.values():
+        for screen in support_module["screens"]:
+            file = screen.get("file")
+            # Remote screens are never read, so cannot affect the output
+            if file is None or file.startswith("$(IOC)"):
+                continue
+            screen_path = support_path.joinpath(f"bob/{file}")
+            support_screens[file] = (
+                screen_path.stat().st_mtime_ns if screen_path.exists() else None
+            )
+
+    inputs = {
+        "component": component.model_dump(mode="json"),
+        "entities": [entity.model_dump(mode="json") for entity in entities],
+        "support_modules": support_modules,
+        "support_screens": support_screens,
+        "settings": settings,
+    }
+    return hashlib.sha256(
+        json.dumps(inputs, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+@dataclass
+class BuildCache:
+    """
+    Manifest of the input hash of every screen generated by the last build,
+    so that unchanged screens do not have to be generated again
+    """
+
+    path: Path
+    previous: dict[str, str] = field(default_factory=dict, init=False, repr=False)
+    current: dict[str, str] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        if not self.path.exists():
+            return
+
+        try:
+            self.previous = json.loads(self.path.read_text(encoding="utf-8"))
+        except ValueError as e:
+            logger_.warning(f"Ignoring unreadable build cache {self.path}: {e}")
+
+    def is_fresh(self, screen_name: str, digest: str, screen: Path) -> bool:
+        """Was the screen generated from the same inputs, and is it still there?"""
+        return self.previous.get(screen_name) == digest and screen.exists()
+
+    def record(self, screen_name: str, digest: str):
+        self.current[screen_name] = digest
+
+    def save(self):
+        self.path.write_text(
+            json.dumps(self.current, indent=2, sort_keys=True) + "\n",
+            encoding="utf-8",
+        )
+        logger_.debug(f"Build cache written to {self.path}")
@@ -2,18 +2,42 @@ import logging
 import os
 import re
 from collections import defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass, field
 from pathlib import Path
 
-import yaml
 from jinja2 import Template
 
-from techui_builder.generate import Generator
+from techui_builder._version import __version__
+from techui_builder._yaml import safe_load
+from techui_builder.build_cache import CACHE_FILE, BuildCache, component_digest
+from techui_builder.generate import (
+    DIMENSION_CACHE_FILE,
+    Generator,
+    ScreenBuild,
+    generate_screen_in_worker,
+    init_screen_worker,
+    merge_screen_dimensions,
+)
 from techui_builder.models import Entity, SupportEntity, TechUi, TechUiSupport
 from techui_builder.validator import Validator
 
 logger_ = logging.getLogger(__name__)
 
+# Parsed techui-support.yaml files and the st_mtime_ns they were parsed at,
+# shared by every beamline built in this process from the same techui-support
+_techui_supports: dict[Path, tuple[int, TechUiSupport]] = {}
+
+# Keys of the entity tables in a service's ioc.yaml or fastcs.yaml
+_ENTITY_KEYS_RE = re.compile(r"^(?:(entities)|(controllers))$")
+
+
+def _load_service_yaml(service_yaml: Path) -> dict[str, list[dict[str, str]]]:
+    """Parse a service's ioc.yaml or fastcs.yaml (run in a worker process)"""
+    with open(service_yaml) as ioc:
+        return safe_load(ioc)
+
 
 @dataclass
 class Builder:
@@ -29,17 +53,43 @@ class Builder:
     """
 
     techui: Path = field(default=Path("techui.yaml"))
+    # Keep an on-disk cache of support screen dimensions in techui-support/
+    dimension_cache: bool = field(default=False)
+    # Strategy used to lay out the widgets in each component group
+    layout: str = field(default="shelf")
+    # Backend used to build the screens, phoebusgen or lxml (same output)
+    backend: str = field(default="phoebusgen")
+    # Number of worker processes used to parse service YAML (1 is sequential)
+    load_workers: int = field(default=1)
+    # Only regenerate screens whose inputs changed since the last build
+    incremental: bool = field(default=False)
+    # Number of worker processes used to generate screens (1 is sequential)
+    jobs: int = field(default=1)
 
     entities: defaultdict[str, list[Entity]] = field(
         default_factory=lambda: defaultdict(list), init=False
     )
+    build_cache: BuildCache | None = field(default=None, init=False, repr=False)
+    # Parsed service YAML and the st_mtime_ns it was parsed at, so that
+    # re-extracting services (e.g. in watch mode) only parses changed files
+    _service_confs: dict[Path, tuple[int, dict]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    # Compiled prefix template and macro names of each support module type in
+    # the loaded techui-support.yaml, as the same few repeat for every entity
+    _prefix_templates: dict[str, tuple[Template, frozenset[str]]] = field(
+        default_factory=dict, init=False, repr=False
+    )
     _services_dir: Path = field(init=False, repr=False)
     _write_directory: Path = field(init=False, repr=False)
 
     def __post_init__(self):
+        self._read_conf()
+
+    def _read_conf(self):
         # Populate beamline and components
         self.conf = TechUi.model_validate(
-            yaml.safe_load(self.techui.read_text(encoding="utf-8"))
+            safe_load(self.techui.read_text(encoding="utf-8"))
         )
 
     def setup(self):
@@ -54,6 +104,12 @@ class Builder:
 
         self._extract_services()
 
+        self.build_cache = (
+            BuildCache(self._write_directory.joinpath(CACHE_FILE))
+            if self.incremental
+            else None
+        )
+
         self.clean_files()
 
         self.generator = Generator(
@@ -61,6 +117,13 @@ class Builder:
             self.conf.beamline.url,
             self.support_path,
             self.techui_support,
+            dimension_cache=(
+                self.support_path.joinpath(DIMENSION_CACHE_FILE)
+                if self.dimension_cache
+                else None
+            ),
+            layout=self.layout,
+            backend=self.backend,
         )
 
     def _read_map(self):
@@ -68,9 +131,20 @@ class Builder:
         support_yaml = self.support_path.joinpath("techui-support.yaml").absolute()
         logger_.debug(f"techui-support.yaml location: {support_yaml}")
 
+        self._prefix_templates.clear()
+
+        mtime_ns = support_yaml.stat().st_mtime_ns
+        key = support_yaml.resolve()
+        cached = _techui_supports.get(key)
+        if cached is not None and cached[0] == mtime_ns:
+            logger_.debug("Reusing techui-support.yaml parsed for another beamline")
+            self.techui_support = cached[1]
+            return
+
         self.techui_support = TechUiSupport.model_validate(
-            yaml.safe_load(support_yaml.read_text(encoding="utf-8"))
+            safe_load(support_yaml.read_text(encoding="utf-8"))
         )
+        _techui_supports[key] = (mtime_ns, self.techui_support)
 
     def clean_files(self):
         exclude = {"index.bob"}
@@ -89,6 +163,10 @@ class Builder:
         logger_.info("Preserving edited screens for validation.")
         logger_.debug(f"Screens to validate: {list(self.validator.validate.keys())}")
 
+        if self.build_cache is not None:
+            # Generated screens are only removed once they are known to be stale
+            return
+
         logger_.info("Cleaning synoptic directory of generated screens.")
 
         generated_files = self.generated_bobs
@@ -98,98 +176,197 @@ class Builder:
             logger_.debug(f"Removing generated file: {file_.name}")
             os.remove(file_)
 
+        # Every screen is regenerated, so the manifest of an earlier incremental
+        # build would no longer describe the screens on disk
+        self._write_directory.joinpath(CACHE_FILE).unlink(missing_ok=True)
+
+    def _find_service_yaml(self, service: Path) -> Path:
+        """
+        Finds the ioc.yaml or fastcs.yaml of a service, raising an OSError if
+        there is neither and an AssertionError if there are both
+        """
+        service_yaml_dir = service.joinpath("config")
+
+        yaml_matches = [
+            p
+            for name in ("ioc.yaml", "fastcs.yaml")
+            if (p := service_yaml_dir / name).exists()
+        ]
+        assert len(yaml_matches) <= 1
+
+        if not yaml_matches:
+            raise OSError()
+
+        return yaml_matches[0]
+
     def _extract_services(self):
         """
         Finds the services folders in the services directory
         and extracts all entites
         """
+        services: list[tuple[str, Path]] = []
 
         # Loop over every dir in services, ignoring anything that isn't a service
         for service in self._services_dir.glob(f"{self.conf.beamline.location}-*-*-*"):
-            service_name = service.name
             # If service doesn't exist, file open will fail throwing exception
             try:
-                service_yaml_dir = service.joinpath("config")
-
-                yaml_matches = [
-                    p
-                    for name in ("ioc.yaml", "fastcs.yaml")
-                    if (p := service_yaml_dir / name).exists()
-                ]
-                assert len(yaml_matches) <= 1
-                service_yaml = yaml_matches[0] if yaml_matches else None
-
-                if service_yaml is None:
-                    raise OSError()
-
-                self._extract_entities(
-                    service_name=service_name,
-                    service_yaml=service_yaml,
-                )
-
+                services.append((service.name, self._find_service_yaml(service)))
             except OSError:
-                logger_.error(
-                    "No ioc.yaml or fastcs.yaml found for service: "
-                    f"[bold]{service_name}[/bold]. Does it exist?"
-                )
+                self._log_missing_service(service.name)
             except AssertionError:
                 logger_.critical(
-                    f"Both ioc.yaml and fastcs.yaml found for {service_name}"
+                    f"Both ioc.yaml and fastcs.yaml found for {service.name}"
                 )
                 exit()
 
+        if self.load_workers > 1:
+            logger_.debug(
+                f"Loading {len(services)} services with {self.load_workers} workers"
+            )
+            with ProcessPoolExecutor(max_workers=self.load_workers) as pool:
+                # Each service is looked up in the cache once, as it could
+                # change between two lookups
+                confs: list[dict | Future[dict]] = []
+                for _, service_yaml in services:
+                    try:
+                        ioc_conf = self._cached_service_conf(service_yaml)
+                    except OSError:
+                        # Loading it reports it missing
+                        ioc_conf = None
+                    confs.append(
+                        pool.submit(_load_service_yaml, service_yaml)
+                        if ioc_conf is None
+                        else ioc_conf
+                    )
+
+                # Results are collected in submission order, so entities are
+                # merged in the same order as a sequential load
+                for (service_name, service_yaml), conf in zip(
+                    services, confs, strict=True
+                ):
+                    try:
+                        if isinstance(conf, Future):
+                            ioc_conf = conf.result()
+                            self._cache_service_conf(service_yaml, ioc_conf)
+                        else:
+                            ioc_conf = conf
+                        self._add_entities(service_name, ioc_conf)
+                    except OSError:
+                        self._log_missing_service(service_name)
+        else:
+            for service_name, service_yaml in services:
+                try:
+                    self._extract_entities(
+                        service_name=service_name,
+                        service_yaml=service_yaml,
+                    )
+                except OSError:
+                    self._log_missing_service(service_name)
+
+    def _log_missing_service(self, service_name: str):
+        logger_.error(
+            "No ioc.yaml or fastcs.yaml found for service: "
+            f"[bold]{service_name}[/bold]. Does it exist?"
+        )
+
     def _extract_entities(self, service_name: str, service_yaml: Path):
         """
         Extracts the entries in ioc.yaml matching the defined prefix
         """
+        ioc_conf = self._cached_service_conf(service_yaml)
+        if ioc_conf is None:
+            ioc_conf = _load_service_yaml(service_yaml)
+            self._cache_service_conf(service_yaml, ioc_conf)
+
+        self._add_entities(service_name, ioc_conf)
+
+    def _cached_service_conf(self, service_yaml: Path) -> dict | None:
+        """Parsed service YAML, if it has not changed since it was parsed"""
+        cached = self._service_confs.get(service_yaml)
+        if cached is not None and cached[0] == service_yaml.stat().st_mtime_ns:
+            return cached[1]
+        return None
+
+    def _cache_service_conf(self, service_yaml: Path, ioc_conf: dict):
+        self._service_confs[service_yaml] = (service_yaml.stat().st_mtime_ns, ioc_conf)
+
+    def _add_entities(
+        self, service_name: str, ioc_conf: dict[str, list[dict[str, str]]]
+    ):
+        """
+        Adds the entities of a parsed ioc.yaml or fastcs.yaml to the entity list
+        """
+        for key in ioc_conf.keys():
+            match = _ENTITY_KEYS_RE.match(key)
+            if match:
+                entity_key = match.group()
+
+                for entity in ioc_conf[entity_key]:
+                    if entity["type"] in self.techui_support.support_modules:
+                        prefix_template, support_macros = self._prefix_template(
+                            entity["type"]
+                        )
+
+                        macros = {
+                            k: v for k, v in entity.items() if k in support_macros
+                        }
+
+                        prefix: str = prefix_template.render(macros)
+
+                        # Create Entity and append to entity list
+                        new_entity = Entity(
+                            service_name=service_name,
+                            type=entity["type"],
+                            desc=entity.get("desc", None),
+                            prefix=prefix,
+                            macros=macros,
+                        )
+
+                        pv_root = prefix.split(":", maxsplit=1)[0]
+                        self.entities[pv_root].append(new_entity)
+                break
+
+    def _prefix_template(self, entity_type: str) -> tuple[Template, frozenset[str]]:
+        """The compiled prefix template and macro names of a support module type"""
+        cached = self._prefix_templates.get(entity_type)
+        if cached is None:
+            support_mapping: SupportEntity = self.techui_support.support_modules[
+                entity_type
+            ]
+            cached = (
+                Template(support_mapping.prefix),
+                frozenset(support_mapping.macros),
+            )
+            self._prefix_templates[entity_type] = cached
+        return cached
 
-        with open(service_yaml) as ioc:
-            ioc_conf: dict[str, list[dict[str, str]]] = yaml.safe_load(ioc)
-
-            for key in ioc_conf.keys():
-                _regex = re.compile(r"^(?:(entities)|(controllers))$")
-                match = _regex.match(key)
-                if match:
-                    entity_key = match.group()
-
-                    for entity in ioc_conf[entity_key]:
-                        if entity["type"] in self.techui_support.support_modules:
-                            support_mapping: SupportEntity = (
-                                self.techui_support.support_modules[entity["type"]]
-                            )
-                            support_macros = support_mapping.macros
-
-                            macros = {
-                                k: v for k, v in entity.items() if k in support_macros
-                            }
-
-                            prefix_template = Template(support_mapping.prefix)
-                            prefix: str = prefix_template.render(macros)
-
-                            # Create Entity and append to entity list
-                            new_entity = Entity(
-                                service_name=service_name,
-                                type=entity["type"],
-                                desc=entity.get("desc", None),
-                                prefix=prefix,
-                                macros=macros,
-                            )
-
-                            pv_root = prefix.split(":", maxsplit=1)[0]
-                            self.entities[pv_root].append(new_entity)
-                    break
-
-    def _generate_screen(self, screen_name: str):
-        self.generator.build_screen(screen_name)
-        self.generator.write_screen(screen_name, self._write_directory)
+    def _generate_screen(self, screen: ScreenBuild) -> bool:
+        self.generator.build_screen(screen)
+        return self.generator.write_screen(screen, self._write_directory)
 
-    def _validate_screen(self, screen_name: str):
+    def _validate_screen(self, screen: ScreenBuild):
         # Get the generated widgets to validate against
-        widgets = self.generator.widgets
-        widget_group = self.generator.group
+        widgets = screen.widgets
+        widget_group = screen.group
         assert widget_group is not None
         widget_group_name = widget_group.get_element_value("name")
-        self.validator.validate_bob(screen_name, widget_group_name, widgets)
+        self.validator.validate_bob(screen.name, widget_group_name, widgets)
+
+    def _screen_pool(self) -> ProcessPoolExecutor | nullcontext[None]:
+        if self.jobs <= 1:
+            return nullcontext()
+
+        logger_.debug(f"Generating screens with {self.jobs} workers")
+        return ProcessPoolExecutor(
+            max_workers=self.jobs,
+            initializer=init_screen_worker,
+            initargs=(self.generator,),
+        )
+
+    def _record_screen(self, screen_name: str, digest: str | None, written: bool):
+        # Screens without widgets are not written, so cannot be reused
+        if self.build_cache is not None and digest is not None and written:
+            self.build_cache.record(screen_name, digest)
 
     def create_screens(self):
         """Create the screens for each component in techui.yaml"""
@@ -200,13 +377,24 @@ class Builder:
             )
             exit()
 
-        # Loop over every component defined in techui.yaml and locate
-        # any extras defined
-        for component_name, component in self.conf.components.items():
-            screen_entities: list[Entity] = []
+        with self._screen_pool() as pool:
+            # Screens being generated by the pool, in component order
+            pending: list[tuple[str, str | None, Future]] = []
+
+            # Loop over every component defined in techui.yaml and locate
+            # any extras defined
+            for component_name, component in self.conf.components.items():
+                screen_entities: list[Entity] = []
+
+                # ONLY IF there is a matching component and entity, generate a screen
+                if component.prefix not in self.entities.keys():
+                    logger_.warning(
+                        f"{self.techui.name}: The prefix [bold]{component.prefix}"
+                        f"[/bold] set in the component [bold]{component_name}[/bold]"
+                        " does not match any P field in the ioc.yaml files in services"
+                    )
+                    continue
 
-            # ONLY IF there is a matching component and entity, generate a screen
-            if component.prefix in self.entities.keys():
                 # Populate child labels for any entities
                 # with the same prefix as the component
                 for entity in self.entities[component.prefix]:
@@ -225,21 +413,121 @@ class Builder:
                             continue
                         screen_entities.extend(self.entities[extra_p])
 
-                # This is used by both generate and validate,
-                # so called beforehand for tidyness
-                self.generator.build_widgets(component_name, screen_entities)
-                self.generator.build_groups(component_name, self.conf.components)
-
                 screens_to_validate = list(self.validator.validate.keys())
 
                 if component_name in screens_to_validate:
-                    self._validate_screen(component_name)
+                    screen = self.generator.build_widgets(
+                        component_name, screen_entities
+                    )
+                    self.generator.build_groups(screen, self.conf.components)
+                    self._validate_screen(screen)
+                    continue
+
+                digest = None
+                if self.build_cache is not None:
+                    digest = component_digest(
+                        component,
+                        screen_entities,
+                        self.techui_support,
+                        self.support_path,
+                        self._build_settings(),
+                    )
+                    screen_file = self._write_directory.joinpath(
+                        f"{component_name}.bob"
+                    )
+                    if self.build_cache.is_fresh(component_name, digest, screen_file):
+                        logger_.info(f"{component_name}.bob is up to date")
+                        self.build_cache.record(component_name, digest)
+                        continue
+
+                if pool is None:
+                    screen = self.generator.build_widgets(
+                        component_name, screen_entities
+                    )
+                    self.generator.build_groups(screen, self.conf.components)
+                    written = self._generate_screen(screen)
+                    self._record_screen(component_name, digest, written)
                 else:
-                    self._generate_screen(component_name)
+                    # Entities are copied as their child labels can be changed
+                    # by later components before the pool gets to send them
+                    future = pool.submit(
+                        generate_screen_in_worker,
+                        component_name,
+                        [entity.model_copy() for entity in screen_entities],
+                        self.conf.components,
+                        self._write_directory,
+                    )
+                    pending.append((component_name, digest, future))
+
+            for component_name, digest, future in pending:
+                written, dimensions = future.result()
+                merge_screen_dimensions(dimensions)
+                self._record_screen(component_name, digest, written)
+
+        self.generator.save_dimension_cache()
+
+        if self.build_cache is not None:
+            self._remove_stale_screens()
+            self.build_cache.save()
+
+    def watch_patterns(self) -> list[tuple[Path, str]]:
+        """The (directory, glob pattern) pairs of every file a build reads"""
+        return [
+            (self.techui.parent, self.techui.name),
+            (self._services_dir, f"{self.conf.beamline.location}-*-*-*/config/*.yaml"),
+            (self.support_path, "techui-support.yaml"),
+            (self.support_path, "bob/**/*.bob"),
+        ]
 
-            else:
-                logger_.warning(
-                    f"{self.techui.name}: The prefix [bold]{component.prefix}[/bold] "
-                    f"set in the component [bold]{component_name}[/bold] does not match"
-                    " any P field in the ioc.yaml files in services"
-                )
+    def refresh(self, changed: set[Path]):
+        """
+        Brings the builder up to date after some of the files it was built from
+        changed, regenerating only the screens whose inputs are now different
+        """
+        changed = {path.absolute() for path in changed}
+        logger_.debug(f"Changed files: {sorted(str(path) for path in changed)}")
+
+        reextract = False
+        if self.techui.absolute() in changed:
+            logger_.info(f"{self.techui.name} changed, reloading")
+            self._read_conf()
+            self.generator.beamline_url = self.conf.beamline.url
+            reextract = True
+
+        if self.support_path.joinpath("techui-support.yaml").absolute() in changed:
+            logger_.info("techui-support.yaml changed, reloading")
+            self._read_map()
+            self.generator.techui_support = self.techui_support
+            reextract = True
+
+        services_dir = self._services_dir.absolute()
+        if reextract or any(path.is_relative_to(services_dir) for path in changed):
+            # Unchanged service YAML is not parsed again
+            self.entities = defaultdict(list)
+            self._extract_services()
+
+        if self.build_cache is None:
+            self.build_cache = BuildCache(self._write_directory.joinpath(CACHE_FILE))
+        else:
+            # Compare against what the last build produced
+            self.build_cache.previous = self.build_cache.current
+            self.build_cache.current = {}
+
+        self.clean_files()
+        self.create_screens()
+
+    def _build_settings(self) -> dict[str, str]:
+        """Build settings that affect every generated screen"""
+        return {
+            "version": __version__,
+            "url": self.conf.beamline.url,
+            "layout": self.layout,
+        }
+
+    def _remove_stale_screens(self):
+        """Remove previously generated screens that this build did not produce"""
+        assert self.build_cache is not None
+        for file_ in self.generated_bobs:
+            if file_.stem not in self.build_cache.current and file_.exists():
+                logger_.debug(f"Removing stale generated file: {file_.name}")
+                os.remove(file_)
@@ -0,0 +1,175 @@
+"""
+An lxml emitter for .bob screens, as an alternative to phoebusgen.
+
+The widgets and screen build their lxml elements directly, and implement only
+the parts of the phoebusgen API that the generator, builder and validator use,
+with the same constructor arguments. Screens are written in exactly the same
+layout as phoebusgen's Screen.write_screen, without the round trip through
+ElementTree.tostring and minidom.
+"""
+
+from collections.abc import Mapping
+from pathlib import Path
+
+from lxml import etree
+
+# Names of the emitter backends, see generate.EMITTERS
+BACKENDS = ("phoebusgen", "lxml")
+
+
+def _sub_element(parent: etree._Element, tag: str, text: str) -> etree._Element:
+    element = etree.SubElement(parent, tag)
+    element.text = text
+    return element
+
+
+def _add_macros(parent: etree._Element, macros: Mapping[str, object]):
+    macros_element = parent.find("macros")
+    if macros_element is None:
+        macros_element = etree.SubElement(parent, "macros")
+    for name, val in macros.items():
+        _sub_element(macros_element, name, str(val))
+
+
+class _Widget:
+    """A <widget> element"""
+
+    def __init__(
+        self, widget_type: str, name: str, x: int, y: int, width: int, height: int
+    ):
+        self.root = etree.Element("widget", type=widget_type, version="2.0.0")
+        _sub_element(self.root, "name", name)
+        for tag, val in (("x", x), ("y", y), ("width", width), ("height", height)):
+            _sub_element(self.root, tag, str(int(val)))
+
+    def find_element(self, tag: str) -> etree._Element | None:
+        return self.root.find(tag)
+
+    def get_element_value(self, tag: str) -> str:
+        element = self.root.find(tag)
+        assert element is not None, f"No <{tag}> in widget"
+        return element.text or ""
+
+    def version(self, version: str):
+        self.root.set("version", version)
+
+    def _integer_property(self, tag: str, val: int):
+        # Like phoebusgen, setting a property moves it to the end of the widget
+        element = self.root.find(tag)
+        if element is None:
+            element = etree.Element(tag)
+        element.text = str(int(val))
+        self.root.append(element)
+
+    def x(self, val: int):
+        self._integer_property("x", val)
+
+    def y(self, val: int):
+        self._integer_property("y", val)
+
+    def __str__(self) -> str:
+        return etree.tostring(self.root, encoding="unicode", pretty_print=True)
+
+
+class EmbeddedDisplay(_Widget):
+    def __init__(self, name: str, file: str, x: int, y: int, width: int, height: int):
+        super().__init__("embedded", name, x, y, width, height)
+        _sub_element(self.root, "file", file)
+
+    def macro(self, name: str, val: str):
+        _add_macros(self.root, {name: val})
+
+
+class ActionButton(_Widget):
+    def __init__(
+        self,
+        name: str,
+        text: str,
+        pv_name: str,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+    ):
+        super().__init__("action_button", name, x, y, width, height)
+        # phoebusgen defaults action buttons to version 3.0.0
+        self.version("3.0.0")
+        _sub_element(self.root, "pv_name", pv_name)
+        _sub_element(self.root, "text", text)
+
+    def action_open_display(
+        self, file: str, target: str, macros: Mapping[str, str] | None = None
+    ):
+        actions = self.root.find("actions")
+        if actions is None:
+            actions = etree.SubElement(self.root, "actions")
+        action = etree.SubElement(actions, "action", type="open_display")
+        _sub_element(action, "description", "Open Display")
+        if macros:
+            _add_macros(action, macros)
+        _sub_element(action, "file", file)
+        _sub_element(action, "target", target.lower())
+
+
+class Group(_Widget):
+    def __init__(self, name: str, x: int, y: int, width: int, height: int):
+        super().__init__("group", name, x, y, width, height)
+        # phoebusgen defaults groups to version 3.0.0
+        self.version("3.0.0")
+
+    def add_widget(self, widgets: list[_Widget] | _Widget):
+        for widget in widgets if isinstance(widgets, list) else [widgets]:
+            self.root.append(widget.root)
+
+
+class Screen:
+    """A <display>, written like phoebusgen's Screen.write_screen"""
+
+    def __init__(self, name: str):
+        self.root = etree.Element("display", version="2.0.0")
+        _sub_element(self.root, "name", name)
+
+    def add_widget(self, widgets: list[_Widget] | _Widget):
+        for widget in widgets if isinstance(widgets, list) else [widgets]:
+            self.root.append(widget.root)
+
+    def write_screen(self, file_name: str | Path) -> bool:
+        with open(file_name, "w", encoding="utf-8") as f:
+            f.write(to_bob(self.root))
+        return True
+
+
+def _escape(text: str) -> str:
+    # The same characters minidom escapes, in text and attributes alike
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+def _write_element(out: list[str], element: etree._Element, indent: str):
+    out.append(f"{indent}<{element.tag}")
+    for name, val in element.attrib.items():
+        out.append(f' {name}="{_escape(str(val))}"')
+
+    if len(element) > 0:
+        out.append(">\n")
+        for child in element:
+            _write_element(out, child, indent + "  ")
+        out.append(f"{indent}</{element.tag}>\n")
+    elif element.text:
+        out.append(f">{_escape(element.text)}</{element.tag}>\n")
+    else:
+        out.append("/>\n")
+
+
+def to_bob(root: etree._Element) -> str:
+    """
+    Serialise a screen the way minidom's writexml does for phoebusgen, with
+    the document element indented one level and every text on one line
+    """
+    out = ['<?xml version="1.0" encoding="UTF-8"?>\n']
+    _write_element(out, root, "  ")
+    return "".join(out)
@@ -1,20 +1,170 @@
+import json
 import logging
 import os
 import re
-from collections import defaultdict
-from collections.abc import Mapping
+from collections.abc import Callable, Mapping
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any, NamedTuple
 
-from lxml import objectify
+from lxml import etree, objectify
 from phoebusgen import screen as pscreen
 from phoebusgen import widget as pwidget
 from phoebusgen.widget.widgets import ActionButton, EmbeddedDisplay, Group
 
+from techui_builder import emitter
+from techui_builder.layout import DEFAULT_SETTINGS, LAYOUT_STRATEGIES
 from techui_builder.models import Component, Entity, TechUiSupport
 
 logger_ = logging.getLogger(__name__)
 
+# Name of the optional on-disk dimension cache kept in techui-support/
+DIMENSION_CACHE_FILE = ".dimension-cache.json"
+
+# Process-wide cache of the (height, width) of support screens, keyed by resolved
+# path and st_mtime_ns so that an edited screen is always read again
+_screen_dimensions: dict[tuple[str, int], tuple[int | None, int | None]] = {}
+
+
+class Emitter(NamedTuple):
+    """The widget and screen classes used to build .bob files"""
+
+    embedded_display: Callable[..., Any]
+    action_button: Callable[..., Any]
+    group: Callable[..., Any]
+    screen: Callable[..., Any]
+
+
+# Emitter backends by name: phoebusgen, or building the lxml elements directly
+EMITTERS: dict[str, Emitter] = {
+    "phoebusgen": Emitter(
+        pwidget.EmbeddedDisplay, pwidget.ActionButton, Group, pscreen.Screen
+    ),
+    "lxml": Emitter(
+        emitter.EmbeddedDisplay, emitter.ActionButton, emitter.Group, emitter.Screen
+    ),
+}
+
+# A widget built by either emitter backend
+Widget = EmbeddedDisplay | ActionButton | emitter.EmbeddedDisplay | emitter.ActionButton
+
+
+def read_screen_dimensions(file: str | Path) -> tuple[int | None, int | None]:
+    """
+    Streams the top level <height> and <width> of a bob file,
+    stopping as soon as both have been found
+    """
+    height = width = None
+    found: set[str] = set()
+    depth = 0
+
+    # Opened here so the file is closed even if we stop parsing early
+    with open(file, "rb") as f:
+        for event, element in etree.iterparse(f, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                continue
+
+            depth -= 1
+            # Only the children of <display> describe the screen itself
+            if depth != 1:
+                continue
+
+            match element.tag:
+                case "height" if "height" not in found:
+                    height = None if (val := element.text) is None else int(val)
+                    found.add("height")
+                case "width" if "width" not in found:
+                    width = None if (val := element.text) is None else int(val)
+                    found.add("width")
+
+            if len(found) == 2:
+                break
+
+            # Free the subtree we have just finished with
+            element.clear()
+
+    return (height, width)
+
+
+def load_dimension_cache(cache_file: Path):
+    """Populate the process-wide dimension cache from an on-disk sidecar"""
+    if not cache_file.exists():
+        return
+
+    try:
+        entries: dict[str, list] = json.loads(cache_file.read_text(encoding="utf-8"))
+        for path, (mtime_ns, height, width) in entries.items():
+            _screen_dimensions[(path, mtime_ns)] = (height, width)
+    except (ValueError, TypeError) as e:
+        logger_.warning(f"Ignoring unreadable dimension cache {cache_file}: {e}")
+
+
+def save_dimension_cache(cache_file: Path):
+    """
+    Write the entries of the process-wide dimension cache that
+    belong to the sidecar's directory to disk, for the screens as they are now
+    """
+    support_dir = cache_file.parent.resolve()
+    mtimes: dict[str, int | None] = {}
+    entries: dict[str, list] = {}
+    for (path, mtime_ns), (height, width) in _screen_dimensions.items():
+        if not Path(path).is_relative_to(support_dir):
+            continue
+        if path not in mtimes:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                mtimes[path] = None
+        # Entries for earlier versions of edited screens, or for deleted
+        # screens, would otherwise be kept forever
+        if mtime_ns == mtimes[path]:
+            entries[path] = [mtime_ns, height, width]
+    # Replaced in one step, as beamlines sharing a techui-support may be built
+    # in parallel (build-all)
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(json.dumps(entries, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp_file, cache_file)
+    logger_.debug(f"Dimension cache written to {cache_file}")
+
+
+def merge_screen_dimensions(
+    dimensions: Mapping[tuple[str, int], tuple[int | None, int | None]],
+):
+    """Add dimensions read by another process to the process-wide cache"""
+    _screen_dimensions.update(dimensions)
+
+
+@dataclass
+class WidgetGeometry:
+    """Position and size of a generated widget, kept alongside the widget itself"""
+
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+@dataclass
+class ScreenBuild:
+    """
+    Everything built for one component screen, so that screens can be built
+    independently of each other (and in other processes)
+    """
+
+    name: str
+    widgets: list[Widget] = field(default_factory=list)
+    group: Group | emitter.Group | None = field(default=None)
+    screen_: pscreen.Screen | emitter.Screen | None = field(default=None, repr=False)
+    # Each widget created for the screen with its geometry, in the order of
+    # widgets, so layout never has to serialise and re-parse the phoebusgen XML
+    # to find out where a widget is
+    geometry: list[tuple[Widget, WidgetGeometry]] = field(
+        default_factory=list, repr=False
+    )
+    # Set when a child label has been used as the name of a widget
+    label_flag: bool = field(default=False, repr=False)
+
 
 @dataclass
 class Generator:
@@ -26,10 +176,6 @@ class Generator:
     techui_support: TechUiSupport = field(repr=False)
     default_size: int = field(default=100, init=False, repr=False)
     prefix: str = field(default="P", init=False, repr=False)
-    widgets: list[ActionButton | EmbeddedDisplay] = field(
-        default_factory=list[ActionButton | EmbeddedDisplay], init=False, repr=False
-    )
-    group: Group | None = field(default=None, init=False, repr=False)
 
     # Add group padding, and self.widget_x for placing widget in x direction relative to
     # other widgets, with a widget count to reset the self.widget_x dimension when the
@@ -37,39 +183,46 @@ class Generator:
     widget_x: int = field(default=0, init=False, repr=False)
     widget_count: int = field(default=0, init=False, repr=False)
     group_padding: int = field(default=50, init=False, repr=False)
-    label_flag: bool = field(default=False, init=False, repr=False)
+
+    # Optional on-disk sidecar for the support screen dimension cache
+    dimension_cache: Path | None = field(default=None, repr=False)
+    # Name of the strategy in LAYOUT_STRATEGIES used to place widgets in a group
+    layout: str = field(default="shelf", repr=False)
+    # Name of the backend in EMITTERS used to build the widgets and screens
+    backend: str = field(default="phoebusgen", repr=False)
+
+    def __post_init__(self):
+        if self.dimension_cache is not None:
+            load_dimension_cache(self.dimension_cache)
+
+    def save_dimension_cache(self):
+        """Write the dimension cache sidecar, if one is being used"""
+        if self.dimension_cache is not None:
+            save_dimension_cache(self.dimension_cache)
 
     def _get_screen_dimensions(self, file: str) -> tuple[int, int]:
         """
-        Parses the bob files for information on the height
-        and width of the screen
+        Gets the height and width of a screen, only reading
+        the bob file if it is new or has changed since it was last read
         """
-        # Read the bob file
-        tree = objectify.parse(file)
-        root = tree.getroot()
-        try:
-            height_element = root.height
-            height = (
-                self.default_size if (val := height_element.text) is None else int(val)
-            )
-        except AttributeError:
-            height = self.default_size
-            assert "Could not obtain the height of the widget"
+        path = Path(file).resolve()
+        key = (str(path), path.stat().st_mtime_ns)
 
-        try:
-            width_element = root.width
-            width = (
-                self.default_size if (val := width_element.text) is None else int(val)
-            )
-        except AttributeError:
+        dimensions = _screen_dimensions.get(key)
+        if dimensions is None:
+            dimensions = _screen_dimensions[key] = read_screen_dimensions(path)
+
+        height, width = dimensions
+        if height is None:
+            logger_.debug(f"Could not obtain the height of {file}, using default")
+            height = self.default_size
+        if width is None:
+            logger_.debug(f"Could not obtain the width of {file}, using default")
             width = self.default_size
-            assert "Could not obtain the width of the widget"
 
         return (height, width)
 
-    def _get_widget_dimensions(
-        self, widget: EmbeddedDisplay | ActionButton
-    ) -> tuple[int, int]:
+    def _get_widget_dimensions(self, widget: Widget) -> tuple[int, int]:
         """
         Parses the widget for information on the height
         and width of the widget
@@ -96,9 +249,7 @@ class Generator:
 
         return (height, width)
 
-    def _get_widget_position(
-        self, object: EmbeddedDisplay | ActionButton
-    ) -> tuple[int, int]:
+    def _get_widget_position(self, object: Widget) -> tuple[int, int]:
         """
         Parses the widget for information on the y
         and x of the widget
@@ -122,19 +273,37 @@ class Generator:
 
         return (y, x)
 
+    def _with_geometry(
+        self, widgets: list[Widget], screen: ScreenBuild
+    ) -> list[tuple[Widget, WidgetGeometry]]:
+        """
+        Pairs each widget with its geometry, only parsing the widget XML if
+        the widgets are not the ones created for this screen
+        """
+        if len(widgets) == len(screen.geometry) and all(
+            widget is recorded
+            for widget, (recorded, _) in zip(widgets, screen.geometry, strict=True)
+        ):
+            return list(screen.geometry)
+
+        placed: list[tuple[Widget, WidgetGeometry]] = []
+        for widget in widgets:
+            y, x = self._get_widget_position(widget)
+            height, width = self._get_widget_dimensions(widget)
+            placed.append((widget, WidgetGeometry(x, y, width, height)))
+        return placed
+
     # Make groups
-    def _get_group_dimensions(self, widget_list: list[EmbeddedDisplay | ActionButton]):
+    def _get_group_dimensions(self, widget_list: list[Widget], screen: ScreenBuild):
         """
         Takes in a list of widgets and finds the
         maximum height and maximum width in the list
         """
         width_list: list[int] = []
         height_list: list[int] = []
-        for widget in widget_list:
-            y, x = self._get_widget_position(widget)
-            height, width = self._get_widget_dimensions(widget)
-            comparable_width = x + width
-            comparable_height = y + height
+        for _, geometry in self._with_geometry(widget_list, screen):
+            comparable_width = geometry.x + geometry.width
+            comparable_height = geometry.y + geometry.height
             width_list.append(comparable_width)
             height_list.append(comparable_height)
 
@@ -143,7 +312,9 @@ class Generator:
             max(width_list) + self.group_padding,
         )
 
-    def _update_macros(self, component: Entity) -> tuple[str, dict[str, str]]:
+    def _update_macros(
+        self, component: Entity, screen: ScreenBuild
+    ) -> tuple[str, dict[str, str]]:
         # try statement below is check if the suffix is part of the component prefix.
         # If not missing, use as name of widget. If missing, use type as name.
 
@@ -167,7 +338,7 @@ class Generator:
         if component.child_labels is not None:
             if component_name in component.child_labels.keys():
                 component_name = component.child_labels[component_name]
-                self.label_flag = True
+                screen.label_flag = True
 
         prefix_key = next(k for k, v in component.macros.items() if v == prefix)
 
@@ -179,9 +350,9 @@ class Generator:
         return component_name, new_macros
 
     def _allocate_widget(
-        self, screen_mapping: Mapping, component: Entity
-    ) -> EmbeddedDisplay | ActionButton | None | list[EmbeddedDisplay | ActionButton]:
-        component_name, updated_macros = self._update_macros(component)
+        self, screen_mapping: Mapping, component: Entity, screen: ScreenBuild
+    ) -> Widget | None | list[Widget]:
+        component_name, updated_macros = self._update_macros(component, screen)
 
         # Get relative path to screen
         file = screen_mapping["file"]
@@ -212,7 +383,7 @@ class Generator:
                     updated_macros[suffix_key] = suffix
 
                 # If no child label was specified...
-                if self.label_flag is False:
+                if screen.label_flag is False:
                     # TODO: think of a better fallback component name for this
                     component_name = (
                         list(suffix_dict.values())[0]
@@ -225,7 +396,7 @@ class Generator:
 
         if screen_mapping["type"] == "embedded":
             height, width = self._get_screen_dimensions(str(screen_path))
-            new_widget = pwidget.EmbeddedDisplay(
+            new_widget = EMITTERS[self.backend].embedded_display(
                 component_name,
                 str(support_screen_path),
                 0,
@@ -245,7 +416,7 @@ class Generator:
         else:
             height, width = (40, 100)
 
-            new_widget = pwidget.ActionButton(
+            new_widget = EMITTERS[self.backend].action_button(
                 component_name,
                 component_name,
                 "",
@@ -263,12 +434,14 @@ class Generator:
 
             # For some reason the version of action buttons is 3.0.0?
             new_widget.version("2.0.0")
-            self.label_flag = False
+            screen.label_flag = False
+
+        screen.geometry.append((new_widget, WidgetGeometry(0, 0, width, height)))
         return new_widget
 
     def _create_widgets(
-        self, name: str, component: Entity
-    ) -> list[EmbeddedDisplay | ActionButton] | None:
+        self, name: str, component: Entity, screen: ScreenBuild
+    ) -> list[Widget] | None:
         new_widget = []
 
         try:
@@ -281,109 +454,72 @@ class Generator:
             return None
 
         for screen_dict in screen_mapping:
-            new_widget.append(self._allocate_widget(screen_dict, component))
+            new_widget.append(self._allocate_widget(screen_dict, component, screen))
 
         return new_widget
 
-    def layout_widgets(self, widgets: list[EmbeddedDisplay | ActionButton]):
-        group_spacing: int = 30
-        max_group_height: int = 800
-        spacing_x: int = 20
-        spacing_y: int = 30
-        # Group tiles by size
-        groups: dict[tuple[int, int], list[EmbeddedDisplay | ActionButton]] = (
-            defaultdict(list)
+    def layout_widgets(self, widgets: list[Widget], screen: ScreenBuild):
+        placed = self._with_geometry(widgets, screen)
+        layout_strategy = LAYOUT_STRATEGIES[self.layout]
+        placements = layout_strategy(
+            [(geometry.width, geometry.height) for _, geometry in placed],
+            DEFAULT_SETTINGS,
         )
-        for widget in widgets:
-            key = self._get_widget_dimensions(widget)
-
-            groups[key].append(widget)
-
-        # Sort groups by width (optional)
-        sorted_widgets: list[EmbeddedDisplay | ActionButton] = []
-        sorted_groups = sorted(groups.items(), key=lambda g: g[0][0], reverse=True)
-        current_x: int = 0
-        current_y: int = 0
-        column_width: int = 0
-        column_levels: list[list[EmbeddedDisplay | ActionButton]] = []
-
-        for (h, w), group in sorted_groups:
-            for widget in group:
-                placed = False
-                for level in column_levels:
-                    level_y, _ = self._get_widget_position(level[0])
-                    _, widget_width = self._get_widget_dimensions(widget)
-                    level_width = (
-                        sum(
-                            (self._get_widget_dimensions(t))[1] + spacing_x
-                            for t in level
-                        )
-                        - spacing_x
-                    )  # Find the width of the row
-                    if (
-                        level_y + h <= max_group_height
-                        and level_width + widget_width <= column_width
-                    ):
-                        _, width_1 = self._get_widget_dimensions(level[-1])
-                        _, x_1 = self._get_widget_position(level[-1])
-                        widget.x(x_1 + width_1 + spacing_x)
-                        widget.y(level_y)
-                        level.append(widget)
-                        placed = True
-                        break
-
-                if not placed:
-                    if current_y + h > max_group_height:
-                        # Moves to the next column
-                        current_x += column_width + group_spacing
-                        current_y = 0
-                        column_width = 0
-                        column_levels = []
-                    # Places widgets in rows in one column
-                    widget.x(current_x)
-                    widget.y(current_y)
-                    column_levels.append([widget])
-                    current_y += h + spacing_y
-                    column_width = max(column_width, w)
-                sorted_widgets.append(widget)
-
-        return sorted_widgets
-
-    def build_widgets(self, screen_name: str, screen_entities: list[Entity]):
-        # Empty widget buffer
-        self.widgets = []
+
+        # Kept in the order of the widgets returned, with the geometry in sync
+        screen.geometry = []
+        for index, x, y in placements:
+            widget, geometry = placed[index]
+            widget.x(x)
+            widget.y(y)
+            geometry.x = x
+            geometry.y = y
+            screen.geometry.append(placed[index])
+
+        return [widget for widget, _ in screen.geometry]
+
+    def build_widgets(
+        self, screen_name: str, screen_entities: list[Entity]
+    ) -> ScreenBuild:
+        screen = ScreenBuild(screen_name)
 
         # order is an enumeration of the components, used to list them,
         # and serves as functionality in the math for formatting.
         for entity in screen_entities:
-            new_widgets = self._create_widgets(name=screen_name, component=entity)
+            new_widgets = self._create_widgets(
+                name=screen_name, component=entity, screen=screen
+            )
             if new_widgets is None:
                 continue
-            self.widgets.extend(new_widgets)
+            screen.widgets.extend(new_widgets)
+
+        return screen
 
-    def build_groups(self, screen_name: str, builder_components: dict[str, Component]):
+    def build_groups(
+        self, screen: ScreenBuild, builder_components: dict[str, Component]
+    ) -> ScreenBuild:
         """
         Create a group to fill with widgets
         """
 
-        if self.widgets == []:
+        if screen.widgets == []:
             # No widgets found, so just back out
-            return
+            return screen
 
-        self.widgets = self.layout_widgets(self.widgets)
+        screen.widgets = self.layout_widgets(screen.widgets, screen)
         # Create a list of dimensions for the groups
         # that will be created.
-        height, width = self._get_group_dimensions(self.widgets)
+        height, width = self._get_group_dimensions(screen.widgets, screen)
 
         if (
-            screen_name in builder_components.keys()
-            and builder_components[screen_name].label is not None
+            screen.name in builder_components.keys()
+            and builder_components[screen.name].label is not None
         ):
-            label = builder_components[screen_name].label or screen_name
+            label = builder_components[screen.name].label or screen.name
         else:
-            label = screen_name
+            label = screen.name
 
-        self.group = Group(
+        group = EMITTERS[self.backend].group(
             label,
             0,
             0,
@@ -391,36 +527,72 @@ class Generator:
             height,
         )
 
-        # TODO: we shouldn't need this assert; fix
-        assert self.group is not None
-        self.group.version("2.0.0")
-        self.group.add_widget(self.widgets)
+        group.version("2.0.0")
+        group.add_widget(screen.widgets)
+        screen.group = group
+        return screen
 
-    def build_screen(self, screen_name):
+    def build_screen(self, screen: ScreenBuild) -> ScreenBuild:
         """
         Build the screen with the widget groups.
         """
         # Create screen
-        self.screen_ = pscreen.Screen(screen_name)
+        screen_ = EMITTERS[self.backend].screen(screen.name)
+        screen.screen_ = screen_
 
-        # TODO: I don't like this
-        if self.group is None:
+        if screen.group is None:
             # No group found, so just back out
-            return
+            return screen
 
-        self.screen_.add_widget(self.group)
+        screen_.add_widget(screen.group)
+        return screen
 
-    def write_screen(self, screen_name: str, directory: Path):
-        """Write the screen to file"""
+    def write_screen(self, screen: ScreenBuild, directory: Path) -> bool:
+        """Write the screen to file, returning whether there was anything to write"""
 
-        if self.widgets == []:
+        if screen.widgets == [] or screen.screen_ is None:
             logger_.warning(
-                f"Could not write screen: {screen_name} \
+                f"Could not write screen: {screen.name} \
 as no widgets were available"
             )
-            return
+            return False
 
         if not directory.exists():
             os.mkdir(directory)
-        self.screen_.write_screen(f"{directory}/{screen_name}.bob")
-        logger_.info(f"{screen_name}.bob has been created successfully")
+        screen.screen_.write_screen(f"{directory}/{screen.name}.bob")
+        logger_.info(f"{screen.name}.bob has been created successfully")
+        return True
+
+
+# Generator used by a screen generation worker process, see init_screen_worker
+_worker_generator: Generator | None = None
+
+
+def init_screen_worker(generator: Generator):
+    """Process pool initialiser, so each worker is only sent the generator once"""
+    global _worker_generator
+    _worker_generator = generator
+
+
+def generate_screen_in_worker(
+    screen_name: str,
+    screen_entities: list[Entity],
+    builder_components: dict[str, Component],
+    directory: Path,
+) -> tuple[bool, dict[tuple[str, int], tuple[int | None, int | None]]]:
+    """
+    Builds and writes one screen in a worker process, returning whether it
+    was written and the support screen dimensions it read
+    """
+    assert _worker_generator is not None
+    generator = _worker_generator
+    # Only the dimensions new to this screen are sent back, rather than every
+    # one the worker has read for earlier screens
+    known = set(_screen_dimensions)
+    screen = generator.build_widgets(screen_name, screen_entities)
+    generator.build_groups(screen, builder_components)
+    generator.build_screen(screen)
+    written = generator.write_screen(screen, directory)
+    return written, {
+        key: value for key, value in _screen_dimensions.items() if key not in known
+    }
@@ -1,20 +1,36 @@
+import hashlib
 import json
 import logging
+import os
+import sys
 from collections import defaultdict
-from dataclasses import _MISSING_TYPE, dataclass, field
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import MISSING, dataclass, field, fields
+from json.encoder import encode_basestring_ascii
 from pathlib import Path
-from typing import Annotated, Any
+from types import MappingProxyType
+from typing import Annotated, Any, NamedTuple, TextIO
 
 import typer
-import yaml
-from lxml import etree, objectify
-from lxml.objectify import ObjectifiedElement
+from lxml import etree
 
 from techui_builder._logger import Logger
-from techui_builder.models import TechUi
+from techui_builder._yaml import safe_load
 
 logger_ = logging.getLogger(__name__)
 
+# Extraction results of the screens read by the last run, next to JsonMap.json
+INDEX_FILE = ".techui-jsonmap-index.json"
+# Changed whenever the extracted facts change, so that old indexes are ignored
+_INDEX_VERSION = 2
+
+# Widgets that can open or embed another screen, found in a single pass
+_LINK_WIDGETS = etree.XPath(
+    "descendant::widget[@type='symbol' or @type='action_button'"
+    " or @type='embedded' or @type='navtabs']"
+)
+
 
 def log_level(level: str):
     Logger(level)
@@ -38,15 +54,129 @@ app = typer.Typer(
 )
 
 
-@dataclass
+@dataclass(slots=True)
 class JsonMap:
     file: str
     display_name: str | None
     exists: bool = True
     duplicate: bool = False
     children: list["JsonMap"] = field(default_factory=list)
-    macros: dict[str, str] = field(default_factory=dict)
+    # Shared between nodes with the same macros, so replace rather than modify it
+    macros: Mapping[str, str] = field(default_factory=dict)
     error: str = ""
+    # Set on a screen that opens one of its own ancestors, which is not crawled
+    back_reference: bool = False
+
+
+class ScreenLink(NamedTuple):
+    """A widget or tab in a screen that opens or embeds another .bob file"""
+
+    widget_type: str
+    name: str | None
+    file: str
+    macros: Mapping[str, str]
+
+
+@dataclass
+class ScreenFacts:
+    """Everything the JSON map needs from a parsed .bob file"""
+
+    name: str | None = None
+    # False if the <name> of the screen could not be read
+    named: bool = False
+    links: list[ScreenLink] = field(default_factory=list)
+    error: str = ""
+    # Errors logged while parsing the screen, logged again when it is reused
+    diagnostics: list[str] = field(default_factory=list)
+
+
+def _file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+@dataclass
+class ScreenIndex:
+    """
+    The facts of every screen read by the last run, with the size, mtime and
+    content hash of the file they came from, so that unchanged screens do
+    not have to be parsed again
+    """
+
+    path: Path
+    previous: dict[str, dict[str, Any]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    current: dict[str, dict[str, Any]] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    def __post_init__(self):
+        if not self.path.exists():
+            return
+
+        try:
+            index = json.loads(self.path.read_text(encoding="utf-8"))
+        except ValueError as e:
+            logger_.warning(f"Ignoring unreadable json map index {self.path}: {e}")
+            return
+
+        if index.get("version") == _INDEX_VERSION:
+            self.previous = index["screens"]
+
+    def lookup(
+        self, key: str, screen_path: Path
+    ) -> tuple[dict[str, Any] | None, dict[str, Any] | None]:
+        """
+        The indexed facts of a screen if its file is unchanged, otherwise the
+        fingerprint to record its new facts against
+        """
+        try:
+            stat = screen_path.stat()
+            entry = self.previous.get(key)
+            if entry is not None and entry["size"] == stat.st_size:
+                if entry["mtime_ns"] == stat.st_mtime_ns:
+                    self.current[key] = entry
+                    return entry["facts"], None
+                # Touched (e.g. by a fresh checkout), so compare the contents
+                digest = _file_digest(screen_path)
+                if entry["digest"] == digest:
+                    self.current[key] = {**entry, "mtime_ns": stat.st_mtime_ns}
+                    return entry["facts"], None
+            else:
+                digest = _file_digest(screen_path)
+        except OSError:
+            # Left to the parse to report
+            return None, None
+
+        return None, {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "digest": digest,
+        }
+
+    def record(self, key: str, fingerprint: dict[str, Any], facts: dict[str, Any]):
+        self.current[key] = {**fingerprint, "facts": facts}
+
+    def save(self):
+        self.path.write_text(
+            json.dumps({"version": _INDEX_VERSION, "screens": self.current}) + "\n",
+            encoding="utf-8",
+        )
+        logger_.debug(f"Json map index written to {self.path}")
+
+
+@dataclass
+class _CrawlFrame:
+    """A screen being crawled, on the explicit stack of generate_json_map"""
+
+    node: JsonMap
+    resolved_path: Path
+    component_name: str | None
+    facts: ScreenFacts
+    # The link in the parent screen that opened this one, and its display name
+    link: ScreenLink | None = None
+    display_name: str | None = None
+    next_link: int = 0
 
 
 @dataclass
@@ -54,6 +184,12 @@ class JsonMapGenerator:
     bob_path: Path = field(default=Path("index.bob"))
     techui: Path = field(default=Path("techui.yaml"))
     output: Path | None = field(default=None)
+    # Write JsonMap.json without indentation or whitespace
+    compact: bool = field(default=False)
+    # Threads parsing the screens linked from the screen being crawled
+    jobs: int = field(default=1)
+    # Only parse screens that changed since the last run, using INDEX_FILE
+    incremental: bool = field(default=False)
 
     def __post_init__(self):
         # Determine the directory to write the json map file to.
@@ -69,14 +205,42 @@ class JsonMapGenerator:
             and not self.techui.exists()
         ):
             self.techui = self._parent_path.joinpath("techui.yaml")
+        # Imported here, as pydantic is slow to import for every subcommand
+        from techui_builder.models import TechUi
+
         try:
             self.techui_yaml: TechUi = TechUi.model_validate(
-                yaml.safe_load(self.techui.read_text(encoding="utf-8"))
+                safe_load(self.techui.read_text(encoding="utf-8"))
             )
         except Exception as e:
             logger_.error(f"Error loading techui.yaml: {e}")
             raise
 
+        # Facts of every screen parsed so far, keyed by resolved path, so that
+        # a screen used many times is only parsed once
+        self._screen_facts: dict[Path, ScreenFacts] = {}
+        # Resolved paths of the screens currently being crawled, to find cycles
+        self._crawl_stack: set[Path] = set()
+        # One read-only mapping per distinct set of macros, shared by every node
+        # and link using them
+        self._macro_table: dict[tuple[tuple[str, str], ...], Mapping[str, str]] = {}
+        self._resolved_parent_path = self._parent_path.resolve()
+        # Screens being parsed ahead of the crawl, when crawling with jobs > 1
+        self._pool: ThreadPoolExecutor | None = None
+        self._pending_facts: dict[Path, Future[ScreenFacts]] = {}
+        self._index = (
+            ScreenIndex(self._write_directory.joinpath(INDEX_FILE))
+            if self.incremental
+            else None
+        )
+        # Fingerprints of the changed screens being parsed, to index them by
+        self._fingerprints: dict[Path, dict[str, Any]] = {}
+        # The resolved path of every (directory, file) link target that is a
+        # file, and the node file of every resolved path, as the same few
+        # support screens are opened from everywhere
+        self._link_targets: dict[tuple[Path, str], Path | None] = {}
+        self._node_files: dict[Path, str] = {}
+
     def generate_json_map(
         self,
         screen_path: Path,
@@ -84,204 +248,348 @@ class JsonMapGenerator:
         current_component_name: str | None = None,
         name_elem: str | None = None,
     ) -> JsonMap:
-        """Recursively generate JSON map from .bob file tree"""
-
-        # ------------ USEFUL FUNCTIONS ------------
+        """
+        Generate JSON map from .bob file tree, crawling depth first with an
+        explicit stack so that deep screen hierarchies cannot hit the recursion
+        limit. Only the facts of each screen are kept, not its XML tree.
 
-        def _get_display_name(
-            name_element: str | None, component_name: str | None, file_path: Path
-        ):
-            # Validated screen names don't get renegerated
-            name = name_element
-            display_name = self._get_component_label(
-                name_element,
-                component_name,
-                name,
+        With more than one job, the screens a screen links to are parsed on a
+        thread pool as soon as it is opened, while the tree is still built in
+        the same order as a serial crawl.
+        """
+        if self.jobs <= 1:
+            return self._crawl(
+                screen_path, dest_path, current_component_name, name_elem
             )
-            # Create valid displayName
-            display_name = self._parse_display_name(display_name, file_path)
-            return display_name
-
-        def _next_file_crawl(
-            file_path_text: str,
-            destination_path: Path,
-            name_element: str | None,
-            component_name: str | None,
-            display_name: str | None,
-            macro_dictionary: dict[str, Any],
-        ):
-            # TODO: misleading var name?
-            next_file_path = destination_path.joinpath(file_path_text)
-
-            # Crawl the next file
-            if next_file_path.is_file():
-                # TODO: investigate non-recursive approaches?
-                child_node = self.generate_json_map(
-                    next_file_path,
-                    destination_path,
-                    current_component_name=component_name,
-                    name_elem=name_element,
-                )
-            else:
-                child_node = JsonMap(
-                    file_path_text,
-                    display_name,
-                    exists=("IOC" in macro_dictionary or ("https:/" in file_path_text)),
+
+        with ThreadPoolExecutor(self.jobs) as pool:
+            self._pool = pool
+            try:
+                return self._crawl(
+                    screen_path, dest_path, current_component_name, name_elem
                 )
+            finally:
+                self._pool = None
+                for future in self._pending_facts.values():
+                    future.cancel()
+                self._pending_facts.clear()
 
-            return child_node
+    def _crawl(
+        self,
+        screen_path: Path,
+        dest_path: Path,
+        current_component_name: str | None,
+        name_elem: str | None,
+    ) -> JsonMap:
+        stack = [self._open_screen(screen_path, current_component_name, name_elem)]
+        self._prefetch_links(stack[-1], dest_path)
+
+        while True:
+            frame = stack[-1]
+
+            if frame.next_link < len(frame.facts.links):
+                link = frame.facts.links[frame.next_link]
+                frame.next_link += 1
+                try:
+                    child_frame = self._crawl_link(frame, link, dest_path)
+                except Exception as e:
+                    frame.node.error = str(e)
+                    # Nothing more is added to a node once it has an error
+                    frame.next_link = len(frame.facts.links)
+                    continue
 
-        # ------------------------------------------
+                if child_frame is not None:
+                    stack.append(child_frame)
+                    self._prefetch_links(child_frame, dest_path)
+                continue
+
+            # Every link has been crawled, so the node is complete
+            stack.pop()
+            self._crawl_stack.discard(frame.resolved_path)
+            if not frame.node.error:
+                frame.node.error = frame.facts.error
+            self._fix_names_json_map(frame.node)
+
+            if not stack:
+                return frame.node
+
+            parent = stack[-1]
+            assert frame.link is not None
+            try:
+                self._add_child(parent.node, frame.link, frame.display_name, frame.node)
+            except Exception as e:
+                parent.node.error = str(e)
+                parent.next_link = len(parent.facts.links)
+
+    def _open_screen(
+        self,
+        screen_path: Path,
+        component_name: str | None,
+        name_elem: str | None,
+        link: ScreenLink | None = None,
+        display_name: str | None = None,
+        resolved_path: Path | None = None,
+    ) -> _CrawlFrame:
+        """Read a screen and create its (not yet complete) node"""
+        if resolved_path is None:
+            resolved_path = screen_path.resolve()
 
         # Create initial node at top of .bob file
-        current_node = JsonMap(
-            str(screen_path.resolve().relative_to(self._parent_path.resolve())),
-            display_name=None,
-        )
+        node_file = self._node_files.get(resolved_path)
+        if node_file is None:
+            node_file = self._node_files[resolved_path] = sys.intern(
+                str(resolved_path.relative_to(self._resolved_parent_path))
+            )
+        node = JsonMap(node_file, display_name=None)
 
         # Get Current Component
-        if (
-            current_component_name is None
-            and screen_path.stem in self.techui_yaml.components
-        ):
-            current_component_name = screen_path.stem
+        if component_name is None and screen_path.stem in self.techui_yaml.components:
+            component_name = screen_path.stem
 
-        abs_path = screen_path.absolute()
+        facts = self._read_screen(resolved_path)
+        frame = _CrawlFrame(
+            node, resolved_path, component_name, facts, link, display_name
+        )
+        self._crawl_stack.add(resolved_path)
 
         try:
-            # Create xml tree from .bob file
-            tree = objectify.parse(abs_path)
-            root: ObjectifiedElement = tree.getroot()
+            if facts.named:
+                # Set top level display name from root element
+                node.display_name = self._parse_display_name(facts.name, screen_path)
+                node.display_name = self._get_component_label(
+                    name_elem,
+                    component_name,
+                    node.display_name,
+                )
+        except Exception as e:
+            node.error = str(e)
+            frame.next_link = len(facts.links)
+
+        return frame
 
-            # Set top level display name from root element
-            current_node.display_name = self._parse_display_name(
-                root.name.text, screen_path
+    def _crawl_link(
+        self, frame: _CrawlFrame, link: ScreenLink, dest_path: Path
+    ) -> _CrawlFrame | None:
+        """
+        Follow a link from a screen, returning the frame of the next screen to
+        crawl, or adding a leaf node to the screen if there is nothing to crawl
+        """
+        # Validated screen names don't get renegerated
+        display_name = self._get_component_label(
+            link.name, frame.component_name, link.name
+        )
+        # Create valid displayName
+        display_name = self._parse_display_name(display_name, Path(link.file))
+
+        resolved_path = self._link_target(dest_path, link.file)
+
+        # Crawl the next file
+        if resolved_path is not None:
+            if resolved_path not in self._crawl_stack:
+                return self._open_screen(
+                    dest_path.joinpath(link.file),
+                    frame.component_name,
+                    link.name,
+                    link=link,
+                    display_name=display_name,
+                    resolved_path=resolved_path,
+                )
+
+            # The screen opens one of its ancestors, so stop here
+            child_node = JsonMap(link.file, display_name, back_reference=True)
+        else:
+            child_node = JsonMap(
+                link.file,
+                display_name,
+                exists=("IOC" in link.macros or ("https:/" in link.file)),
             )
-            current_node.display_name = self._get_component_label(
-                name_elem,
-                current_component_name,
-                current_node.display_name,
+
+        self._add_child(frame.node, link, display_name, child_node)
+        return None
+
+    def _add_child(
+        self,
+        node: JsonMap,
+        link: ScreenLink,
+        display_name: str | None,
+        child_node: JsonMap,
+    ):
+        if link.widget_type == "embedded":
+            # The children of embedded screens belong to the embedding screen
+            for embedded_child in child_node.children:
+                embedded_child.macros = self._share_macros(
+                    {**embedded_child.macros, **link.macros}
+                )
+                embedded_child.display_name = display_name
+                embedded_child.exists = "IOC" in link.macros or (
+                    "https://" in str(embedded_child.file)
+                )
+                node.children.append(embedded_child)
+
+        else:
+            child_node.macros = link.macros
+            node.children.append(child_node)
+
+    def _prefetch_links(self, frame: _CrawlFrame, dest_path: Path):
+        """Start parsing the screens linked from a screen that was just opened"""
+        if self._pool is None:
+            return
+
+        for link in frame.facts.links:
+            resolved_path = self._link_target(dest_path, link.file)
+            if (
+                resolved_path is not None
+                and resolved_path not in self._screen_facts
+                and resolved_path not in self._pending_facts
+                and self._indexed_screen(resolved_path) is None
+            ):
+                self._pending_facts[resolved_path] = self._pool.submit(
+                    self._parse_screen, resolved_path
+                )
+
+    def _link_target(self, dest_path: Path, file: str) -> Path | None:
+        """The resolved path of a linked screen, or None if it is not a file"""
+        key = (dest_path, file)
+        if key not in self._link_targets:
+            next_file_path = dest_path.joinpath(file)
+            self._link_targets[key] = (
+                next_file_path.resolve() if next_file_path.is_file() else None
             )
-            # Find all <widget> elements
-            widgets = [
-                w
-                for w in root.findall(".//widget")
-                if w.get("type", default=None)
-                in ["symbol", "action_button", "embedded", "navtabs"]
-            ]
-
-            for widget_elem in widgets:
-                # Obtain macros associated with file_elem
-                macro_dict: dict[str, str] = {}
-                widget_type = widget_elem.get("type", default=None)
+        return self._link_targets[key]
+
+    def _read_screen(self, screen_path: Path) -> ScreenFacts:
+        """
+        Parses a .bob file for the screens it opens or embeds, only
+        reading each file once
+        """
+        facts = self._screen_facts.get(screen_path)
+        if facts is not None:
+            return facts
+
+        pending = self._pending_facts.pop(screen_path, None)
+        if pending is not None:
+            facts = pending.result()
+        else:
+            facts = self._indexed_screen(screen_path)
+            if facts is not None:
+                return facts
+            facts = self._parse_screen(screen_path)
+
+        self._screen_facts[screen_path] = facts
+        fingerprint = self._fingerprints.pop(screen_path, None)
+        if self._index is not None and fingerprint is not None:
+            self._index.record(
+                self._index_key(screen_path), fingerprint, _facts_to_index(facts)
+            )
+        return facts
+
+    def _indexed_screen(self, screen_path: Path) -> ScreenFacts | None:
+        """The facts of a screen that is unchanged since the last run"""
+        if self._index is None:
+            return None
+
+        entry, fingerprint = self._index.lookup(
+            self._index_key(screen_path), screen_path
+        )
+        if entry is None:
+            if fingerprint is not None:
+                self._fingerprints[screen_path] = fingerprint
+            return None
+
+        facts = self._screen_facts[screen_path] = ScreenFacts(
+            entry["name"],
+            entry["named"],
+            [
+                ScreenLink(
+                    widget_type,
+                    name,
+                    sys.intern(file),
+                    self._share_macros(macros),
+                )
+                for widget_type, name, file, macros in entry["links"]
+            ],
+            entry["error"],
+            entry["diagnostics"],
+        )
+        # Not parsed, so a broken screen is still reported
+        for message in facts.diagnostics:
+            logger_.error(message)
+        return facts
+
+    def _index_key(self, screen_path: Path) -> str:
+        """Screens are indexed relative to index.bob, to survive being moved"""
+        if screen_path.is_relative_to(self._resolved_parent_path):
+            return screen_path.relative_to(self._resolved_parent_path).as_posix()
+        return screen_path.as_posix()
+
+    def _parse_screen(self, screen_path: Path) -> ScreenFacts:
+        facts = ScreenFacts()
+
+        try:
+            # Create xml tree from .bob file, dropping the whitespace between
+            # elements as objectify did. A parser locks while it is parsing,
+            # so each screen gets its own to be parsed on any thread.
+            parser = etree.XMLParser(remove_blank_text=True)
+            root = etree.parse(screen_path, parser).getroot()
+
+            facts.name = _child(root, "name").text
+            facts.named = True
+
+            for widget_elem in _LINK_WIDGETS(root):
+                widget_type = widget_elem.get("type")
 
                 match widget_type:
                     case "symbol" | "action_button":
-                        open_display = _get_action_group(widget_elem)
+                        open_display = _get_action_group(widget_elem, facts.diagnostics)
                         if open_display is None:
                             continue
 
                         # Use file, name, and macro elements
-                        file_elem = open_display.file
-                        name_elem = widget_elem.name.text
-                        macro_dict = self._get_macros(open_display)
+                        targets = [(_child(widget_elem, "name").text, open_display)]
 
                     case "embedded":
-                        file_elem = widget_elem.file
-                        name_elem = widget_elem.name.text
-                        macro_dict = self._get_macros(widget_elem)
+                        targets = [(_child(widget_elem, "name").text, widget_elem)]
 
                     case "navtabs":
-                        tabs = _get_nav_tabs(widget_elem)
+                        tabs = _get_nav_tabs(widget_elem, facts.diagnostics)
                         if tabs is None:
                             continue
 
-                        for tab in tabs:
-                            name_elem = tab.name.text
-                            file_elem = tab.file
-                            macro_dict = self._get_macros(tab)
-
-                            # Extract file path from file_elem
-                            # Keep raw string to preserve urls
-                            file_text = file_elem.text.strip() if file_elem.text else ""
-                            file_path = Path(file_text)
-
-                            # If file is already a .bob file, skip it
-                            if not file_path.suffix == ".bob":
-                                continue
-
-                            display_name = _get_display_name(
-                                name_elem, current_component_name, file_path
-                            )
-
-                            child_node = _next_file_crawl(
-                                file_text,
-                                dest_path,
-                                name_elem,
-                                current_component_name,
-                                display_name,
-                                macro_dict,
-                            )
-
-                            child_node.macros = macro_dict
-                            # TODO: make this work for only list[JsonMap]
-                            assert isinstance(current_node.children, list)
-                            # TODO: fix typing
-                            current_node.children.append(child_node)
-
-                        # We have already done the logic, so skip to the next widget
-                        continue
+                        # Named a tab at a time, so the tabs before one
+                        # without a name are still linked
+                        targets = ((_child(tab, "name").text, tab) for tab in tabs)
 
                     case _:
                         continue
 
-                # Extract file path from file_elem
-                # Keep raw string to preserve urls
-                file_text = file_elem.text.strip() if file_elem.text else ""
-                file_path = Path(file_text)
-
-                # If file is already a .bob file, skip it
-                if not file_path.suffix == ".bob":
-                    continue
-
-                # Create valid displayName
-                display_name = _get_display_name(
-                    name_elem, current_component_name, file_path
-                )
-
-                child_node = _next_file_crawl(
-                    file_text,
-                    dest_path,
-                    name_elem,
-                    current_component_name,
-                    display_name,
-                    macro_dict,
-                )
+                for name, target in targets:
+                    file_elem = _child(target, "file")
+                    # Extract file path from file_elem
+                    # Keep raw string to preserve urls, interned as the same
+                    # few support screens are opened from everywhere
+                    file_text = sys.intern(
+                        file_elem.text.strip() if file_elem.text else ""
+                    )
+
+                    # If file is not a .bob file, skip it
+                    if not os.path.splitext(file_text)[1] == ".bob":
+                        continue
 
-                if widget_type == "embedded":
-                    for embedded_child in child_node.children:
-                        embedded_child.macros = {**embedded_child.macros, **macro_dict}
-                        embedded_child.display_name = display_name
-                        embedded_child.exists = "IOC" in macro_dict or (
-                            "https://" in str(embedded_child.file)
+                    facts.links.append(
+                        ScreenLink(
+                            widget_type,
+                            name,
+                            file_text,
+                            self._share_macros(self._get_macros(target)),
                         )
-                        current_node.children.append(embedded_child)
-
-                else:
-                    child_node.macros = macro_dict
-                    # TODO: make this work for only list[JsonMap]
-                    assert isinstance(current_node.children, list)
-                    # TODO: fix typing
-                    current_node.children.append(child_node)
+                    )
 
         except etree.ParseError as e:
-            current_node.error = f"XML parse error: {e}"
+            facts.error = f"XML parse error: {e}"
         except Exception as e:
-            current_node.error = str(e)
+            facts.error = str(e)
 
-        self._fix_names_json_map(current_node)
-
-        return current_node
+        return facts
 
     def _get_component_label(
         self,
@@ -316,15 +624,22 @@ class JsonMapGenerator:
                         display_name = child_labels[name_elem]
         return display_name
 
-    def _get_macros(self, element: ObjectifiedElement):
-        if hasattr(element, "macros"):
-            macros = element.macros.getchildren()
-            if macros is not None:
-                return {
-                    str(macro.tag): macro.text
-                    for macro in macros
-                    if macro.text is not None
-                }
+    def _share_macros(self, macros: Mapping[str, str]) -> Mapping[str, str]:
+        """The shared read-only mapping with the same macros, in the same order"""
+        key = tuple(macros.items())
+        shared = self._macro_table.get(key)
+        if shared is None:
+            # setdefault, as screens can be parsed on several threads at once
+            shared = self._macro_table.setdefault(key, MappingProxyType(dict(macros)))
+        return shared
+
+    def _get_macros(self, element: etree._Element) -> dict[str, str]:
+        for macros in element.iterchildren("macros"):
+            return {
+                str(macro.tag): macro.text
+                for macro in macros.iterchildren(tag=etree.Element)
+                if macro.text is not None
+            }
         return {}
 
     def _parse_display_name(self, name: str | None, file_path: Path) -> str | None:
@@ -346,32 +661,32 @@ class JsonMapGenerator:
         self,
         node: JsonMap,
     ) -> None:
-        """Recursively fix duplicate display names in children"""
-        if not node.children:
-            return
+        """Fix duplicate display names in the children of every node in a tree"""
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
 
-        # group by display_name
-        name_groups: defaultdict[str | None, list] = defaultdict(list)
-        for child in node.children:
-            name_groups[child.display_name].append(child)
+            # group by display_name
+            name_groups: defaultdict[str | None, list] = defaultdict(list)
+            for child in node.children:
+                name_groups[child.display_name].append(child)
 
-        # fix duplicates by appending identifiers
-        for name, children in name_groups.items():
-            if name and len(children) > 1:
-                # append pv names when present
+            # fix duplicates by appending identifiers
+            for name, children in name_groups.items():
+                if name and len(children) > 1:
+                    # append pv names when present
 
-                for child in children:
-                    if "P" in child.macros:
-                        child.display_name = f"{name} ({child.macros['P']})"
+                    for child in children:
+                        if "P" in child.macros:
+                            child.display_name = f"{name} ({child.macros['P']})"
 
-                # append NO PV NAME and enumeration when there is no pv name
-                no_pv_children = [c for c in children if "P" not in c.macros]
-                for i, child in enumerate(no_pv_children, 1):
-                    child.display_name = f"{name} (NO PV NAME {i})"
+                    # append NO PV NAME and enumeration when there is no pv name
+                    no_pv_children = [c for c in children if "P" not in c.macros]
+                    for i, child in enumerate(no_pv_children, 1):
+                        child.display_name = f"{name} (NO PV NAME {i})"
 
-        # recursively fix children
-        for child in node.children:
-            self._fix_names_json_map(child)
+            # then fix the children
+            nodes.extend(node.children)
 
     def write_json_map(
         self,
@@ -387,91 +702,208 @@ class JsonMapGenerator:
 
         map = self.generate_json_map(self.bob_path, self._parent_path)
         with open(self._write_directory.joinpath("JsonMap.json"), "w") as f:
-            f.write(
-                json.dumps(map, indent=4, default=lambda o: _serialise_json_map(o))
-                + "\n"
+            dump_json_map(map, f, indent=None if self.compact else 4)
+            f.write("\n")
+
+        if self._index is not None:
+            self._index.save()
+
+
+def _facts_to_index(facts: ScreenFacts) -> dict[str, Any]:
+    return {
+        "name": facts.name,
+        "named": facts.named,
+        "links": [
+            [link.widget_type, link.name, link.file, dict(link.macros)]
+            for link in facts.links
+        ],
+        "error": facts.error,
+        "diagnostics": facts.diagnostics,
+    }
+
+
+def dump_json_map(map: JsonMap, f: TextIO, indent: int | None = 4):
+    """
+    Write a JsonMap tree to a file one node at a time, leaving out default
+    values, without building the tree or its JSON text in memory. With no
+    indent, the output is compact (no whitespace at all).
+    """
+    unit = "" if indent is None else " " * indent
+    separator = ":" if indent is None else ": "
+
+    def newline(level: int) -> str:
+        return "" if indent is None else "\n" + unit * level
+
+    # Text is collected in small batches to keep the number of writes down
+    parts: list[str] = []
+
+    head, children, tail = _node_text(map, newline(0), unit, separator)
+    parts.append(head)
+    # Per node being written: its children, the next child to write, the text
+    # to write after its children and its indentation level
+    stack: list[list[Any]] = [[children, 0, tail, 0]]
+    while stack:
+        frame = stack[-1]
+        children, index, tail, level = frame
+        if index == len(children):
+            parts.append(tail)
+            stack.pop()
+            continue
+
+        frame[1] += 1
+        child_newline = newline(level + 2)
+        head, grandchildren, child_tail = _node_text(
+            children[index], child_newline, unit, separator
+        )
+        parts.append(("," if index > 0 else "") + child_newline + head)
+        stack.append([grandchildren, 0, child_tail, level + 2])
+
+        if len(parts) > 1024:
+            f.write("".join(parts))
+            parts.clear()
+
+    f.write("".join(parts))
+
+
+def _node_text(
+    node: JsonMap, newline: str, unit: str, separator: str
+) -> tuple[str, list[JsonMap], str]:
+    """The JSON text of a node before its children, its children, and the text after"""
+    items = _json_map_items(node)
+    if not items:
+        return "{}", [], ""
+
+    inner = newline + unit
+    head = ["{"]
+    tail: list[str] = []
+    children: list[JsonMap] = []
+    text = head
+    for i, (key, value) in enumerate(items):
+        comma = "," if i > 0 else ""
+        key_text = comma + inner + encode_basestring_ascii(key) + separator
+        if key == "children":
+            head.append(key_text + "[")
+            children = value
+            # The children are closed before any keys that follow them
+            text = tail
+            text.append(inner + "]")
+        else:
+            text.append(key_text + _encode_value(value, inner, unit, separator))
+    tail.append(newline + "}")
+
+    return "".join(head), children, "".join(tail)
+
+
+def _encode_value(value: Any, newline: str, unit: str, separator: str) -> str:
+    """Encode a value as json.dumps would at the given indentation"""
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if value is None:
+        return "null"
+    if isinstance(value, Mapping):
+        if not value:
+            return "{}"
+        inner = newline + unit
+        return (
+            "{"
+            + ",".join(
+                inner
+                + encode_basestring_ascii(str(k))
+                + separator
+                + _encode_value(v, inner, unit, separator)
+                for k, v in value.items()
             )
+            + newline
+            + "}"
+        )
+    return json.dumps(value)
 
 
-# Function to convert the JsonMap objects into dictionaries,
-# while ignoring default values
-def _serialise_json_map(map: JsonMap) -> dict[str, Any]:
-    def _check_default(key: str, value: Any):
-        # Is a default factory used? (e.g. list, dict, ...)
-        if not isinstance(
-            JsonMap.__dataclass_fields__[key].default_factory, _MISSING_TYPE
-        ):
-            # If so, check if value is the same as default factory
-            default = JsonMap.__dataclass_fields__[key].default_factory()
-        else:
-            # If not, check if value is the default value
-            default = JsonMap.__dataclass_fields__[key].default
-        return value == default
+def _json_map_fields() -> tuple[tuple[str, str, Any], ...]:
+    """
+    The (attribute, JSON key, default) of every JsonMap field, in the order
+    they are written. Fields without a default use MISSING, so are always
+    written.
+    """
+    # Renamed for JSON camel case convention, and written last
+    renames = {"display_name": "displayName", "back_reference": "backReference"}
 
-    d = {}
+    json_fields: list[tuple[str, str, Any]] = []
+    for f in fields(JsonMap):
+        # Default factories (e.g. list, dict, ...) are only called once, here
+        default = f.default_factory() if f.default_factory is not MISSING else f.default
+        json_fields.append((f.name, renames.get(f.name, f.name), default))
 
-    # Loop over everything in the json map object's dictionary
-    for key, val in map.__dict__.items():
-        # If children has nested JsonMap object, serialise that too
-        if key == "children" and len(val) > 0:
-            val = [_serialise_json_map(v) for v in val]
+    json_fields.sort(key=lambda json_field: json_field[0] in renames)
+    return tuple(json_fields)
 
-        # only include any items if they are not the default value
-        if _check_default(key, val):
-            continue
 
-        d[key] = val
+_JSON_MAP_FIELDS = _json_map_fields()
 
-    # Rename display_name to displayName for JSON camel case convention
-    if "display_name" in d:
-        d["displayName"] = d.pop("display_name")
 
-    return d
+def _json_map_items(map: JsonMap) -> list[tuple[str, Any]]:
+    """The JSON keys and values of a node, leaving out default values"""
+    return [
+        (key, value)
+        for attribute, key, default in _JSON_MAP_FIELDS
+        if (value := getattr(map, attribute)) != default
+    ]
 
 
 # File and desc are under the "actions",
 # so the corresponding tag needs to be found
-def _get_action_group(element: ObjectifiedElement) -> ObjectifiedElement | None:
-    try:
-        actions = element.actions
-        assert actions is not None
-        for action in actions.iterchildren("action"):
-            if action.get("type", default=None) == "open_display":
-                return action
-        return None
-    except AttributeError:
-        # TODO: Find better way of handling there being no "actions" group
-        # TODO: Do widgets always have a name attr, or _can_ it be empty??
-        name = element.name
+def _child(element: etree._Element, tag: str) -> etree._Element:
+    """The first child with the given tag, which the screen must have"""
+    for child in element.iterchildren(tag):
+        return child
+    raise AttributeError(f"no such child: {tag}")
 
-        parent_name = p.name if (p := element.getparent()) is not None else None
 
-        logger_.error(
-            f"Actions group not found in component [bold]{name}[/bold] on "
-            f"[bold]{parent_name}[/bold]"
-        )
+def _log_missing_group(
+    group: str, element: etree._Element, diagnostics: list[str] | None
+):
+    # TODO: Do widgets always have a name attr, or _can_ it be empty??
+    name = element.findtext("name")
 
+    parent = element.getparent()
+    parent_name = parent.findtext("name") if parent is not None else None
+
+    message = (
+        f"{group} group not found in component [bold]{name}[/bold] on "
+        f"[bold]{parent_name}[/bold]"
+    )
+    logger_.error(message)
+    if diagnostics is not None:
+        diagnostics.append(message)
 
-def _get_nav_tabs(element: ObjectifiedElement) -> list[ObjectifiedElement] | None:
-    try:
-        element_tabs = element.tabs
-        assert element_tabs is not None
 
-        tabs = list(element_tabs.iterchildren("tab"))
+def _get_action_group(
+    element: etree._Element, diagnostics: list[str] | None = None
+) -> etree._Element | None:
+    for actions in element.iterchildren("actions"):
+        for action in actions.iterchildren("action"):
+            if action.get("type") == "open_display":
+                return action
+        return None
 
-        return tabs
+    # TODO: Find better way of handling there being no "actions" group
+    _log_missing_group("Actions", element, diagnostics)
+    return None
 
-    except AttributeError:
-        # TODO: Find better way of handling there being no "tabs" group
-        # TODO: Do widgets always have a name attr, or _can_ it be empty??
-        name = element.name
 
-        parent_name = p.name if (p := element.getparent()) is not None else None
+def _get_nav_tabs(
+    element: etree._Element, diagnostics: list[str] | None = None
+) -> list[etree._Element] | None:
+    for element_tabs in element.iterchildren("tabs"):
+        return list(element_tabs.iterchildren("tab"))
 
-        logger_.error(
-            f"Tabs group not found in component [bold]{name}[/bold] on "
-            f"[bold]{parent_name}[/bold]"
-        )
+    # TODO: Find better way of handling there being no "tabs" group
+    _log_missing_group("Tabs", element, diagnostics)
+    return None
 
 
 @app.callback(invoke_without_command=True)
@@ -488,6 +920,30 @@ def generate_jsonmap(
             help="Alternative output location for generated json map file.",
         ),
     ] = None,
+    compact: Annotated[
+        bool,
+        typer.Option(
+            "--compact",
+            help="Write the json map without indentation, to make it smaller.",
+        ),
+    ] = False,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="Number of threads used to parse screens",
+            min=1,
+        ),
+    ] = 1,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            "--incremental",
+            help="Only parse screens that changed since the last json map was "
+            f"generated, keeping an index of the rest in {INDEX_FILE}",
+        ),
+    ] = False,
     loglevel: Annotated[
         str,
         typer.Option(
@@ -502,7 +958,13 @@ def generate_jsonmap(
     """Default function called from cmd line tool."""
     if output_path is not None:
         logger_.info(f"Using user provided output location of: {output_path}")
-    jg = JsonMapGenerator(bob_path=bob_path, output=output_path)
+    jg = JsonMapGenerator(
+        bob_path=bob_path,
+        output=output_path,
+        compact=compact,
+        jobs=jobs,
+        incremental=incremental,
+    )
     jg.write_json_map()
     logger_.info(
         f"Json map generated for {jg.techui_yaml.beamline.location} (from index.bob)"
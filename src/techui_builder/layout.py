@@ -0,0 +1,251 @@
+"""
+Layout engines for placing widgets inside a component group.
+
+Every strategy takes the (width, height) of each widget and returns
+(index, x, y) placements in the order the widgets should be written,
+using only integer arithmetic on running row widths and column heights.
+"""
+
+from collections import defaultdict
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+
+Size = tuple[int, int]
+Placement = tuple[int, int, int]
+
+
+@dataclass(frozen=True)
+class LayoutSettings:
+    group_spacing: int = 30
+    max_group_height: int = 800
+    spacing_x: int = 20
+    spacing_y: int = 30
+
+
+DEFAULT_SETTINGS = LayoutSettings()
+
+LayoutStrategy = Callable[[Sequence[Size], LayoutSettings], list[Placement]]
+
+
+def _decreasing(sizes: Sequence[Size]) -> list[int]:
+    """Widget indices sorted by height, then width, largest first"""
+    return sorted(range(len(sizes)), key=lambda i: sizes[i][::-1], reverse=True)
+
+
+def shelf_layout(
+    sizes: Sequence[Size], settings: LayoutSettings = DEFAULT_SETTINGS
+) -> list[Placement]:
+    """
+    Groups widgets of the same size, tallest groups first, and fills each
+    column with rows (shelves) up to the maximum group height. A widget
+    joins the first row of the current column it fits in, otherwise it
+    starts a new row, moving on to a new column when the current one is full.
+    """
+    groups: defaultdict[Size, list[int]] = defaultdict(list)
+    for index, (width, height) in enumerate(sizes):
+        groups[(height, width)].append(index)
+
+    placements: list[Placement] = []
+    current_x = current_y = column_width = 0
+    # Running state of each row in the current column
+    row_y: list[int] = []
+    row_width: list[int] = []
+    row_end: list[int] = []
+
+    for (h, w), indices in sorted(groups.items(), key=lambda g: g[0][0], reverse=True):
+        for index in indices:
+            for row in range(len(row_y)):
+                if (
+                    row_y[row] + h <= settings.max_group_height
+                    and row_width[row] + w <= column_width
+                ):
+                    placements.append((index, row_end[row], row_y[row]))
+                    row_width[row] += settings.spacing_x + w
+                    row_end[row] += w + settings.spacing_x
+                    break
+            else:
+                if current_y + h > settings.max_group_height:
+                    # Moves to the next column
+                    current_x += column_width + settings.group_spacing
+                    current_y = 0
+                    column_width = 0
+                    row_y, row_width, row_end = [], [], []
+                # Places widgets in rows in one column
+                placements.append((index, current_x, current_y))
+                row_y.append(current_y)
+                row_width.append(w)
+                row_end.append(current_x + w + settings.spacing_x)
+                current_y += h + settings.spacing_y
+                column_width = max(column_width, w)
+
+    return placements
+
+
+class _CapacityTree:
+    """Max segment tree for finding the first row with room for a widget"""
+
+    def __init__(self, size: int):
+        self._size = 1
+        while self._size < max(size, 1):
+            self._size *= 2
+        self._tree = [-1] * (2 * self._size)
+
+    def set(self, index: int, capacity: int):
+        node = index + self._size
+        self._tree[node] = capacity
+        while node > 1:
+            node //= 2
+            self._tree[node] = max(self._tree[2 * node], self._tree[2 * node + 1])
+
+    def first_at_least(self, capacity: int, start: int = 0) -> int | None:
+        """First index >= start with at least the given capacity"""
+        return self._search(1, 0, self._size, capacity, start)
+
+    def _search(
+        self, node: int, low: int, high: int, capacity: int, start: int
+    ) -> int | None:
+        if high <= start or self._tree[node] < capacity:
+            return None
+        if high - low == 1:
+            return low
+        mid = (low + high) // 2
+        found = self._search(2 * node, low, mid, capacity, start)
+        if found is None:
+            found = self._search(2 * node + 1, mid, high, capacity, start)
+        return found
+
+
+def first_fit_decreasing_layout(
+    sizes: Sequence[Size], settings: LayoutSettings = DEFAULT_SETTINGS
+) -> list[Placement]:
+    """
+    Sorts all widgets by height then width, largest first, and puts each
+    one in the first row of *any* column with room for it, only opening a
+    new row or column when nothing fits.
+    """
+    placements: list[Placement] = []
+    # Per row: y, used width and the x of the next widget
+    row_y: list[int] = []
+    row_width: list[int] = []
+    row_end: list[int] = []
+    # Rows of finished columns have a fixed width left, so they live in a
+    # tree; rows of the open column are scanned as its width can still grow
+    closed = _CapacityTree(len(sizes))
+    column_widths: list[int] = []
+    column_x = column_y = column_width = 0
+    column_start = 0
+
+    def place(row: int, index: int, w: int):
+        placements.append((index, row_end[row], row_y[row]))
+        row_width[row] += settings.spacing_x + w
+        row_end[row] += w + settings.spacing_x
+
+    for index in _decreasing(sizes):
+        w, h = sizes[index]
+
+        row = closed.first_at_least(w)
+        while row is not None and row_y[row] + h > settings.max_group_height:
+            row = closed.first_at_least(w, row + 1)
+        if row is not None:
+            place(row, index, w)
+            closed.set(row, column_widths[row] - row_width[row])
+            continue
+
+        for row in range(column_start, len(row_y)):
+            if (
+                row_y[row] + h <= settings.max_group_height
+                and row_width[row] + w <= column_width
+            ):
+                place(row, index, w)
+                break
+        else:
+            if len(row_y) > 0 and column_y + h > settings.max_group_height:
+                # Close the column, fixing the room left in each of its rows
+                for row in range(column_start, len(row_y)):
+                    column_widths[row] = column_width
+                    closed.set(row, column_width - row_width[row])
+                column_x += column_width + settings.group_spacing
+                column_y = column_width = 0
+                column_start = len(row_y)
+            placements.append((index, column_x, column_y))
+            row_y.append(column_y)
+            row_width.append(w)
+            row_end.append(column_x + w + settings.spacing_x)
+            column_widths.append(0)
+            column_y += h + settings.spacing_y
+            column_width = max(column_width, w)
+
+    return placements
+
+
+def skyline_layout(
+    sizes: Sequence[Size], settings: LayoutSettings = DEFAULT_SETTINGS
+) -> list[Placement]:
+    """
+    Packs widgets, largest first, into a strip of the maximum group height
+    that grows to the right. The skyline records how far right each band
+    of the strip is filled, and each widget goes to the leftmost (then
+    highest) position it fits in.
+    """
+    strip_height = settings.max_group_height + settings.spacing_y
+    # Skyline segments as parallel arrays: band start y, band end y, filled up to x
+    seg_start: list[int] = [0]
+    seg_end: list[int] = [strip_height]
+    seg_x: list[int] = [0]
+    placements: list[Placement] = []
+
+    for index in _decreasing(sizes):
+        w, h = sizes[index]
+        band = h + settings.spacing_y
+
+        best_x = best_y = -1
+        if h <= settings.max_group_height:
+            for first in range(len(seg_start)):
+                y = seg_start[first]
+                if y + h > settings.max_group_height:
+                    break
+                # The widget sits right of every segment its band overlaps
+                x = 0
+                last = first
+                while last < len(seg_start) and seg_start[last] < y + band:
+                    x = max(x, seg_x[last])
+                    last += 1
+                if best_x < 0 or x < best_x:
+                    best_x, best_y = x, y
+
+        if best_x < 0:
+            # Too tall for the strip, so it goes to the right of everything
+            best_x, best_y = max(seg_x), 0
+            band = strip_height
+
+        placements.append((index, best_x, best_y))
+
+        # Raise the skyline over the band the widget now occupies
+        top, bottom = best_y, min(best_y + band, strip_height)
+        new_start: list[int] = []
+        new_end: list[int] = []
+        new_x: list[int] = []
+        for start, end, x in zip(seg_start, seg_end, seg_x, strict=True):
+            for s, e, sx in (
+                (start, min(end, top), x),
+                (max(start, top), min(end, bottom), best_x + w + settings.spacing_x),
+                (max(start, bottom), end, x),
+            ):
+                if s >= e:
+                    continue
+                if new_x and new_x[-1] == sx and new_end[-1] == s:
+                    new_end[-1] = e
+                else:
+                    new_start.append(s)
+                    new_end.append(e)
+                    new_x.append(sx)
+        seg_start, seg_end, seg_x = new_start, new_end, new_x
+
+    return placements
+
+
+LAYOUT_STRATEGIES: dict[str, LayoutStrategy] = {
+    "shelf": shelf_layout,
+    "ffd": first_fit_decreasing_layout,
+    "skyline": skyline_layout,
+}
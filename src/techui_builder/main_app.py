@@ -1,12 +1,22 @@
 import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from glob import glob
 from pathlib import Path
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated, Any
 
+import click
 import typer
 
 from techui_builder._logger import log_level
-from techui_builder.autofill import Autofiller
-from techui_builder.builder import Builder
+from techui_builder.emitter import BACKENDS
+from techui_builder.generate_jsonmap import JsonMapGenerator
+from techui_builder.layout import LAYOUT_STRATEGIES
+
+# The builder and autofiller (phoebusgen, jinja2, pydantic) are imported when a
+# build runs, so that loading the CLI for any other subcommand stays fast
+if TYPE_CHECKING:
+    from techui_builder.builder import Builder
 
 logger_ = logging.getLogger(__name__)
 
@@ -92,6 +102,58 @@ def find_bob(bob_file: Path | None, synoptic_dir: Path):
     return bob_file
 
 
+def autofill(gui: "Builder", bob_file: Path, stream: bool = False) -> Path:
+    from techui_builder.autofill import Autofiller
+
+    autofiller = Autofiller(bob_file, gui.conf.components)
+    dest_bob = gui._write_directory.joinpath("index.bob")  # noqa: SLF001
+
+    if stream:
+        autofiller.stream_bob(dest_bob)
+    else:
+        autofiller.read_bob()
+        autofiller.autofill_bob()
+        autofiller.write_bob(dest_bob)
+
+    logger_.info(f"Screens autofilled for {gui.conf.beamline.domain}.")
+    return dest_bob
+
+
+def write_jsonmap(dest_bob: Path, filename: Path):
+    JsonMapGenerator(bob_path=dest_bob, techui=filename).write_json_map()
+    logger_.info(f"Json map generated for {dest_bob.name}.")
+
+
+def watch(
+    gui: "Builder",
+    bob_file: Path,
+    filename: Path,
+    jsonmap: bool,
+    stream_autofill: bool = False,
+):
+    """Rebuild whenever a file the build reads changes, until interrupted"""
+    from techui_builder.watch import Watcher
+
+    patterns = gui.watch_patterns()
+    dest_bob = gui._write_directory.joinpath("index.bob")  # noqa: SLF001
+    if bob_file.absolute() != dest_bob.absolute():
+        # A template outside of the synoptic dir, so changes to it are inputs
+        patterns.append((bob_file.parent, bob_file.name))
+
+    try:
+        for changed in Watcher(patterns):
+            try:
+                gui.refresh(changed)
+                dest_bob = autofill(gui, bob_file, stream_autofill)
+                if jsonmap:
+                    write_jsonmap(dest_bob, filename)
+            except (Exception, SystemExit) as e:
+                # Keep watching, the next edit may well fix it
+                logger_.error(f"Rebuild failed: {e}")
+    except KeyboardInterrupt:
+        logger_.info("Stopped watching.")
+
+
 # This is the 'build' behaviour
 @app.command("build", help="Run techui-builder for a given techui.yaml")
 def main(
@@ -110,11 +172,103 @@ def main(
             callback=log_level,
         ),
     ] = "INFO",
+    dimension_cache: Annotated[
+        bool,
+        typer.Option(
+            "--dimension-cache",
+            help="Cache support screen dimensions in techui-support/ between runs",
+        ),
+    ] = False,
+    layout: Annotated[
+        str,
+        typer.Option(
+            "--layout",
+            help="Strategy used to lay out the widgets in each screen",
+            click_type=click.Choice(list(LAYOUT_STRATEGIES)),
+        ),
+    ] = "shelf",
+    emitter: Annotated[
+        str,
+        typer.Option(
+            "--emitter",
+            help="Build screens with phoebusgen, or directly as lxml elements",
+            click_type=click.Choice(list(BACKENDS)),
+        ),
+    ] = "phoebusgen",
+    load_workers: Annotated[
+        int,
+        typer.Option(
+            "--load-workers",
+            help="Number of worker processes used to read service YAML files",
+            min=1,
+        ),
+    ] = 1,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            "--incremental",
+            help="Only regenerate screens whose inputs changed since the last build",
+        ),
+    ] = False,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="Number of worker processes used to generate screens",
+            min=1,
+        ),
+    ] = 1,
+    watch_files: Annotated[
+        bool,
+        typer.Option(
+            "--watch",
+            help="Keep running and rebuild the screens that change on every edit",
+        ),
+    ] = False,
+    jsonmap: Annotated[
+        bool,
+        typer.Option(
+            "--jsonmap",
+            help="Also write JsonMap.json next to index.bob after each build",
+        ),
+    ] = False,
+    stream_autofill: Annotated[
+        bool,
+        typer.Option(
+            "--stream-autofill",
+            help="Autofill index.bob a widget at a time, for very large synoptics",
+        ),
+    ] = False,
 ) -> None:
     """Default function called from cmd line tool."""
+    from techui_builder.builder import Builder
+
+    gui = Builder(
+        techui=filename,
+        dimension_cache=dimension_cache,
+        layout=layout,
+        backend=emitter,
+        load_workers=load_workers,
+        jobs=jobs,
+        # Watching only makes sense if unchanged screens are not rebuilt
+        incremental=incremental or watch_files,
+    )
+
+    bob_file = build(gui, filename, bobfile, jsonmap, stream_autofill)
+
+    if watch_files:
+        watch(gui, bob_file, filename, jsonmap, stream_autofill)
 
-    gui = Builder(techui=filename)
 
+def build(
+    gui: "Builder",
+    filename: Path,
+    bobfile: Path | None,
+    jsonmap: bool,
+    stream_autofill: bool = False,
+) -> Path:
+    """Build the screens of one beamline, returning its template bob file"""
     ixx_services_dir, synoptic_dir = find_dirs(filename, gui.conf.beamline.domain)
 
     bob_file = find_bob(bobfile, synoptic_dir)
@@ -137,12 +291,193 @@ Write directory: {gui._write_directory}
 
     logger_.info(f"Screens generated for {gui.conf.beamline.domain}.")
 
-    autofiller = Autofiller(bob_file, gui.conf.components)
-    autofiller.read_bob()
-    autofiller.autofill_bob()
+    dest_bob = autofill(gui, bob_file, stream_autofill)
 
-    dest_bob = gui._write_directory.joinpath("index.bob")  # noqa: SLF001
+    if jsonmap:
+        write_jsonmap(dest_bob, filename)
 
-    autofiller.write_bob(dest_bob)
+    return bob_file
 
-    logger_.info(f"Screens autofilled for {gui.conf.beamline.domain}.")
+
+def find_techui_files(patterns: list[Path]) -> list[Path]:
+    """The techui.yaml files given, expanding any glob the shell did not"""
+    techui_files: dict[Path, None] = {}
+    for pattern in patterns:
+        if pattern.exists() or not any(c in str(pattern) for c in "*?["):
+            matches = [pattern]
+        else:
+            matches = sorted(map(Path, glob(str(pattern), recursive=True)))
+            if not matches:
+                logger_.warning(f"No techui.yaml files match {pattern}")
+        # Each beamline is only built once, in the order given
+        techui_files.update(dict.fromkeys(matches))
+    return list(techui_files)
+
+
+def build_beamline(
+    filename: Path, jsonmap: bool, stream_autofill: bool = False, **options: Any
+) -> str | None:
+    """
+    Build one beamline for build-all, possibly in a worker process, returning
+    why it failed rather than raising so that the other beamlines carry on.
+
+    Parsed techui-support.yaml files and support screen dimensions are cached
+    per process, so beamlines built by the same process from the same
+    techui-support share them.
+    """
+    from techui_builder.builder import Builder
+
+    try:
+        build(
+            Builder(techui=filename, **options),
+            filename,
+            None,
+            jsonmap,
+            stream_autofill,
+        )
+    except SystemExit:
+        # The reason has already been logged as critical
+        return "build stopped, see the critical error above"
+    except Exception as e:
+        logger_.debug(f"Build of {filename} failed", exc_info=True)
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def _beamline_pool(jobs: int) -> ProcessPoolExecutor | nullcontext[None]:
+    if jobs <= 1:
+        return nullcontext()
+
+    logger_.debug(f"Building beamlines with {jobs} workers")
+    # Workers set up logging at the level --log-level set, in case they are
+    # not forked
+    level = logging.getLevelName(logging.getLogger().getEffectiveLevel())
+    return ProcessPoolExecutor(
+        max_workers=jobs, initializer=log_level, initargs=(level,)
+    )
+
+
+@app.command("build-all", help="Run techui-builder for many techui.yaml files")
+def main_all(
+    filenames: Annotated[
+        list[Path],
+        typer.Argument(help="The paths (or glob patterns) of the techui.yaml files"),
+    ],
+    loglevel: Annotated[
+        str,
+        typer.Option(
+            "--log-level",
+            "-l",
+            help="Set log level to INFO, DEBUG, WARNING, ERROR or CRITICAL",
+            case_sensitive=False,
+            callback=log_level,
+        ),
+    ] = "INFO",
+    dimension_cache: Annotated[
+        bool,
+        typer.Option(
+            "--dimension-cache",
+            help="Cache support screen dimensions in techui-support/ between runs",
+        ),
+    ] = False,
+    layout: Annotated[
+        str,
+        typer.Option(
+            "--layout",
+            help="Strategy used to lay out the widgets in each screen",
+            click_type=click.Choice(list(LAYOUT_STRATEGIES)),
+        ),
+    ] = "shelf",
+    emitter: Annotated[
+        str,
+        typer.Option(
+            "--emitter",
+            help="Build screens with phoebusgen, or directly as lxml elements",
+            click_type=click.Choice(list(BACKENDS)),
+        ),
+    ] = "phoebusgen",
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            "--incremental",
+            help="Only regenerate screens whose inputs changed since the last build",
+        ),
+    ] = False,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="Number of worker processes building beamlines in parallel",
+            min=1,
+        ),
+    ] = 1,
+    jsonmap: Annotated[
+        bool,
+        typer.Option(
+            "--jsonmap",
+            help="Also write JsonMap.json next to each index.bob",
+        ),
+    ] = False,
+    stream_autofill: Annotated[
+        bool,
+        typer.Option(
+            "--stream-autofill",
+            help="Autofill each index.bob a widget at a time, for very large synoptics",
+        ),
+    ] = False,
+) -> None:
+    """Build every beamline, reporting the ones that failed at the end."""
+    techui_files = find_techui_files(filenames)
+    options = {
+        "dimension_cache": dimension_cache,
+        "layout": layout,
+        "backend": emitter,
+        "incremental": incremental,
+    }
+
+    failures: dict[Path, str] = {}
+    with _beamline_pool(jobs) as pool:
+        if pool is None:
+            results = (
+                (
+                    filename,
+                    build_beamline(filename, jsonmap, stream_autofill, **options),
+                )
+                for filename in techui_files
+            )
+        else:
+            # Collected in submission order, so the report is in the order given
+            futures = [
+                (
+                    filename,
+                    pool.submit(
+                        build_beamline, filename, jsonmap, stream_autofill, **options
+                    ),
+                )
+                for filename in techui_files
+            ]
+            results = ((filename, _result(future)) for filename, future in futures)
+
+        for filename, error in results:
+            if error is None:
+                logger_.info(f"Built {filename}")
+            else:
+                failures[filename] = error
+                logger_.error(f"Build failed for {filename}: {error}")
+
+    logger_.info(
+        f"Built {len(techui_files) - len(failures)} of {len(techui_files)} beamlines."
+    )
+    if failures:
+        for filename, error in failures.items():
+            logger_.error(f"  {filename}: {error}")
+        raise typer.Exit(code=1)
+
+
+def _result(future: Future[str | None]) -> str | None:
+    try:
+        return future.result()
+    except Exception as e:
+        # e.g. the worker process died
+        return f"{type(e).__name__}: {e}"
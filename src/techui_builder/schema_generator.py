@@ -3,18 +3,13 @@ from pathlib import Path
 
 import typer
 
-from techui_builder.models import (
-    GuiComponents,
-    TechUi,
-)
-
 SCHEMAS_DIR = Path("schemas")
-SCHEMAS_DIR.mkdir(exist_ok=True)
 
 app = typer.Typer(context_settings={"allow_interspersed_args": True})
 
 
 def write_json_schema(model_name: str, schema_dict: dict) -> None:
+    SCHEMAS_DIR.mkdir(exist_ok=True)
     out = SCHEMAS_DIR / f"{model_name}.schema.json"
     with out.open("w", encoding="utf-8") as f:
         json.dump(schema_dict, f, sort_keys=False)
@@ -26,6 +21,8 @@ def write_json_schema(model_name: str, schema_dict: dict) -> None:
     invoke_without_command=True,
 )
 def schema_generator() -> None:
+    from techui_builder.models import GuiComponents, TechUi
+
     # techui
     tu = TechUi.model_json_schema()
     write_json_schema("techui", tu)
@@ -2,14 +2,14 @@ import logging
 import os
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
 
 import typer
-import yaml
-from epicsdbbuilder.recordbase import Record
-from softioc.builder import records
 
-from techui_builder.models import TechUi
+from techui_builder._yaml import safe_load
+
+if TYPE_CHECKING:
+    from epicsdbbuilder.recordbase import Record
 
 logger_ = logging.getLogger(__name__)
 
@@ -24,7 +24,7 @@ app = typer.Typer(
 @dataclass
 class GenerateStatusPvs:
     techui_path: Path = field(repr=False)
-    status_pvs: dict[str, Record] = field(default_factory=dict, init=False)
+    status_pvs: dict[str, "Record"] = field(default_factory=dict, init=False)
     output: Path | None = field(default=None)
 
     def __post_init__(self):
@@ -35,9 +35,11 @@ class GenerateStatusPvs:
             self.output if self.output is not None else self.techui_path.parent
         )
 
+        from techui_builder.models import TechUi
+
         try:
             self.techui_yaml: TechUi = TechUi.model_validate(
-                yaml.safe_load(self.techui_path.read_text(encoding="utf-8"))
+                safe_load(self.techui_path.read_text(encoding="utf-8"))
             )
         except Exception as e:
             logger_.error(f"Error loading techui.yaml: {e}")
@@ -45,6 +47,10 @@ class GenerateStatusPvs:
             raise
 
     def create_status_pv(self, prefix: str, inputs: list[str]):
+        # softioc (and EPICS) take longer to import than anything else, so
+        # only the status subcommand pays for them
+        from softioc.builder import records
+
         # Extract all input PVs, provided a default "" if not provided
         values = [(inputs[i] if i < len(inputs) else "") for i in range(12)]
         inpa, inpb, inpc, inpd, inpe, inpf, inpg, inph, inpi, inpj, inpk, inpl = values
@@ -1,5 +1,6 @@
-from lxml import objectify
-from lxml.objectify import ObjectifiedElement
+from pathlib import Path
+
+from lxml import etree, objectify
 
 
 def read_bob(path):
@@ -14,8 +15,17 @@ def read_bob(path):
     return tree, widgets
 
 
-def get_widgets(root: ObjectifiedElement):
-    widgets: dict[str, ObjectifiedElement] = {}
+def parse_bob(
+    path: Path,
+) -> tuple[etree._ElementTree, dict[str, etree._Element]]:
+    """Like read_bob, but a plain lxml tree without objectify's element proxies"""
+    # objectify's parser also removes blank text, so both are written the same
+    tree = etree.parse(path, etree.XMLParser(remove_blank_text=True))
+    return tree, get_widgets(tree.getroot())
+
+
+def get_widgets(root: etree._Element):
+    widgets: dict[str, etree._Element] = {}
     # Loop over objects in the xml
     # i.e. every tag below <display version="2.0.0">
     # but not any nested tags below them
@@ -24,8 +34,8 @@ def get_widgets(root: ObjectifiedElement):
         if child.tag == "widget":
             match child.get("type", default=None):
                 case "action_button" | "symbol":
-                    name = child.name.text
-                    assert name is not None
+                    name = child.findtext("name")
+                    assert name
                     widgets[name] = child
                 case "group":
                     # Get all the widgets inside of the group objects
@@ -1,16 +1,62 @@
+import codecs
 import logging
+import re
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import NamedTuple
 
 from lxml import etree
 from lxml.objectify import ObjectifiedElement
-from phoebusgen.widget.widgets import ActionButton, EmbeddedDisplay
 
+from techui_builder.generate import Widget
 from techui_builder.utils import read_bob
 
 LOGGER = logging.getLogger(__name__)
 
+# Phoebus puts the comment before the root, so only the start of a file is read
+_HEADER_BYTES = 4096
+_SAVED_ON = b"Saved on "
+# The XML declaration, comments and doctype that can come before the root
+_PROLOG_ITEM = re.compile(rb"\s*(?:<\?.*?\?>|<!--(.*?)-->|<!DOCTYPE[^>]*>)", re.DOTALL)
+
+# The properties of a generated widget that a saved screen must keep, and the
+# type both texts are converted to, so that a saved 205.0 matches a generated 205
+_COMPARED_TAGS: dict[str, type] = {"width": float, "height": float, "file": str}
+
+
+class WidgetMismatch(NamedTuple):
+    """A property of a generated widget that is different in a saved screen"""
+
+    name: str
+    tag: str
+    generated: str | None
+    saved: str | None
+
+
+def _element_text(pwidget: Widget, tag: str) -> str | None:
+    element = pwidget.find_element(tag)
+    return element.text if element is not None else None
+
+
+def _generated_macros(pwidget: Widget) -> frozenset[str]:
+    pmacros_element = pwidget.find_element("macros")
+    if pmacros_element is None:
+        return frozenset()
+    # Annoyingly iterating over this also includes the element tag
+    # so it needs ignoring, hence the '!= "macros"'
+    return frozenset(
+        str(macro.tag) for macro in pmacros_element if macro.tag != "macros"
+    )
+
+
+def _same_value(generated: str | None, saved: str | None, convert: type) -> bool:
+    """Whether a generated property matches the saved one"""
+    if generated is None or saved is None:
+        return generated is None and saved is None
+    return convert(generated) == convert(saved)
+
 
 @dataclass
 class Validator:
@@ -18,20 +64,49 @@ class Validator:
     validate: dict[str, Path] = field(
         default_factory=defaultdict, init=False, repr=False
     )
+    # The screens to validate, read while checking them for validate_bob
+    parsed: dict[str, tuple[ObjectifiedElement, dict[str, etree._Element]]] = field(
+        default_factory=dict, init=False, repr=False
+    )
 
     def check_bobs(self):
-        for bob in self.bobs:
-            self._check_bob(bob)
+        # Mostly file reads and parsing, which do not hold the GIL
+        with ThreadPoolExecutor() as pool:
+            # Consumed so that any error is raised here
+            list(pool.map(self._check_bob, self.bobs))
 
     def _check_bob(self, bob_path: Path):
+        if not self._saved_by_phoebus(bob_path):
+            return
+
+        screen_name = bob_path.name.removesuffix(".bob")
+        self.parsed[screen_name] = self._read_bob(bob_path)
+        self.validate[screen_name] = bob_path
+
+    def _saved_by_phoebus(self, bob_path: Path) -> bool:
+        """Whether the screen has been edited and saved by hand in Phoebus"""
+        with open(bob_path, "rb") as f:
+            header = f.read(_HEADER_BYTES)
+
+        pos = len(codecs.BOM_UTF8) if header.startswith(codecs.BOM_UTF8) else 0
+        while match := _PROLOG_ITEM.match(header, pos):
+            comment = match.group(1)
+            if comment is not None and comment.startswith(_SAVED_ON):
+                return True
+            pos = match.end()
+
+        rest = header[pos:].lstrip()
+        if rest[:1] == b"<" and rest[1:2] not in b"?!":
+            # Reached the root
+            return False
+
+        # The header ends part way through the prolog, or is not UTF-8
         # etree has to used as objectify ignore comments
         xml = etree.parse(bob_path)
         # fetch all the comments at the base of the tree
-        comments = list(xml.getroot().itersiblings(tag=etree.Comment, preceding=True))
-        if len(comments) > 0:
-            # Check if any comments found are the manually saved tag
-            if any(str(comment).startswith("<!--Saved on ") for comment in comments):
-                self.validate[bob_path.name.removesuffix(".bob")] = bob_path
+        comments = xml.getroot().itersiblings(tag=etree.Comment, preceding=True)
+        # Check if any comments found are the manually saved tag
+        return any(str(comment).startswith("<!--Saved on ") for comment in comments)
 
     def _read_bob(self, path: Path):
         tree, widgets = read_bob(path)
@@ -41,77 +116,102 @@ class Validator:
         self,
         screen_name: str,
         widget_group_name: str,
-        pwidgets: list[EmbeddedDisplay | ActionButton],
+        pwidgets: list[Widget],
     ):
-        path = self.validate[screen_name]
-        _, file_groups = self._read_bob(path)
+        parsed = self.parsed.get(screen_name)
+        if parsed is None:
+            parsed = self._read_bob(self.validate[screen_name])
+        _, file_groups = parsed
 
         if widget_group_name not in file_groups.keys():
             return
 
-        file_widgets = [
-            file_widget
-            for file_widget in file_groups[widget_group_name].getchildren()
-            if file_widget.tag == "widget"
-        ]
-
-        for pwidget in pwidgets:
-            pwidget_name = pwidget.get_element_value("name")
-            for file_widget in file_widgets:
-                if pwidget_name == file_widget.name:
-                    assert (
-                        int(pwidget.get_element_value("width")) == file_widget.width
-                    ), (
-                        f"{int(pwidget.get_element_value('width'))} \
-!= {file_widget.width}"
-                    )
-                    assert (
-                        int(pwidget.get_element_value("height")) == file_widget.height
-                    ), (
-                        f"{int(pwidget.get_element_value('height'))} \
-!= {file_widget.height}"
-                    )
-                    assert pwidget.get_element_value("file") == file_widget.file, (
-                        f"{pwidget.get_element_value('file')} != {file_widget.file}"
-                    )
-
-                    self._validate_macros(pwidget, file_widget)
+        mismatches = self._diff_widgets(file_groups[widget_group_name], pwidgets)
+        if mismatches:
+            diff = "\n".join(
+                f"  {m.name} <{m.tag}>: generated {m.generated}, saved {m.saved}"
+                for m in mismatches
+            )
+            raise AssertionError(
+                f"{screen_name}.bob does not match the generated screen:\n{diff}"
+            )
 
         LOGGER.info(f"{screen_name}.bob has been validated successfully")
 
-    def _validate_macros(
-        self, pwidget: EmbeddedDisplay | ActionButton, file_widget: ObjectifiedElement
-    ):
-        pmacros_element = pwidget.find_element("macros")
-        # Annoyingly iterating over this also includes the element tag\
-        # so it needs ignoring, hence the '!= "macros"'
-        pmacros = {
-            macro.tag: macro.text for macro in pmacros_element if macro.tag != "macros"
-        }
-        pmacros_keys = set(pmacros.keys())
+    def _diff_widgets(
+        self, file_group: etree._Element, pwidgets: list[Widget]
+    ) -> list[WidgetMismatch]:
+        """
+        The differences between the generated widgets and the saved widgets
+        with the same names, in the order the widgets were generated
+        """
+        # A name may be used by more than one widget in a saved screen
+        file_widgets: defaultdict[str | None, list[etree._Element]] = defaultdict(list)
+        for file_widget in file_group.iterchildren("widget"):
+            file_widgets[file_widget.findtext("name")].append(file_widget)
+
+        mismatches: list[WidgetMismatch] = []
+        for pwidget in pwidgets:
+            name = _element_text(pwidget, "name")
+            if name is None or name not in file_widgets:
+                continue
+
+            # Searching the generated widget is slow, so only done once
+            generated = {tag: _element_text(pwidget, tag) for tag in _COMPARED_TAGS}
+            pmacros = _generated_macros(pwidget)
+            for file_widget in file_widgets[name]:
+                for tag, convert in _COMPARED_TAGS.items():
+                    saved = file_widget.findtext(tag)
+                    if not _same_value(generated[tag], saved, convert):
+                        mismatches.append(
+                            WidgetMismatch(name, tag, generated[tag], saved)
+                        )
+                macros_mismatch = self._validate_macros(name, pmacros, file_widget)
+                if macros_mismatch is not None:
+                    mismatches.append(macros_mismatch)
+
+        return mismatches
 
-        fmacros = file_widget.macros.getchildren()
-        fmacros_keys = {str(macro.tag) for macro in fmacros}
+    def _validate_macros(
+        self,
+        name: str,
+        pmacros_keys: frozenset[str],
+        file_widget: etree._Element,
+    ) -> WidgetMismatch | None:
+        """
+        The difference in macro names, if the saved widget is missing any of
+        the generated widget's macros
+        """
+        fmacros = file_widget.find("macros")
+        fmacros_keys = (
+            {str(macro.tag) for macro in fmacros.iterchildren()}
+            if fmacros is not None
+            else set()
+        )
 
         # Checks if there is any difference in expected macros
         diff_expected_macros = pmacros_keys - fmacros_keys
-        if diff_expected_macros:
-            LOGGER.error(
-                f"Expected macros {diff_expected_macros} missing from \
-{file_widget.name}."
-            )
+        if not diff_expected_macros:
+            return None
+
+        # ---------- This is how we could overwrite macros in the future ----------
 
-            # ---------- This is how we could overwrite macros in the future ----------
+        # for expected_macro in diff_expected_macros:
+        #     macro_element = Element(expected_macro)
+        #     # Get the macro value from generated pwidget macros
+        #     macro_element.text = pmacros[expected_macro]
+        #     print(pmacros[expected_macro])
 
-            # for expected_macro in diff_expected_macros:
-            #     macro_element = Element(expected_macro)
-            #     # Get the macro value from generated pwidget macros
-            #     macro_element.text = pmacros[expected_macro]
-            #     print(pmacros[expected_macro])
+        #     # Convert xml.etree.Element to ObjectifiedElement
+        #     new_macro = fromstring(tostring(macro_element))
 
-            #     # Convert xml.etree.Element to ObjectifiedElement
-            #     new_macro = fromstring(tostring(macro_element))
+        #     file_widget.macros.append(new_macro)
 
-            #     file_widget.macros.append(new_macro)
+        # write_bob("")
 
-            # write_bob("")
+        return WidgetMismatch(
+            name,
+            "macros",
+            ", ".join(sorted(pmacros_keys)),
+            ", ".join(sorted(fmacros_keys)),
+        )
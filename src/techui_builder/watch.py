@@ -0,0 +1,71 @@
+import logging
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+
+try:
+    # inotify (or the platform equivalent) based watching, if available
+    import watchfiles
+except ImportError:
+    watchfiles = None
+
+logger_ = logging.getLogger(__name__)
+
+
+@dataclass
+class Watcher:
+    """
+    Watches files matching (directory, glob pattern) pairs and yields the set
+    of files that were added, changed or removed.
+
+    Uses watchfiles to wait for filesystem events when it is installed,
+    otherwise polls every `interval` seconds. Either way, the files are
+    compared against a snapshot of their mtimes, so only files matching the
+    patterns are ever reported.
+    """
+
+    patterns: list[tuple[Path, str]]
+    interval: float = field(default=1.0)
+    polling: bool = field(default=watchfiles is None)
+
+    def snapshot(self) -> dict[Path, int]:
+        files: dict[Path, int] = {}
+        for directory, pattern in self.patterns:
+            for path in directory.glob(pattern):
+                try:
+                    files[path.absolute()] = path.stat().st_mtime_ns
+                except OSError:
+                    # Removed between glob and stat
+                    continue
+        return files
+
+    def changes(self, previous: dict[Path, int]) -> tuple[set[Path], dict[Path, int]]:
+        """Files that differ from a previous snapshot, and the new snapshot"""
+        current = self.snapshot()
+        changed = {
+            path
+            for path in previous.keys() | current.keys()
+            if previous.get(path) != current.get(path)
+        }
+        return changed, current
+
+    def _wait(self) -> Iterator[None]:
+        if self.polling or watchfiles is None:
+            while True:
+                time.sleep(self.interval)
+                yield
+        else:
+            directories = {d for d, _ in self.patterns if d.exists()}
+            for _ in watchfiles.watch(*directories):
+                yield
+
+    def __iter__(self) -> Iterator[set[Path]]:
+        logger_.info(
+            f"Watching for changes ({'polling' if self.polling else 'watchfiles'})"
+        )
+        previous = self.snapshot()
+        for _ in self._wait():
+            changed, previous = self.changes(previous)
+            if changed:
+                yield changed
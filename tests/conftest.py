@@ -1,3 +1,4 @@
+import shutil
 from pathlib import Path
 from unittest.mock import MagicMock, Mock, patch
 
@@ -112,6 +113,72 @@ def builder_with_test_files(builder: Builder):
     return builder
 
 
+EXAMPLE_TECHUI_SUPPORT = """\
+support_modules:
+  pmac.GeoBrick:
+    prefix: "{{ P }}"
+    macros: [P]
+    screens:
+      - file: pmac/pmacController.bob
+        type: related
+  pmac.autohome:
+    prefix: "{{ P }}"
+    macros: [P]
+    screens:
+      - file: pmac/autohome.bob
+        type: embedded
+  pmac.dls_pmac_asyn_motor:
+    prefix: "{{ P }}{{ M }}"
+    macros: [P, M]
+    screens:
+      - file: pmac/motor_embed.bob
+        type: embedded
+      - file: pmac/motor.bob
+        type: related
+"""
+
+
+@pytest.fixture
+def example_services(tmp_path: Path) -> Path:
+    """A copy of the example beamline's services, which tests can edit"""
+    example = Path(__file__).parent.joinpath("t01-services")
+    return shutil.copytree(example.joinpath("services"), tmp_path.joinpath("services"))
+
+
+@pytest.fixture
+def build_example(example_services: Path):
+    """
+    Builds the example beamline's screens in a synoptic directory, with a
+    stand-in techui-support, taking any other Builder arguments
+    """
+
+    def build(synoptic_dir: Path, **kwargs) -> dict[str, bytes]:
+        techui = synoptic_dir.joinpath("techui.yaml")
+        if not techui.exists():
+            support_bob = synoptic_dir.joinpath("techui-support/bob/pmac")
+            support_bob.mkdir(parents=True)
+            for name in ("motor_embed.bob", "autohome.bob", "motor.bob"):
+                shutil.copy(
+                    "tests/test_files/motor_embed.bob", support_bob.joinpath(name)
+                )
+            synoptic_dir.joinpath("techui-support/techui-support.yaml").write_text(
+                EXAMPLE_TECHUI_SUPPORT
+            )
+            shutil.copy(
+                Path(__file__).parent.joinpath("t01-services/synoptic/techui.yaml"),
+                techui,
+            )
+
+        builder = Builder(techui, **kwargs)
+        builder._services_dir = example_services
+        builder._write_directory = synoptic_dir
+        builder.setup()
+        builder.create_screens()
+        return {bob.name: bob.read_bytes() for bob in synoptic_dir.glob("*.bob")}
+
+    return build
+
+
 @pytest.fixture
 def components(builder_with_test_files: Builder):
     return builder_with_test_files.conf.components
@@ -1,22 +1,23 @@
 import logging
+import shutil
 from pathlib import Path
 from unittest.mock import Mock, patch
 
 import pytest
-from lxml.etree import ElementTree
-from lxml.objectify import Element
+from lxml.etree import Element, ElementTree, fromstring, tostring
 
+from techui_builder.autofill import Autofiller
 from techui_builder.models import Component
 
 
 # Imported in to autofill from utils, so that needs to be patched
-@patch("techui_builder.autofill.read_bob")
-def test_autofiller_read_bob(mock_read_bob, autofiller):
-    mock_read_bob.return_value = (Mock(spec=ElementTree), Mock())
+@patch("techui_builder.autofill.parse_bob")
+def test_autofiller_read_bob(mock_parse_bob, autofiller):
+    mock_parse_bob.return_value = (Mock(spec=ElementTree), Mock())
 
     autofiller.read_bob()
 
-    mock_read_bob.assert_called()
+    mock_parse_bob.assert_called()
 
 
 def test_autofiller_autofill_bob(autofiller):
@@ -29,17 +30,32 @@ def test_autofiller_autofill_bob(autofiller):
     autofiller.autofill_bob()
 
     autofiller.replace_content.assert_called()
-    assert mock_widget.find("run_actions_on_mouse_click") == "true"
+    assert mock_widget.findtext("run_actions_on_mouse_click") == "true"
+
+
+def test_autofiller_autofill_bob_skips_unknown_symbols(autofiller):
+    autofiller.replace_content = Mock()
+    unknown_widget = Element("widget")
+    autofiller.widgets = {"unknown_widget": unknown_widget}
+
+    autofiller.autofill_bob()
+
+    autofiller.replace_content.assert_not_called()
+    assert unknown_widget.find("run_actions_on_mouse_click") is None
+
+
+def test_autofiller_create_macro_element(autofiller):
+    macros = autofiller._create_macro_element({"P": "BL01T-MO-MOTOR-01", "N": 1})
+
+    assert tostring(macros) == b"<macros><P>BL01T-MO-MOTOR-01</P><N>1</N></macros>"
 
 
-@patch("techui_builder.generate_jsonmap.objectify.deannotate")
 @patch("techui_builder.generate_jsonmap.etree.ElementTree")
-def test_autofiller_write_bob(mock_tree, mock_deannotate, autofiller):
+def test_autofiller_write_bob(mock_tree, autofiller):
     autofiller.tree = mock_tree
 
     autofiller.write_bob(Path("tests/test_files/test_autofilled_bob.bob"))
 
-    mock_deannotate.assert_called_once()
     mock_tree.write.assert_called_once_with(
         Path("tests/test_files/test_autofilled_bob.bob"),
         pretty_print=True,
@@ -82,7 +98,10 @@ def test_autofiller_replace_content(
     expected_desc,
     expected_file,
 ):
-    mock_get.return_value = example_xml_related_widget.actions.action
+    widget = fromstring(tostring(example_xml_related_widget))
+    action = widget.find("actions/action")
+    assert action is not None
+    mock_get.return_value = action
 
     # Cannot use a Mock object as need P to be computed
     fake_component = Component(
@@ -92,18 +111,14 @@ def test_autofiller_replace_content(
         macros=macros,
     )
 
-    autofiller.replace_content(
-        example_xml_related_widget,
-        "test_component",
-        fake_component,
-    )
+    autofiller.replace_content(widget, "test_component", fake_component)
 
-    assert example_xml_related_widget.pv_name == f"{prefix}:STA"
-    assert example_xml_related_widget.actions.action.description.text == expected_desc
-    assert example_xml_related_widget.actions.action.file.text == expected_file
+    assert widget.findtext("pv_name") == f"{prefix}:STA"
+    assert action.findtext("description") == expected_desc
+    assert action.findtext("file") == expected_file
     if macros is not None:
         for k, v in macros.items():
-            assert example_xml_related_widget.actions.action.macros[k] == macros[k] == v
+            assert action.findtext(f"macros/{k}") == v
 
 
 @patch("techui_builder.autofill._get_action_group")
@@ -138,3 +153,88 @@ def test_autofiller_replace_content_unsupported_macro(autofiller):
         autofiller.replace_content(None, "", mock_component)
 
         assert e == "The provided macro type is not supported."
+
+
+GOLDEN_COMPONENTS = {
+    "fshtr": Component(prefix="BL01T-EA-FSHTR-01", label="Fast Shutter"),
+    "d1": Component(
+        prefix="BL01T-DI-PHDGN-01",
+        file="test.bob",
+        macros={"P": "BL01T-DI-PHDGN-01", "N": "1"},
+    ),
+    "motor": Component(prefix="BL01T-MO-MOTOR-01"),
+    "no_actions": Component(prefix="BL01T-MO-MOTOR-02"),
+}
+
+
+def test_autofiller_golden(tmp_path):
+    autofiller = Autofiller(
+        Path("tests/test_files/autofill_index.bob"), GOLDEN_COMPONENTS
+    )
+
+    autofiller.read_bob()
+    autofiller.autofill_bob()
+    autofiller.write_bob(tmp_path.joinpath("index.bob"))
+
+    # Written by the objectify autofiller this replaced
+    assert (
+        tmp_path.joinpath("index.bob").read_bytes()
+        == Path("tests/test_files/autofill_index_filled.bob").read_bytes()
+    )
+
+
+def test_autofiller_stream_bob_golden(tmp_path):
+    autofiller = Autofiller(
+        Path("tests/test_files/autofill_index.bob"), GOLDEN_COMPONENTS
+    )
+
+    autofiller.stream_bob(tmp_path.joinpath("index.bob"))
+
+    assert (
+        tmp_path.joinpath("index.bob").read_bytes()
+        == Path("tests/test_files/autofill_index_filled.bob").read_bytes()
+    )
+
+
+def test_autofiller_fills_last_widget_named(tmp_path):
+    widget = """<widget type="symbol" version="2.0.0"><name>motor</name>
+<actions><action type="open_display"><file>a.bob</file></action></actions></widget>"""
+    group = f"""<widget type="group" version="2.0.0"><name>G</name>{widget}</widget>"""
+    tmp_path.joinpath("src.bob").write_text(
+        f'<display version="2.0.0"><name>D</name>{widget}{group}{widget}</display>'
+        "<!-- trailing -->"
+    )
+    autofiller = Autofiller(
+        tmp_path.joinpath("src.bob"),
+        {"motor": Component(prefix="BL01T-MO-MOTOR-01")},
+    )
+
+    autofiller.read_bob()
+    autofiller.autofill_bob()
+    autofiller.write_bob(tmp_path.joinpath("out", "tree.bob"))
+    autofiller.stream_bob(tmp_path.joinpath("out", "stream.bob"))
+
+    out = tmp_path.joinpath("out", "stream.bob").read_bytes()
+    assert out == tmp_path.joinpath("out", "tree.bob").read_bytes()
+    root = fromstring(out)
+    # As get_widgets finds them, so only the last is filled
+    assert [w.findtext("pv_name") for w in root.iter("widget")] == [
+        None,
+        None,
+        None,
+        "BL01T-MO-MOTOR-01:STA",
+    ]
+    assert out.endswith(b"</display>\n<!-- trailing -->\n")
+
+
+def test_autofiller_stream_bob_in_place(tmp_path):
+    index = tmp_path.joinpath("index.bob")
+    shutil.copy("tests/test_files/autofill_index.bob", index)
+
+    Autofiller(index, GOLDEN_COMPONENTS).stream_bob(index)
+
+    assert (
+        index.read_bytes()
+        == Path("tests/test_files/autofill_index_filled.bob").read_bytes()
+    )
+    assert [path.name for path in tmp_path.iterdir()] == ["index.bob"]
@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+from techui_builder.build_cache import BuildCache, component_digest
+from techui_builder.models import Component, Entity, SupportEntity, TechUiSupport
+
+
+@pytest.fixture
+def support(tmp_path):
+    tmp_path.joinpath("bob/pmac").mkdir(parents=True)
+    tmp_path.joinpath("bob/pmac/motor.bob").write_text("<display/>")
+    techui_support = TechUiSupport(
+        support_modules={
+            "pmac.dls_pmac_asyn_motor": SupportEntity(
+                prefix="{{ P }}{{ M }}",
+                macros=["P", "M"],
+                screens=[
+                    {"file": "pmac/motor.bob", "type": "embedded"},
+                    {"file": "$(IOC)/pmacAxis.pvi.bob", "type": "related"},
+                ],
+            )
+        }
+    )
+    return techui_support, tmp_path
+
+
+@pytest.fixture
+def component():
+    return Component(prefix="BL01T-MO-MOTOR-01", label="Motor Stage")
+
+
+@pytest.fixture
+def entities():
+    return [
+        Entity(
+            service_name="bl01t-mo-ioc-01",
+            type="pmac.dls_pmac_asyn_motor",
+            prefix="BL01T-MO-MOTOR-01:X",
+            macros={"P": "BL01T-MO-MOTOR-01", "M": ":X"},
+        )
+    ]
+
+
+def test_component_digest_stable(support, component, entities):
+    techui_support, support_path = support
+
+    assert component_digest(
+        component, entities, techui_support, support_path, {}
+    ) == component_digest(component, entities, techui_support, support_path, {})
+
+
+def test_component_digest_changes_with_entities(support, component, entities):
+    techui_support, support_path = support
+    before = component_digest(component, entities, techui_support, support_path, {})
+
+    entities[0].macros["M"] = ":Y"
+
+    assert (
+        component_digest(component, entities, techui_support, support_path, {})
+        != before
+    )
+
+
+def test_component_digest_changes_with_support_screen(support, component, entities):
+    techui_support, support_path = support
+    before = component_digest(component, entities, techui_support, support_path, {})
+
+    screen = support_path.joinpath("bob/pmac/motor.bob")
+    stat = screen.stat()
+    os.utime(screen, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert (
+        component_digest(component, entities, techui_support, support_path, {})
+        != before
+    )
+
+
+def test_component_digest_changes_with_settings(support, component, entities):
+    techui_support, support_path = support
+
+    assert component_digest(
+        component, entities, techui_support, support_path, {"layout": "shelf"}
+    ) != component_digest(
+        component, entities, techui_support, support_path, {"layout": "skyline"}
+    )
+
+
+def test_build_cache_round_trip(tmp_path):
+    screen = tmp_path.joinpath("motor.bob")
+    screen.write_text("<display/>")
+    cache = BuildCache(tmp_path.joinpath(".techui-cache.json"))
+    assert not cache.is_fresh("motor", "abc", screen)
+
+    cache.record("motor", "abc")
+    cache.save()
+
+    cache = BuildCache(tmp_path.joinpath(".techui-cache.json"))
+    assert cache.is_fresh("motor", "abc", screen)
+    assert not cache.is_fresh("motor", "def", screen)
+
+    # A missing output always needs regenerating
+    screen.unlink()
+    assert not cache.is_fresh("motor", "abc", screen)
+
+
+def test_build_cache_unreadable(tmp_path, caplog):
+    cache_file = tmp_path.joinpath(".techui-cache.json")
+    cache_file.write_text("{not json")
+
+    cache = BuildCache(cache_file)
+
+    assert cache.previous == {}
+    assert "Ignoring unreadable build cache" in caplog.text
@@ -1,9 +1,16 @@
 import logging
-from unittest.mock import Mock
+import os
+from pathlib import Path
+from unittest.mock import Mock, patch
 
 import pytest
+from jinja2 import Template
 from phoebusgen.widget import ActionButton, Group
 
+from techui_builder.build_cache import CACHE_FILE, BuildCache
+from techui_builder.builder import Builder
+from techui_builder.generate import ScreenBuild
+
 
 @pytest.mark.parametrize(
     "attr, expected",
@@ -187,6 +194,82 @@ def test_gb_extract_services_both_yaml_files(builder, caplog, tmp_path):
         assert ("Both ioc.yaml and fastcs.yaml found for") in log_output.message
 
 
+def test_gb_extract_services_parallel(builder, techui_support):
+    builder.techui_support = techui_support
+    builder._extract_services()
+    sequential = dict(builder.entities)
+
+    builder.entities.clear()
+    builder.load_workers = 2
+    with patch.object(builder, "_extract_entities") as mock_extract_entities:
+        builder._extract_services()
+
+    # Each service is parsed by a worker, not by _extract_entities
+    mock_extract_entities.assert_not_called()
+    assert dict(builder.entities) == sequential
+
+
+def test_gb_extract_services_parallel_looks_up_each_service_once(
+    builder, techui_support
+):
+    builder.techui_support = techui_support
+    builder.load_workers = 2
+    builder._extract_services()
+    entities = dict(builder.entities)
+
+    builder.entities.clear()
+    lookups: list[Path] = []
+
+    def cached_service_conf(service_yaml: Path) -> dict | None:
+        # As if each service changed straight after it was first looked up
+        lookups.append(service_yaml)
+        if lookups.count(service_yaml) > 1:
+            return None
+        return builder._service_confs[service_yaml][1]
+
+    with (
+        patch.object(builder, "_cached_service_conf", cached_service_conf),
+        patch("techui_builder.builder._load_service_yaml") as mock_load,
+    ):
+        builder._extract_services()
+
+    mock_load.assert_not_called()
+    assert sorted(lookups) == sorted(set(lookups))
+    assert dict(builder.entities) == entities
+
+
+def test_add_entities_compiles_each_prefix_once(builder, techui_support):
+    builder.techui_support = techui_support
+    ioc_conf = {
+        "entities": [
+            {"type": "pmac.dls_pmac_asyn_motor", "P": "BL01T-MO-MOTOR-01", "M": m}
+            for m in (":X", ":Y", ":Z")
+        ]
+    }
+
+    with patch("techui_builder.builder.Template", wraps=Template) as mock_template:
+        builder._add_entities("bl01t-mo-ioc-01", ioc_conf)
+        builder._add_entities("bl01t-mo-ioc-02", ioc_conf)
+
+    mock_template.assert_called_once_with("{{ P }}{{ M }}")
+    assert [e.prefix for e in builder.entities["BL01T-MO-MOTOR-01"]] == [
+        "BL01T-MO-MOTOR-01:X",
+        "BL01T-MO-MOTOR-01:Y",
+        "BL01T-MO-MOTOR-01:Z",
+    ] * 2
+
+
+def test_read_map_forgets_prefix_templates(builder, techui_support, tmp_path):
+    builder.techui_support = techui_support
+    builder._prefix_template("pmac.GeoBrick")
+    tmp_path.joinpath("techui-support.yaml").write_text("support_modules: {}\n")
+    builder.support_path = tmp_path
+
+    builder._read_map()
+
+    assert builder._prefix_templates == {}
+
+
 def test_builder_generate_screen(builder_with_setup):
     # with (
     #     patch("techui_builder.builder.Generator.build_screen") as mock_build_screen,
@@ -195,7 +278,7 @@ def test_builder_generate_screen(builder_with_setup):
     builder_with_setup.generator.build_screen = Mock()
     builder_with_setup.generator.write_screen = Mock()
 
-    builder_with_setup._generate_screen("TEST")
+    builder_with_setup._generate_screen(ScreenBuild("TEST"))
 
     builder_with_setup.generator.build_screen.assert_called_once()
     builder_with_setup.generator.write_screen.assert_called_once()
@@ -203,10 +286,13 @@ def test_builder_generate_screen(builder_with_setup):
 
 def test_builder_validate_screen(builder_with_setup):
     builder_with_setup.validator.validate_bob = Mock()
-    builder_with_setup.generator.widgets = [Mock(spec=ActionButton)]
-    builder_with_setup.generator.group = Mock(spec=Group, name="TEST")
+    screen = ScreenBuild(
+        "TEST",
+        widgets=[Mock(spec=ActionButton)],
+        group=Mock(spec=Group, name="TEST"),
+    )
 
-    builder_with_setup._validate_screen("TEST")
+    builder_with_setup._validate_screen(screen)
 
     builder_with_setup.validator.validate_bob.assert_called_once()
 
@@ -222,6 +308,43 @@ def test_create_screens(builder_with_setup):
     # builder_with_setup._validate_screen.assert_called()
 
 
+def test_create_screens_incremental(builder_with_setup, tmp_path):
+    builder_with_setup._write_directory = tmp_path
+    builder_with_setup.support_path = tmp_path.joinpath("techui-support")
+    builder_with_setup.build_cache = BuildCache(tmp_path.joinpath(CACHE_FILE))
+    stale = tmp_path.joinpath("stale.bob")
+    stale.write_text("<display/>")
+    builder_with_setup.generated_bobs = [stale]
+
+    def _generate_screen(screen):
+        tmp_path.joinpath(f"{screen.name}.bob").write_text("<display/>")
+        return True
+
+    builder_with_setup._generate_screen = Mock(side_effect=_generate_screen)
+    builder_with_setup.generator.build_widgets.side_effect = lambda name, entities: (
+        ScreenBuild(name)
+    )
+    builder_with_setup.create_screens()
+
+    generated = {c.args[0].name for c in builder_with_setup._generate_screen.mock_calls}
+    assert generated
+    assert not stale.exists()
+
+    # Nothing changed, so nothing should be generated a second time
+    builder_with_setup.build_cache = BuildCache(tmp_path.joinpath(CACHE_FILE))
+    builder_with_setup.generated_bobs = [
+        tmp_path.joinpath(f"{name}.bob") for name in generated
+    ]
+    builder_with_setup._generate_screen.reset_mock()
+    builder_with_setup.generator.build_widgets.reset_mock()
+
+    builder_with_setup.create_screens()
+
+    builder_with_setup._generate_screen.assert_not_called()
+    builder_with_setup.generator.build_widgets.assert_not_called()
+    assert all(tmp_path.joinpath(f"{name}.bob").exists() for name in generated)
+
+
 def test_create_screens_no_entities(builder, caplog):
     builder.entities = []
 
@@ -250,3 +373,82 @@ def test_create_screens_extra_p_does_not_exist(builder_with_setup, caplog):
 
     for log_output in caplog.records:
         assert "Extra prefix BAD-PV" in log_output.message
+
+
+def test_extract_services_reuses_unchanged_service_yaml(builder_with_setup):
+    entities = dict(builder_with_setup.entities)
+    builder_with_setup.entities.clear()
+
+    with patch("techui_builder.builder._load_service_yaml") as mock_load:
+        builder_with_setup._extract_services()
+
+    mock_load.assert_not_called()
+    assert dict(builder_with_setup.entities) == entities
+
+
+def test_refresh_service_change(builder_with_setup, tmp_path):
+    builder_with_setup._extract_services = Mock()
+    builder_with_setup._read_map.reset_mock()
+    builder_with_setup.clean_files = Mock()
+    builder_with_setup.create_screens = Mock()
+    builder_with_setup.build_cache = BuildCache(tmp_path.joinpath(CACHE_FILE))
+    builder_with_setup.build_cache.current = {"screen": "digest"}
+
+    service_yaml = next(builder_with_setup._services_dir.glob("*/config/ioc.yaml"))
+    builder_with_setup.refresh({service_yaml})
+
+    builder_with_setup._extract_services.assert_called_once()
+    builder_with_setup._read_map.assert_not_called()
+    builder_with_setup.create_screens.assert_called_once()
+    assert builder_with_setup.build_cache.previous == {"screen": "digest"}
+    assert builder_with_setup.build_cache.current == {}
+
+
+def test_refresh_support_screen_change(builder_with_setup, tmp_path):
+    builder_with_setup._extract_services = Mock()
+    builder_with_setup.clean_files = Mock()
+    builder_with_setup.create_screens = Mock()
+
+    builder_with_setup.refresh(
+        {builder_with_setup.support_path.joinpath("bob/pmac/motor.bob")}
+    )
+
+    # Support screens only affect the digests, so entities are kept
+    builder_with_setup._extract_services.assert_not_called()
+    assert builder_with_setup.build_cache is not None
+    builder_with_setup.create_screens.assert_called_once()
+
+
+def test_read_map_shared_between_builders(builder, tmp_path):
+    support_yaml = tmp_path.joinpath("techui-support.yaml")
+    support_yaml.write_text("support_modules: {}\n")
+    builder.support_path = tmp_path
+    other = Builder(builder.techui)
+    other.support_path = tmp_path
+
+    builder._read_map()
+    other._read_map()
+    assert other.techui_support is builder.techui_support
+
+    # A changed techui-support.yaml is parsed again
+    support_yaml.write_text("support_modules: {}\n# changed\n")
+    os.utime(support_yaml, ns=(0, 0))
+    other._read_map()
+    assert other.techui_support is not builder.techui_support
+
+
+def test_plain_build_invalidates_build_cache(tmp_path, example_services, build_example):
+    synoptic_dir = tmp_path.joinpath("synoptic")
+    ioc_yaml = example_services.joinpath("bl01t-mo-ioc-01/config/ioc.yaml")
+    original = ioc_yaml.read_text()
+
+    screens = build_example(synoptic_dir, incremental=True)
+    assert "motor.bob" in screens
+
+    ioc_yaml.write_text(original.replace("M: :A", "M: :B"))
+    assert build_example(synoptic_dir, incremental=False) != screens
+
+    # The plain build regenerated the screens, so the manifest of the first
+    # build no longer describes them
+    ioc_yaml.write_text(original)
+    assert build_example(synoptic_dir, incremental=True) == screens
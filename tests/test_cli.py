@@ -4,6 +4,7 @@ from pathlib import Path
 from unittest.mock import MagicMock, Mock, patch
 
 import pytest
+import typer
 from softioc.builder import ClearRecords
 from typer.testing import CliRunner
 
@@ -12,11 +13,14 @@ from techui_builder.generate_jsonmap import app as generate_jsonmap_app
 
 # from techui_builder.main_app import app as main_app
 from techui_builder.main_app import (
+    build_beamline,
     default_bobfile,
     find_bob,
     find_dirs,
+    find_techui_files,
     log_level,
     main,
+    main_all,
 )
 from techui_builder.schema_generator import app as schema_app
 from techui_builder.status import app as status_app
@@ -181,8 +185,8 @@ def test_find_bob_no_bob_file_found(caplog):
 
 @patch("techui_builder.main_app.find_bob")
 @patch("techui_builder.main_app.find_dirs")
-@patch("techui_builder.main_app.Autofiller")
-@patch("techui_builder.main_app.Builder")
+@patch("techui_builder.autofill.Autofiller")
+@patch("techui_builder.builder.Builder")
 def test_main(mock_builder, mock_autofiller, mock_find_dirs, mock_find_bob):
     mock_find_dirs.return_value = Mock(), Mock()
     mock_path = Mock(spec=Path)
@@ -192,6 +196,113 @@ def test_main(mock_builder, mock_autofiller, mock_find_dirs, mock_find_bob):
     mock_find_bob.assert_called_once()
 
 
+@patch("techui_builder.main_app.JsonMapGenerator")
+@patch("techui_builder.watch.Watcher")
+@patch("techui_builder.main_app.find_bob")
+@patch("techui_builder.main_app.find_dirs")
+@patch("techui_builder.autofill.Autofiller")
+@patch("techui_builder.builder.Builder")
+def test_main_watch(
+    mock_builder,
+    mock_autofiller,
+    mock_find_dirs,
+    mock_find_bob,
+    mock_watcher,
+    mock_json_map_generator,
+):
+    mock_find_dirs.return_value = Mock(), Mock()
+    mock_watcher.return_value = iter([{Path("techui.yaml")}, {Path("ioc.yaml")}])
+    mock_gui = mock_builder.return_value
+    # The first rebuild fails, but watching carries on
+    mock_gui.refresh.side_effect = [SystemExit(), None]
+
+    main(Mock(spec=Path), watch_files=True, jsonmap=True)
+
+    assert mock_builder.call_args.kwargs["incremental"] is True
+    assert mock_gui.refresh.call_count == 2
+    # Once for the initial build, then once for the successful rebuild
+    assert mock_autofiller.call_count == 2
+    assert mock_json_map_generator.return_value.write_json_map.call_count == 2
+
+
+def test_find_techui_files(tmp_path, monkeypatch):
+    for beamline in ("bl01t", "bl02t"):
+        tmp_path.joinpath(beamline, "synoptic").mkdir(parents=True)
+        tmp_path.joinpath(beamline, "synoptic/techui.yaml").touch()
+    monkeypatch.chdir(tmp_path)
+
+    techui_files = find_techui_files(
+        [Path("bl02t/synoptic/techui.yaml"), Path("*/synoptic/techui.yaml")]
+    )
+
+    assert techui_files == [
+        Path("bl02t/synoptic/techui.yaml"),
+        Path("bl01t/synoptic/techui.yaml"),
+    ]
+
+
+def test_find_techui_files_no_match(caplog):
+    assert find_techui_files([Path("missing/*.yaml")]) == []
+    assert "No techui.yaml files match missing/*.yaml" in caplog.text
+
+
+@patch("techui_builder.main_app.build")
+@patch("techui_builder.builder.Builder")
+def test_build_beamline(mock_builder, mock_build):
+    assert build_beamline(Path("techui.yaml"), True, layout="ffd") is None
+    mock_builder.assert_called_once_with(techui=Path("techui.yaml"), layout="ffd")
+    mock_build.assert_called_once_with(
+        mock_builder.return_value, Path("techui.yaml"), None, True, False
+    )
+
+    mock_build.side_effect = ValueError("bad techui.yaml")
+    assert build_beamline(Path("techui.yaml"), False) == "ValueError: bad techui.yaml"
+
+    mock_build.side_effect = SystemExit()
+    assert "critical error" in str(build_beamline(Path("techui.yaml"), False))
+
+
+@patch("techui_builder.main_app.build_beamline")
+def test_main_all_reports_failures(mock_build_beamline, caplog):
+    techui_files = [Path("bl01t.yaml"), Path("bl02t.yaml"), Path("bl03t.yaml")]
+    mock_build_beamline.side_effect = [None, "ValueError: bad", None]
+
+    with caplog.at_level(logging.INFO), pytest.raises(typer.Exit) as exc_info:
+        main_all(techui_files, dimension_cache=True)
+
+    assert exc_info.value.exit_code == 1
+    # A failure does not stop the beamlines after it
+    assert [c.args[0] for c in mock_build_beamline.call_args_list] == techui_files
+    assert mock_build_beamline.call_args.kwargs == {
+        "dimension_cache": True,
+        "layout": "shelf",
+        "backend": "phoebusgen",
+        "incremental": False,
+    }
+    assert "Built 2 of 3 beamlines." in caplog.text
+    assert "Build failed for bl02t.yaml: ValueError: bad" in caplog.text
+
+
+@patch("techui_builder.main_app.build_beamline", return_value=None)
+def test_main_all(mock_build_beamline, caplog):
+    with caplog.at_level(logging.INFO):
+        main_all([Path("bl01t.yaml")])
+
+    assert "Built 1 of 1 beamlines." in caplog.text
+
+
+def test_main_all_jobs(tmp_path, caplog):
+    # Each beamline fails in its own worker, without stopping the others
+    main_all_args = [tmp_path.joinpath("bl01t.yaml"), tmp_path.joinpath("bl02t.yaml")]
+
+    with caplog.at_level(logging.INFO), pytest.raises(typer.Exit):
+        main_all(main_all_args, jobs=2)
+
+    assert "Built 0 of 2 beamlines." in caplog.text
+    for filename in main_all_args:
+        assert f"Build failed for {filename}: FileNotFoundError" in caplog.text
+
+
 def test_main_json_map_no_bob_generation(caplog):
     runner.invoke(app, ["--generate-jsonmap"])
     for log_output in caplog.records:
@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import pytest
+
+from techui_builder.emitter import BACKENDS
+from techui_builder.generate import EMITTERS
+
+
+def test_emitters_are_all_backends():
+    assert tuple(EMITTERS) == BACKENDS
+
+
+def write_screen(backend: str, path: Path):
+    emitter = EMITTERS[backend]
+    embedded = emitter.embedded_display("X & <Y>", "pmac/motor.bob", 0, 0, 205, 120)
+    embedded.macro("P", 'BL01T-MO-"MOTOR"-01')
+    embedded.macro("IOC", "https://t01-opis.diamond.ac.uk/bl01t-mo-ioc-01")
+    related = emitter.action_button("Y", "Y", "", 0, 0, 100, 40)
+    related.action_open_display(file="pmac/motor.bob", target="tab", macros={"P": "Y"})
+    related.version("2.0.0")
+    no_macros = emitter.action_button("Z", "Z", "", 0, 0, 100, 40)
+    no_macros.action_open_display(file="pmac/motor.bob", target="tab", macros={})
+    for x, y, widget in ((0, 0, embedded), (225, 0, related), (225, 70, no_macros)):
+        widget.x(x)
+        widget.y(y)
+
+    group = emitter.group("Motors", 0, 0, 375, 170)
+    group.version("2.0.0")
+    group.add_widget([embedded, related, no_macros])
+    screen = emitter.screen("motor")
+    screen.add_widget(group)
+    screen.write_screen(str(path))
+
+    assert group.get_element_value("name") == "Motors"
+    assert embedded.get_element_value("y") == "0"
+    assert [macro.tag for macro in embedded.find_element("macros")] == ["P", "IOC"]
+
+
+def test_lxml_emitter_writes_phoebusgen_screen(tmp_path):
+    write_screen("phoebusgen", tmp_path.joinpath("phoebusgen.bob"))
+    write_screen("lxml", tmp_path.joinpath("lxml.bob"))
+
+    assert (
+        tmp_path.joinpath("lxml.bob").read_bytes()
+        == tmp_path.joinpath("phoebusgen.bob").read_bytes()
+    )
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_lxml_emitter_golden_example_beamline(tmp_path, build_example, jobs):
+    golden = build_example(tmp_path.joinpath("phoebusgen"), backend="phoebusgen")
+    assert "motor.bob" in golden
+
+    # Screens built in worker processes use the same backend
+    assert build_example(tmp_path.joinpath("lxml"), backend="lxml", jobs=jobs) == golden
@@ -1,13 +1,28 @@
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import pytest
 from lxml import objectify
 from phoebusgen import screen as pscreen
 from phoebusgen import widget as pwidget
 
-from techui_builder.models import Entity
+from techui_builder import generate
+from techui_builder.generate import (
+    DIMENSION_CACHE_FILE,
+    Generator,
+    ScreenBuild,
+    WidgetGeometry,
+    generate_screen_in_worker,
+    init_screen_worker,
+    load_dimension_cache,
+    read_screen_dimensions,
+)
+from techui_builder.models import Component, Entity, SupportEntity, TechUiSupport
 
 
 @dataclass
@@ -38,6 +53,76 @@ def test_generator_get_screen_dimensions_default(generator):
     assert y == 100
 
 
+def test_read_screen_dimensions_stops_early(tmp_path):
+    screen = tmp_path.joinpath("screen.bob")
+    # The unclosed tag after <height> would fail to parse if it were ever reached
+    screen.write_text(
+        "<display><name>S</name><width>20</width><height>10</height><widget>"
+    )
+
+    assert read_screen_dimensions(screen) == (10, 20)
+
+
+def test_generator_get_screen_dimensions_cached(generator, tmp_path):
+    screen = tmp_path.joinpath("screen.bob")
+    screen.write_text("<display><width>20</width><height>10</height></display>")
+
+    with patch(
+        "techui_builder.generate.read_screen_dimensions", return_value=(10, 20)
+    ) as mock_read:
+        generator._get_screen_dimensions(str(screen))
+        generator._get_screen_dimensions(str(screen))
+        mock_read.assert_called_once()
+
+        # Touching the file changes its mtime, so it must be read again
+        stat = screen.stat()
+        os.utime(screen, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        generator._get_screen_dimensions(str(screen))
+        assert mock_read.call_count == 2
+
+
+def test_dimension_cache_sidecar(generator, tmp_path):
+    screen = tmp_path.joinpath("screen.bob")
+    screen.write_text("<display><width>20</width><height>10</height></display>")
+    sidecar = tmp_path.joinpath(DIMENSION_CACHE_FILE)
+
+    generator.dimension_cache = sidecar
+    generator._get_screen_dimensions(str(screen))
+    generator.save_dimension_cache()
+
+    entries = json.loads(sidecar.read_text())
+    assert entries[str(screen.resolve())][1:] == [10, 20]
+
+    # A fresh process would only have the sidecar to go on
+    generate._screen_dimensions.clear()
+    load_dimension_cache(sidecar)
+    with patch("techui_builder.generate.read_screen_dimensions") as mock_read:
+        assert generator._get_screen_dimensions(str(screen)) == (10, 20)
+        mock_read.assert_not_called()
+
+
+def test_dimension_cache_sidecar_only_current_screens(generator, tmp_path):
+    screen = tmp_path.joinpath("screen.bob")
+    deleted = tmp_path.joinpath("deleted.bob")
+    sidecar = tmp_path.joinpath(DIMENSION_CACHE_FILE)
+    generator.dimension_cache = sidecar
+
+    deleted.write_text("<display><width>1</width><height>1</height></display>")
+    generator._get_screen_dimensions(str(deleted))
+    deleted.unlink()
+    for size in (10, 20, 30):
+        screen.write_text(
+            f"<display><width>{size}</width><height>{size}</height></display>"
+        )
+        # Each edit changes the mtime, even on filesystems with coarse times
+        os.utime(screen, ns=(size * 1_000_000_000, size * 1_000_000_000))
+        generator._get_screen_dimensions(str(screen))
+        generator.save_dimension_cache()
+
+    entries = json.loads(sidecar.read_text())
+    assert entries == {str(screen.resolve()): [30_000_000_000, 30, 30]}
+
+
 def test_generator_get_widget_dimensions_good(generator):
     widget = pwidget.EmbeddedDisplay(name="X", file="", x=0, y=0, width=205, height=120)
 
@@ -101,7 +186,9 @@ def test_generator_get_widget_position_default_attribute_error(generator):
 def test_generator_get_group_dimensions(generator):
     generator._get_widget_dimensions = Mock(return_value=(120, 250))
     generator._get_widget_position = Mock(return_value=(0, 0))
-    height, width = generator._get_group_dimensions([Mock(), Mock(), Mock(), Mock()])
+    height, width = generator._get_group_dimensions(
+        [Mock(), Mock(), Mock(), Mock()], ScreenBuild("test")
+    )
     assert height == 170
     assert width == 300
 
@@ -117,7 +204,9 @@ def test_generator_create_widgets_keyerror(generator, caplog):
         macros={"P": "BL01T-DI-IOC-01", "R": ":CAM:"},
     )
 
-    result = generator._create_widgets(name=screen_name, component=component)
+    result = generator._create_widgets(
+        name=screen_name, component=component, screen=ScreenBuild(screen_name)
+    )
 
     assert result is None
     assert (
@@ -141,6 +230,7 @@ def test_generator_create_widgets_embedded(generator, example_pgen_embedded_widg
     widget = generator._create_widgets(
         name=screen_name,
         component=component,
+        screen=ScreenBuild(screen_name),
     )
     control_widget = Path("tests/test_files/widget.xml")
     with open(control_widget) as f:
@@ -163,7 +253,9 @@ def test_generator_update_macros(generator):
         macros={"P": "TEST", suffix_key: suffix},
     )
 
-    component_name, updated_macros = generator._update_macros(component)
+    component_name, updated_macros = generator._update_macros(
+        component, ScreenBuild("test")
+    )
 
     assert component_name == "T1"
     assert updated_macros[suffix_key] == suffix
@@ -179,7 +271,9 @@ def test_generator_update_macros_no_suffix(generator):
         macros={"pv": "TEST"},
     )
 
-    component_name, updated_macros = generator._update_macros(component)
+    component_name, updated_macros = generator._update_macros(
+        component, ScreenBuild("test")
+    )
 
     assert component_name == "test"
     assert len(updated_macros) == 1
@@ -201,7 +295,9 @@ def test_generator_update_macros_suffix_with_child_labels(generator):
         child_labels={"T1": child_label},
     )
 
-    component_name, updated_macros = generator._update_macros(component)
+    component_name, updated_macros = generator._update_macros(
+        component, ScreenBuild("test")
+    )
 
     assert component_name == child_label
     assert updated_macros["label"] == child_label
@@ -225,7 +321,7 @@ def test_generator_allocate_widget(generator):
         desc=None,
         macros={"P": "BL01T-DI-IOC-01", "R": ":CAM:"},
     )
-    widget = generator._allocate_widget(scrn_mapping, component)
+    widget = generator._allocate_widget(scrn_mapping, component, ScreenBuild("test"))
     control_widget = Path("tests/test_files/widget.xml")
 
     with open(control_widget) as f:
@@ -249,7 +345,7 @@ def test_generator_allocate_widget_with_remote_screens(generator):
         desc=None,
         macros={"P": "BL01T-DI-IOC-01", "R": ":CAM:"},
     )
-    widget = generator._allocate_widget(scrn_mapping, component)
+    widget = generator._allocate_widget(scrn_mapping, component, ScreenBuild("test"))
     control_widget = Path("tests/test_files/widget_url_screen.xml")
 
     with open(control_widget) as f:
@@ -274,7 +370,7 @@ def test_generator_allocate_widget_with_custom_suffix(generator):
         desc=None,
         macros={"P": "BL01T-DI-IOC-01"},
     )
-    widget = generator._allocate_widget(scrn_mapping, component)
+    widget = generator._allocate_widget(scrn_mapping, component, ScreenBuild("test"))
     control_widget = Path("tests/test_files/widget_custom_suffix.xml")
 
     with open(control_widget) as f:
@@ -298,6 +394,7 @@ def test_generator_create_widgets_related(generator, example_pgen_related_widget
     widgets = generator._create_widgets(
         name="BRICK",
         component=component,
+        screen=ScreenBuild("BRICK"),
     )
 
     control_widget = Path("tests/test_files/widget_related.xml")
@@ -365,11 +462,69 @@ def test_generator_layout_widgets(generator, index, x, y):
         FakeWidget(100, 40),
     ]
 
-    arranged_widgets = generator.layout_widgets(widgets_list)
+    arranged_widgets = generator.layout_widgets(widgets_list, ScreenBuild("test"))
     assert arranged_widgets[index]._x == x
     assert arranged_widgets[index]._y == y
 
 
+def test_generator_allocate_widget_records_geometry(generator):
+    generator._get_screen_dimensions = Mock(return_value=(450, 860))
+
+    scrn_mappings = generator.techui_support.support_modules[
+        "ADAravis.aravisCamera"
+    ].screens
+    component = Entity(
+        service_name="bl01t-di-ioc-01",
+        type="ADAravis.aravisCamera",
+        prefix="BL01T-DI-IOC-01:CAM:",
+        desc=None,
+        macros={"P": "BL01T-DI-IOC-01", "R": ":CAM:"},
+    )
+    screen = ScreenBuild("test")
+    embedded, related = (
+        generator._allocate_widget(scrn_mapping, component, screen)
+        for scrn_mapping in scrn_mappings
+    )
+
+    assert screen.geometry == [
+        (embedded, WidgetGeometry(0, 0, 860, 450)),
+        (related, WidgetGeometry(0, 0, 100, 40)),
+    ]
+
+
+def test_generator_layout_widgets_uses_geometry(generator):
+    generator._get_widget_dimensions = Mock()
+    generator._get_widget_position = Mock()
+    widgets = [
+        pwidget.EmbeddedDisplay(name=str(i), file="", x=0, y=0, width=205, height=120)
+        for i in range(3)
+    ]
+    screen = ScreenBuild("test")
+    for widget in widgets:
+        screen.geometry.append((widget, WidgetGeometry(0, 0, 205, 120)))
+
+    arranged_widgets = generator.layout_widgets(widgets, screen)
+
+    generator._get_widget_dimensions.assert_not_called()
+    generator._get_widget_position.assert_not_called()
+    assert [w for w, _ in screen.geometry] == arranged_widgets
+    assert [g.y for _, g in screen.geometry] == [0, 150, 300]
+    # The phoebusgen widget is kept in sync with its geometry
+    assert arranged_widgets[2].get_element_value("y") == "300"
+
+
+def test_generator_layout_widgets_parses_other_widgets(generator):
+    recorded = pwidget.EmbeddedDisplay(name="X", file="", x=0, y=0, width=5, height=5)
+    other = pwidget.EmbeddedDisplay(name="Y", file="", x=0, y=0, width=205, height=120)
+    screen = ScreenBuild("test")
+    screen.geometry.append((recorded, WidgetGeometry(0, 0, 5, 5)))
+
+    # Not the widget the screen's geometry is for, so its own XML is read
+    generator.layout_widgets([other], screen)
+
+    assert screen.geometry == [(other, WidgetGeometry(0, 0, 205, 120))]
+
+
 # TODO: Split up test
 def test_generator_build_screen(generator, components):
     generator._create_widgets = Mock(return_value=[Mock()])
@@ -385,15 +540,15 @@ def test_generator_build_screen(generator, components):
     screen_name = "test"
     screen_components = [Mock(), Mock(), Mock()]
 
-    generator.build_widgets(screen_name, screen_components)
-    generator.build_groups(screen_name, components)
-    generator.build_screen(screen_name)
-    assert objectify.fromstring(str(generator.screen_)).xpath("//widget[@type='group']")
+    screen = generator.build_widgets(screen_name, screen_components)
+    screen = generator.build_groups(screen, components)
+    screen = generator.build_screen(screen)
+    assert objectify.fromstring(str(screen.screen_)).xpath("//widget[@type='group']")
 
 
 def test_build_groups_with_label(generator, components):
     screen_name = "motor"
-    generator.widgets = [Mock(), Mock(), Mock()]
+    screen = ScreenBuild(screen_name, widgets=[Mock(), Mock(), Mock()])
     generator._create_widgets = Mock(return_value=Mock())
     generator.layout_widgets = Mock(
         return_value=[
@@ -405,14 +560,14 @@ def test_build_groups_with_label(generator, components):
     )
     generator._get_group_dimensions = Mock(return_value=(600, 400))
 
-    generator.build_groups(screen_name, components)
-    xml = objectify.fromstring(str(generator.group))
+    generator.build_groups(screen, components)
+    xml = objectify.fromstring(str(screen.group))
     assert xml.xpath("//name")[0] == "Motor Stage"
 
 
 def test_build_groups(generator, components):
     screen_name = "test"
-    generator.widgets = [Mock(), Mock(), Mock()]
+    screen = ScreenBuild(screen_name, widgets=[Mock(), Mock(), Mock()])
     generator._create_widgets = Mock(return_value=Mock())
     generator.layout_widgets = Mock(
         return_value=[
@@ -424,23 +579,95 @@ def test_build_groups(generator, components):
     )
     generator._get_group_dimensions = Mock(return_value=(600, 400))
 
-    generator.build_groups(screen_name, components)
-    xml = objectify.fromstring(str(generator.group))
+    generator.build_groups(screen, components)
+    xml = objectify.fromstring(str(screen.group))
     assert xml.xpath("//name")[0] == "test"
 
 
 def test_generator_write_screen(generator):
     screen_name = "test"
-    generator.screen_ = pscreen.Screen("test")
-    generator.widgets = [Mock(), Mock()]
-    generator.write_screen(screen_name, Path("tests/test_files/"))
+    screen = ScreenBuild(
+        screen_name, widgets=[Mock(), Mock()], screen_=pscreen.Screen("test")
+    )
+    assert generator.write_screen(screen, Path("tests/test_files/"))
     assert Path("tests/test_files/test.bob").exists()
     Path("tests/test_files/test.bob").unlink()
 
 
 def test_generator_write_screen_no_widgets(generator, caplog):
     screen_name = "test"
-    generator.screen_ = pscreen.Screen("test")
-    generator.widgets = []
-    generator.write_screen(screen_name, Path("tests/test_files/"))
+    screen = ScreenBuild(screen_name, screen_=pscreen.Screen("test"))
+    assert not generator.write_screen(screen, Path("tests/test_files/"))
     assert "Could not write screen: test as no widgets were available" in caplog.text
+
+
+def test_generator_label_flag_is_per_screen(generator):
+    component = Entity(
+        type="test",
+        prefix="TEST:T1",
+        desc=None,
+        service_name="bl01t-mo-test-01",
+        macros={"P": "TEST", "R": ":T1"},
+        child_labels={"T1": "Test 1"},
+    )
+    labelled = ScreenBuild("labelled")
+    generator._update_macros(component, labelled)
+
+    assert labelled.label_flag
+    assert not ScreenBuild("next").label_flag
+
+
+def test_generate_screen_in_worker_matches_serial(tmp_path):
+    support_path = tmp_path.joinpath("techui-support")
+    support_path.joinpath("bob/pmac").mkdir(parents=True)
+    shutil.copy("tests/test_files/motor_embed.bob", support_path.joinpath("bob/pmac"))
+    techui_support = TechUiSupport(
+        support_modules={
+            "pmac.dls_pmac_asyn_motor": SupportEntity(
+                prefix="{{ P }}{{ M }}",
+                macros=["P", "M"],
+                screens=[
+                    {"file": "pmac/motor_embed.bob", "type": "embedded"},
+                    {"file": "pmac/motor.bob", "type": "related"},
+                ],
+            )
+        }
+    )
+    generator = Generator(tmp_path, "test_url", support_path, techui_support)
+    components = {"motor": Component(prefix="BL01T-MO-MOTOR-01", label="Motors")}
+    entities = [
+        Entity(
+            service_name="bl01t-mo-ioc-01",
+            type="pmac.dls_pmac_asyn_motor",
+            prefix=f"BL01T-MO-MOTOR-01:X{i}",
+            desc=None,
+            macros={"P": "BL01T-MO-MOTOR-01", "M": f":X{i}"},
+        )
+        for i in range(12)
+    ]
+
+    parallel_dir = tmp_path.joinpath("parallel")
+    with ProcessPoolExecutor(
+        max_workers=1, initializer=init_screen_worker, initargs=(generator,)
+    ) as pool:
+        written, dimensions = pool.submit(
+            generate_screen_in_worker, "motor", entities, components, parallel_dir
+        ).result()
+        # The worker already knows the dimensions of the screens it embeds
+        _, next_dimensions = pool.submit(
+            generate_screen_in_worker, "motor", entities, components, parallel_dir
+        ).result()
+
+    assert written
+    assert [Path(path).name for path, _ in dimensions] == ["motor_embed.bob"]
+    assert next_dimensions == {}
+
+    serial_dir = tmp_path.joinpath("serial")
+    screen = generator.build_widgets("motor", entities)
+    generator.build_groups(screen, components)
+    generator.build_screen(screen)
+    assert generator.write_screen(screen, serial_dir)
+    assert (
+        parallel_dir.joinpath("motor.bob").read_bytes()
+        == serial_dir.joinpath("motor.bob").read_bytes()
+    )
@@ -1,6 +1,11 @@
+import io
+import json
 import logging
 import os
+import sys
+from collections.abc import Mapping
 from pathlib import Path
+from typing import Any
 from unittest.mock import MagicMock, Mock, patch
 
 import pytest
@@ -8,17 +13,33 @@ from lxml import objectify
 from typer.testing import CliRunner
 
 from techui_builder.generate_jsonmap import (
+    INDEX_FILE,
     JsonMap,
+    JsonMapGenerator,
+    ScreenIndex,
     _get_action_group,
     _get_nav_tabs,  # type: ignore
-    _serialise_json_map,
+    _json_map_items,
     app,
+    dump_json_map,
     log_level,
 )
 
 runner = CliRunner()
 
 
+def serialise_json_map(map: JsonMap) -> dict[str, Any]:
+    """A JsonMap tree as dictionaries, without its default values"""
+    d: dict[str, Any] = {}
+    for key, val in _json_map_items(map):
+        if key == "children":
+            val = [serialise_json_map(v) for v in val]
+        elif isinstance(val, Mapping):
+            val = dict(val)
+        d[key] = val
+    return d
+
+
 @patch("techui_builder.generate_jsonmap.Logger")
 def test_log_level(mock_logger):
     log_level("INFO")
@@ -38,7 +59,7 @@ def test_app():
     assert result.exit_code == 0
 
 
-@patch("techui_builder.generate_jsonmap.yaml.safe_load")
+@patch("techui_builder.generate_jsonmap.safe_load")
 def test_json_map_generator_techui_exception(mock_safe_load, json_map_generator):
     mock_safe_load.side_effect = Exception("YAML load error")
     with pytest.raises(Exception) as excinfo:
@@ -46,31 +67,39 @@ def test_json_map_generator_techui_exception(mock_safe_load, json_map_generator)
     assert "No such file or directory" in str(excinfo.value)
 
 
-def test_write_json_map(json_map_generator):
+@pytest.mark.parametrize(
+    "compact, expected",
+    [
+        (
+            False,
+            '{\n    "file": "test_bob.bob",\n    "children": [\n'
+            '        {\n            "file": "child.bob",\n'
+            '            "exists": false,\n            "displayName": "Child"\n'
+            '        }\n    ],\n    "displayName": "Display"\n}\n',
+        ),
+        (
+            True,
+            '{"file":"test_bob.bob","children":[{"file":"child.bob",'
+            '"exists":false,"displayName":"Child"}],"displayName":"Display"}\n',
+        ),
+    ],
+    ids=["indented", "compact"],
+)
+def test_write_json_map(json_map_generator, tmp_path, compact, expected):
     test_map = JsonMap(
-        str(Path(__file__).parent.joinpath("test_files/test_bob.bob")), None
+        "test_bob.bob",
+        "Display",
+        children=[JsonMap("child.bob", "Child", exists=False)],
     )
 
     # We don't want cover _generate_json_map in this test
     json_map_generator.generate_json_map = Mock(return_value=test_map)
+    json_map_generator._write_directory = tmp_path
+    json_map_generator.compact = compact
 
-    # Make sure opis/ dir exists
-    if not Path.exists(json_map_generator._write_directory):
-        os.mkdir(json_map_generator._write_directory)
-
-    # We don't want to access the _serialise_json_map function in this test
-    with patch(
-        "techui_builder.generate_jsonmap._serialise_json_map"
-    ) as mock_serialise_json_map:
-        mock_serialise_json_map.return_value = {"test": "test"}
-
-        json_map_generator.write_json_map()
-
-    dest_path = json_map_generator._write_directory.joinpath("JsonMap.json")
-    assert Path.exists(dest_path)
+    json_map_generator.write_json_map()
 
-    if Path.exists(dest_path):
-        os.remove(dest_path)
+    assert tmp_path.joinpath("JsonMap.json").read_text() == expected
 
 
 # We don't want to access the _get_action_group function in this test
@@ -299,7 +328,7 @@ def test_generate_json_map_other_exception(
 
 
 def test_serialise_json_map(example_json_map):
-    json_ = _serialise_json_map(example_json_map)  # type: ignore
+    json_ = serialise_json_map(example_json_map)
 
     assert json_ == {
         "file": "test_bob.bob",
@@ -412,3 +441,349 @@ def test_get_nav_tabs_no_tabs_group(caplog):
 
     for log_output in caplog.records:
         assert "Tabs group not found" in log_output.message
+
+
+def _write_screen(path: Path, name: str, opens: list[str], embeds: list[str]):
+    widgets = "".join(
+        f"""<widget type="action_button" version="2.0.0"><name>{file}</name>
+<actions><action type="open_display"><file>{file}</file></action></actions>
+</widget>"""
+        for file in opens
+    ) + "".join(
+        f"""<widget type="embedded" version="2.0.0"><name>{file}</name>
+<file>{file}</file></widget>"""
+        for file in embeds
+    )
+    path.write_text(f'<display version="2.0.0"><name>{name}</name>{widgets}</display>')
+
+
+def test_generate_json_map_cycle(tmp_path):
+    _write_screen(tmp_path.joinpath("index.bob"), "Index", ["a.bob"], [])
+    _write_screen(tmp_path.joinpath("a.bob"), "A", ["b.bob"], [])
+    _write_screen(tmp_path.joinpath("b.bob"), "B", ["a.bob"], [])
+    generator = JsonMapGenerator(
+        bob_path=tmp_path.joinpath("index.bob"),
+        techui=Path("tests/t01-services/synoptic/techui.yaml"),
+    )
+
+    json_map = generator.generate_json_map(generator.bob_path, tmp_path)
+
+    (a,) = json_map.children
+    (b,) = a.children
+    (back_reference,) = b.children
+    assert (a.file, b.file) == ("a.bob", "b.bob")
+    assert back_reference == JsonMap("a.bob", "a.bob", back_reference=True)
+    assert serialise_json_map(back_reference) == {
+        "file": "a.bob",
+        "displayName": "a.bob",
+        "backReference": True,
+    }
+
+
+def test_generate_json_map_parses_each_screen_once(tmp_path):
+    _write_screen(
+        tmp_path.joinpath("index.bob"), "Index", ["a.bob", "a.bob"], ["e.bob"] * 3
+    )
+    _write_screen(tmp_path.joinpath("a.bob"), "A", [], ["e.bob"])
+    _write_screen(tmp_path.joinpath("e.bob"), "E", ["detail.bob"], [])
+    generator = JsonMapGenerator(
+        bob_path=tmp_path.joinpath("index.bob"),
+        techui=Path("tests/t01-services/synoptic/techui.yaml"),
+    )
+
+    with patch.object(
+        generator, "_parse_screen", wraps=generator._parse_screen
+    ) as mock_parse:
+        json_map = generator.generate_json_map(generator.bob_path, tmp_path)
+
+    assert mock_parse.call_count == 3
+    # Each embedded e.bob still contributes its own child
+    assert [child.file for child in json_map.children] == [
+        "a.bob",
+        "a.bob",
+        "detail.bob",
+        "detail.bob",
+        "detail.bob",
+    ]
+    assert json_map.children[0].children[0].file == "detail.bob"
+
+
+def test_generate_json_map_deeper_than_recursion_limit(tmp_path):
+    depth = sys.getrecursionlimit() + 100
+    _write_screen(tmp_path.joinpath("index.bob"), "Index", ["s0.bob"], [])
+    for i in range(depth):
+        _write_screen(tmp_path.joinpath(f"s{i}.bob"), f"S{i}", [f"s{i + 1}.bob"], [])
+    generator = JsonMapGenerator(
+        bob_path=tmp_path.joinpath("index.bob"),
+        techui=Path("tests/t01-services/synoptic/techui.yaml"),
+    )
+
+    json_map = generator.generate_json_map(generator.bob_path, tmp_path)
+
+    levels = 0
+    node = json_map
+    while node.children:
+        assert node.error == ""
+        (node,) = node.children
+        levels += 1
+    assert levels == depth + 1
+    # The last screen opens one that does not exist
+    assert node == JsonMap(f"s{depth}.bob", f"s{depth}.bob", exists=False)
+
+
+@pytest.mark.parametrize(
+    "indent, separators", [(4, None), (None, (",", ":"))], ids=["indented", "compact"]
+)
+def test_dump_json_map_matches_json_dumps(example_json_map, indent, separators):
+    example_json_map.children.extend(
+        [
+            JsonMap(
+                "motor.bob",
+                "Motor \u00b5",
+                macros={"P": "BL01T-MO-01", "M": ':X "1"'},
+                children=[JsonMap("a.bob", None, error="XML parse error: x")],
+            ),
+            JsonMap("index.bob", "Index", back_reference=True, duplicate=True),
+        ]
+    )
+
+    f = io.StringIO()
+    dump_json_map(example_json_map, f, indent=indent)
+
+    assert f.getvalue() == json.dumps(
+        serialise_json_map(example_json_map), indent=indent, separators=separators
+    )
+
+
+def test_dump_json_map_deeper_than_recursion_limit():
+    depth = sys.getrecursionlimit() + 100
+    root = node = JsonMap("index.bob", "Index")
+    for i in range(depth):
+        child = JsonMap(f"s{i}.bob", f"S{i}")
+        node.children.append(child)
+        node = child
+
+    f = io.StringIO()
+    dump_json_map(root, f, indent=None)
+
+    text = f.getvalue()
+    assert text.startswith('{"file":"index.bob","children":[{"file":"s0.bob"')
+    assert text.endswith('"displayName":"Index"}')
+    assert text.count("{") == text.count("}") == depth + 1
+
+
+def test_main_json_map_generation_compact(tmp_path):
+    result = runner.invoke(
+        app,
+        ["--compact", "-o", str(tmp_path), "tests/t01-services/synoptic/index.bob"],
+    )
+
+    assert result.exit_code == 0
+    json_map = tmp_path.joinpath("JsonMap.json").read_text()
+    assert "\n" not in json_map.rstrip("\n")
+    assert json.loads(json_map)["file"] == "index.bob"
+
+
+def test_json_map_is_slotted():
+    json_map = JsonMap("index.bob", "Index")
+
+    assert not hasattr(json_map, "__dict__")
+    # Default factories still give every node its own containers
+    assert json_map.children is not JsonMap("a.bob", None).children
+
+
+def test_generate_json_map_shares_files_and_macros(tmp_path):
+    _write_screen(tmp_path.joinpath("index.bob"), "Index", ["a.bob", "b.bob"], [])
+    _write_screen(tmp_path.joinpath("a.bob"), "A", ["motor.bob"], [])
+    _write_screen(tmp_path.joinpath("b.bob"), "B", ["motor.bob"], [])
+    generator = JsonMapGenerator(
+        bob_path=tmp_path.joinpath("index.bob"),
+        techui=Path("tests/t01-services/synoptic/techui.yaml"),
+    )
+
+    json_map = generator.generate_json_map(generator.bob_path, tmp_path)
+
+    (motor_a,) = json_map.children[0].children
+    (motor_b,) = json_map.children[1].children
+    assert motor_a.file is motor_b.file
+    assert motor_a.macros is motor_b.macros
+    with pytest.raises(TypeError):
+        motor_a.macros["P"] = "changed"  # type: ignore
+
+
+def test_parse_screen_extracts_links(json_map_generator, tmp_path):
+    screen = tmp_path.joinpath("screen.bob")
+    screen.write_text(
+        """<display version="2.0.0"><name>Screen</name>
+<widget type="symbol" version="2.0.0"><name>pump</name>
+  <actions><action type="open_display"><file> pump.bob </file>
+    <macros><!-- pump macros --><P>BL01T-VA-PUMP-01</P><R/></macros>
+  </action></actions></widget>
+<widget type="label" version="2.0.0"><name>label</name><file>x.bob</file></widget>
+<widget type="group" version="2.0.0"><name>group</name>
+  <widget type="navtabs" version="2.0.0"><name>tabs</name><tabs>
+    <tab><name>One</name><file>one.bob</file></tab>
+    <tab><name>Two</name><file>two.opi</file></tab>
+  </tabs></widget>
+</widget>
+<widget type="embedded" version="2.0.0"><name>no file</name></widget>
+</display>"""
+    )
+
+    facts = json_map_generator._parse_screen(screen)
+
+    assert facts.name == "Screen"
+    assert facts.links == [
+        ("symbol", "pump", "pump.bob", {"P": "BL01T-VA-PUMP-01"}),
+        ("navtabs", "One", "one.bob", {}),
+    ]
+    # Links found before the broken widget are kept
+    assert facts.error == "no such child: file"
+
+
+def test_parse_screen_navtabs_tab_without_name(json_map_generator):
+    facts = json_map_generator._parse_screen(
+        Path("tests/test_files/test_bob_navtabs_bad.bob")
+    )
+
+    assert facts.name == "Display"
+    # The tab before the one without a name is kept
+    assert facts.links == [("navtabs", "Tab1", "tab1.bob", {})]
+    assert facts.error == "no such child: name"
+
+
+def test_generate_json_map_jobs_matches_serial(tmp_path):
+    _write_screen(
+        tmp_path.joinpath("index.bob"), "Index", ["a.bob", "b.bob", "a.bob"], ["e.bob"]
+    )
+    _write_screen(tmp_path.joinpath("a.bob"), "A", ["b.bob", "index.bob"], [])
+    _write_screen(tmp_path.joinpath("b.bob"), "B", ["c.bob", "missing.bob"], [])
+    _write_screen(tmp_path.joinpath("c.bob"), "C", [], ["e.bob"])
+    _write_screen(tmp_path.joinpath("e.bob"), "E", ["detail.bob"], [])
+    tmp_path.joinpath("detail.bob").write_text("<display><name>Detail")
+
+    def json_map(jobs: int) -> str:
+        generator = JsonMapGenerator(
+            bob_path=tmp_path.joinpath("index.bob"),
+            techui=Path("tests/t01-services/synoptic/techui.yaml"),
+            jobs=jobs,
+        )
+        with patch.object(
+            generator, "_parse_screen", wraps=generator._parse_screen
+        ) as mock_parse:
+            f = io.StringIO()
+            dump_json_map(generator.generate_json_map(generator.bob_path, tmp_path), f)
+
+        # Every screen is still parsed once, and no pool is left behind
+        assert mock_parse.call_count == 6
+        assert generator._pool is None
+        assert generator._pending_facts == {}
+        return f.getvalue()
+
+    assert json_map(4) == json_map(1)
+
+
+def test_main_json_map_generation_jobs(tmp_path):
+    for jobs in ("1", "3"):
+        output = tmp_path.joinpath(jobs)
+        output.mkdir()
+        result = runner.invoke(
+            app,
+            ["-j", jobs, "-o", str(output), "tests/t01-services/synoptic/index.bob"],
+        )
+        assert result.exit_code == 0
+
+    assert (
+        tmp_path.joinpath("3/JsonMap.json").read_text()
+        == tmp_path.joinpath("1/JsonMap.json").read_text()
+    )
+
+
+def test_write_json_map_incremental_parses_changed_screens(tmp_path):
+    _write_screen(tmp_path.joinpath("index.bob"), "Index", ["a.bob", "b.bob"], [])
+    _write_screen(tmp_path.joinpath("a.bob"), "A", ["motor.bob"], [])
+    _write_screen(tmp_path.joinpath("b.bob"), "B", ["motor.bob"], [])
+    _write_screen(tmp_path.joinpath("motor.bob"), "Motor", [], [])
+
+    def write_json_map() -> tuple[list[Path], str]:
+        generator = JsonMapGenerator(
+            bob_path=tmp_path.joinpath("index.bob"),
+            techui=Path("tests/t01-services/synoptic/techui.yaml"),
+            incremental=True,
+        )
+        with patch.object(
+            generator, "_parse_screen", wraps=generator._parse_screen
+        ) as mock_parse:
+            generator.write_json_map()
+        parsed = [call.args[0].name for call in mock_parse.call_args_list]
+        return parsed, tmp_path.joinpath("JsonMap.json").read_text()
+
+    parsed, first = write_json_map()
+    assert parsed == ["index.bob", "a.bob", "motor.bob", "b.bob"]
+    assert tmp_path.joinpath(INDEX_FILE).exists()
+
+    parsed, unchanged = write_json_map()
+    assert parsed == []
+    assert unchanged == first
+
+    # Touched but not changed, as in a fresh checkout
+    os.utime(tmp_path.joinpath("a.bob"), ns=(0, 0))
+    _write_screen(tmp_path.joinpath("b.bob"), "B", ["motor.bob", "detail.bob"], [])
+    parsed, changed = write_json_map()
+    assert parsed == ["b.bob"]
+    assert json.loads(changed)["children"][1]["children"][1]["file"] == "detail.bob"
+
+    # The index of a normal run is not used
+    generator = JsonMapGenerator(
+        bob_path=tmp_path.joinpath("index.bob"),
+        techui=Path("tests/t01-services/synoptic/techui.yaml"),
+    )
+    generator.write_json_map()
+    assert tmp_path.joinpath("JsonMap.json").read_text() == changed
+
+
+def test_write_json_map_incremental_logs_reused_screen_errors(tmp_path, caplog):
+    tmp_path.joinpath("index.bob").write_text(
+        """<display version="2.0.0"><name>Index</name>
+<widget type="symbol" version="2.0.0"><name>pump</name></widget>
+<widget type="navtabs" version="2.0.0"><name>tabs</name></widget>
+</display>"""
+    )
+
+    def write_json_map() -> list[str]:
+        generator = JsonMapGenerator(
+            bob_path=tmp_path.joinpath("index.bob"),
+            techui=Path("tests/t01-services/synoptic/techui.yaml"),
+            incremental=True,
+        )
+        caplog.clear()
+        with caplog.at_level(logging.ERROR):
+            generator.write_json_map()
+        return [record.message for record in caplog.records]
+
+    errors = [
+        "Actions group not found in component [bold]pump[/bold] on [bold]Index[/bold]",
+        "Tabs group not found in component [bold]tabs[/bold] on [bold]Index[/bold]",
+    ]
+    assert write_json_map() == errors
+    # Reused from the index rather than parsed, but still reported
+    with patch.object(JsonMapGenerator, "_parse_screen") as mock_parse:
+        assert write_json_map() == errors
+    mock_parse.assert_not_called()
+
+
+def test_screen_index_unreadable(tmp_path, caplog):
+    index_file = tmp_path.joinpath(INDEX_FILE)
+    index_file.write_text("{not json")
+
+    index = ScreenIndex(index_file)
+
+    assert index.previous == {}
+    assert "Ignoring unreadable json map index" in caplog.text
+
+
+def test_screen_index_other_version(tmp_path):
+    index_file = tmp_path.joinpath(INDEX_FILE)
+    index_file.write_text(json.dumps({"version": 0, "screens": {"a.bob": {}}}))
+
+    assert ScreenIndex(index_file).previous == {}
@@ -0,0 +1,87 @@
+import pytest
+
+from techui_builder.layout import (
+    DEFAULT_SETTINGS,
+    LAYOUT_STRATEGIES,
+    shelf_layout,
+)
+
+SIZES = [
+    (205, 120),
+    (100, 40),
+    (205, 120),
+    (860, 450),
+    (100, 40),
+    (205, 120),
+    (100, 40),
+    (860, 450),
+    (205, 120),
+    (205, 120),
+    (100, 40),
+    (205, 120),
+]
+
+
+def _overlaps(a: tuple[int, int, int, int], b: tuple[int, int, int, int]) -> bool:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+def test_shelf_layout():
+    sizes = [(205, 120)] * 6 + [(100, 40)] * 3
+
+    placements = shelf_layout(sizes)
+
+    assert [(x, y) for _, x, y in placements] == [
+        (0, 0),
+        (0, 150),
+        (0, 300),
+        (0, 450),
+        (0, 600),
+        (235, 0),
+        (235, 150),
+        (355, 150),
+        (235, 220),
+    ]
+
+
+@pytest.mark.parametrize("strategy", LAYOUT_STRATEGIES.values())
+def test_layout_strategies_place_every_widget_once(strategy):
+    placements = strategy(SIZES, DEFAULT_SETTINGS)
+
+    assert sorted(index for index, _, _ in placements) == list(range(len(SIZES)))
+
+
+@pytest.mark.parametrize("strategy", LAYOUT_STRATEGIES.values())
+def test_layout_strategies_do_not_overlap(strategy):
+    placements = strategy(SIZES, DEFAULT_SETTINGS)
+    rects = [(x, y, *SIZES[index]) for index, x, y in placements]
+
+    for i, a in enumerate(rects):
+        for b in rects[i + 1 :]:
+            assert not _overlaps(a, b)
+
+
+@pytest.mark.parametrize("strategy", LAYOUT_STRATEGIES.values())
+def test_layout_strategies_respect_max_group_height(strategy):
+    placements = strategy(SIZES, DEFAULT_SETTINGS)
+
+    for index, _, y in placements:
+        assert y + SIZES[index][1] <= DEFAULT_SETTINGS.max_group_height
+
+
+@pytest.mark.parametrize("strategy", LAYOUT_STRATEGIES.values())
+def test_layout_strategies_too_tall_widget(strategy):
+    placements = strategy([(100, 40), (100, 900)], DEFAULT_SETTINGS)
+
+    tall = next((x, y) for index, x, y in placements if index == 1)
+    short = next((x, y) for index, x, y in placements if index == 0)
+    assert tall[1] == 0
+    # The tall widget must not be placed on top of the short one
+    assert tall[0] != short[0]
+
+
+def test_layout_strategies_empty():
+    for strategy in LAYOUT_STRATEGIES.values():
+        assert strategy([], DEFAULT_SETTINGS) == []
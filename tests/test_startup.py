@@ -0,0 +1,39 @@
+import importlib.util
+import subprocess
+import sys
+from pathlib import Path
+
+# The budget and the modules that must stay out of startup live with the benchmark
+_spec = importlib.util.spec_from_file_location(
+    "bench_startup",
+    Path(__file__).parents[1].joinpath("benchmarks/bench_startup.py"),
+)
+assert _spec is not None and _spec.loader is not None
+bench_startup = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bench_startup)
+
+
+def test_cli_does_not_import_heavy_modules():
+    times = bench_startup.import_times()
+
+    assert "techui_builder.__main__" in times
+    for heavy in bench_startup.HEAVY_MODULES:
+        assert heavy not in times
+
+
+def test_cli_import_time_within_budget():
+    best = min(
+        bench_startup.import_times()["techui_builder.__main__"] for _ in range(3)
+    )
+
+    assert best / 1e3 < bench_startup.IMPORT_BUDGET_MS
+
+
+def test_import_does_not_create_schemas_dir(tmp_path):
+    subprocess.run(
+        [sys.executable, "-c", "import techui_builder.__main__"],
+        cwd=tmp_path,
+        check=True,
+    )
+
+    assert list(tmp_path.iterdir()) == []
@@ -81,7 +81,7 @@ def test_status_write_status_pvs(status_gen):
     # Mock the Print() function so we don't actually write a file
     with (
         patch("builtins.open", m),
-        patch("techui_builder.status.Record.Print") as mock_print,
+        patch("epicsdbbuilder.recordbase.Record.Print") as mock_print,
     ):
         status_gen.write_status_pvs()
 
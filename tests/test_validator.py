@@ -1,10 +1,14 @@
+import logging
 from pathlib import Path
 from unittest.mock import Mock, patch
 
+import pytest
 from lxml.etree import Element, _ElementTree, tostring
 from lxml.objectify import fromstring
 from phoebusgen.widget import EmbeddedDisplay
 
+from techui_builder.validator import Validator, WidgetMismatch
+
 
 def test_validator_check_bobs(validator):
     validator._check_bob = Mock()
@@ -58,3 +62,91 @@ def test_validator_validate_bob(validator, example_xml_embedded_widget):
     test_pwidget.macro("macro1", "test_macro_1")
 
     validator.validate_bob("motor-edited", "motor", [test_pwidget])
+
+
+@patch("techui_builder.validator.etree.parse")
+def test_validator_check_bob_reads_header_only(mock_parse, tmp_path):
+    generated = tmp_path.joinpath("generated.bob")
+    generated.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n<!--Generated-->\n<display>'
+        + "<widget/>" * 1000
+        # Never reached, so never found to be malformed
+        + "<unclosed>"
+    )
+    validator = Validator([generated, Path("tests/test_files/motor-edited.bob")])
+
+    validator.check_bobs()
+
+    mock_parse.assert_not_called()
+    assert list(validator.validate) == ["motor-edited"]
+    # Only the screens to validate are kept, ready for validate_bob
+    assert list(validator.parsed) == ["motor-edited"]
+
+
+def test_validator_check_bob_long_prolog(tmp_path):
+    saved = tmp_path.joinpath("saved.bob")
+    saved.write_text(
+        f"<!--{'x' * 5000}-->\n<!--Saved on 1970-01-01 00:00:01 by TESTER-->\n"
+        "<display><name>saved</name></display>"
+    )
+    validator = Validator([saved])
+
+    validator.check_bobs()
+
+    assert validator.validate == {"saved": saved}
+
+
+def test_validator_validate_bob_reuses_parsed(validator):
+    validator.check_bobs()
+    validator._read_bob = Mock()
+
+    validator.validate_bob("motor-edited", "motor", [])
+
+    validator._read_bob.assert_not_called()
+
+
+def test_validator_validate_bob_reports_every_mismatch(validator):
+    validator.check_bobs()
+    file_group = fromstring(
+        """<widget type="group"><name>motor</name>
+<widget type="embedded"><name>X</name><width>205</width><height>100</height>
+<file>pmac/motor_embed.bob</file></widget>
+<widget type="embedded"><name>Y</name><width>205.0</width><height>120</height>
+<file>pmac/other.bob</file><macros><M>:Y</M></macros></widget></widget>"""
+    )
+    validator.parsed["motor-edited"] = (Mock(), {"motor": file_group})
+    pwidgets = []
+    for name in ("X", "Y", "Z"):
+        pwidget = EmbeddedDisplay(name, "pmac/motor_embed.bob", 0, 0, 205, 120)
+        pwidget.macro("P", "BL01T-MO-MOTOR-01")
+        pwidgets.append(pwidget)
+
+    with pytest.raises(AssertionError) as e:
+        validator.validate_bob("motor-edited", "motor", pwidgets)
+
+    assert validator._diff_widgets(file_group, pwidgets) == [
+        WidgetMismatch("X", "height", "120", "100"),
+        WidgetMismatch("X", "macros", "P", ""),
+        WidgetMismatch("Y", "file", "pmac/motor_embed.bob", "pmac/other.bob"),
+        WidgetMismatch("Y", "macros", "P", "M"),
+    ]
+    assert "X <height>: generated 120, saved 100" in str(e.value)
+    assert "Y <file>: generated pmac/motor_embed.bob, saved pmac/other.bob" in str(
+        e.value
+    )
+    # Widths and heights are compared as numbers
+    assert "Y <width>" not in str(e.value)
+    assert "Y <macros>: generated P, saved M" in str(e.value)
+
+
+def test_validator_validate_bob_matches(validator, caplog):
+    validator.check_bobs()
+    pwidget = EmbeddedDisplay("X", "tests/test-files/motor_embed.bob", 0, 0, 205, 120)
+    pwidget.macro("P", "BL01T-MO-MOTOR-01")
+    file_group = validator.parsed["motor-edited"][0].widget
+    validator.parsed["motor-edited"] = (Mock(), {"motor": file_group})
+
+    with caplog.at_level(logging.INFO):
+        validator.validate_bob("motor-edited", "motor", [pwidget])
+
+    assert "motor-edited.bob has been validated successfully" in caplog.text
@@ -0,0 +1,40 @@
+from unittest.mock import patch
+
+from techui_builder.watch import Watcher
+
+
+def test_watcher_changes(tmp_path):
+    techui = tmp_path.joinpath("techui.yaml")
+    techui.write_text("a")
+    ignored = tmp_path.joinpath("index.bob")
+    ignored.write_text("a")
+
+    watcher = Watcher([(tmp_path, "*.yaml")], polling=True)
+    snapshot = watcher.snapshot()
+    assert set(snapshot) == {techui.absolute()}
+
+    changed, snapshot = watcher.changes(snapshot)
+    assert changed == set()
+
+    ignored.write_text("b")
+    added = tmp_path.joinpath("ioc.yaml")
+    added.write_text("a")
+    techui.unlink()
+
+    changed, snapshot = watcher.changes(snapshot)
+    assert changed == {techui.absolute(), added.absolute()}
+    assert set(snapshot) == {added.absolute()}
+
+
+def test_watcher_iter(tmp_path):
+    techui = tmp_path.joinpath("techui.yaml")
+    techui.write_text("a")
+    watcher = Watcher([(tmp_path, "*.yaml")], polling=True)
+
+    def _wait():
+        yield
+        techui.write_text("longer")
+        yield
+
+    with patch.object(watcher, "_wait", _wait):
+        assert list(watcher) == [{techui.absolute()}]
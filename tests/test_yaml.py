@@ -0,0 +1,24 @@
+from pathlib import Path
+
+import pytest
+import yaml
+
+from techui_builder._yaml import SafeLoader, safe_load
+
+
+def test_safe_load_uses_libyaml_when_available():
+    if yaml.__with_libyaml__:
+        assert SafeLoader is yaml.CSafeLoader
+    else:
+        assert SafeLoader is yaml.SafeLoader
+
+
+def test_safe_load_matches_pyyaml():
+    techui = Path("tests/t01-services/synoptic/techui.yaml").read_text()
+
+    assert safe_load(techui) == yaml.safe_load(techui)
+
+
+def test_safe_load_refuses_python_objects():
+    with pytest.raises(yaml.constructor.ConstructorError):
+        safe_load("!!python/object/apply:os.getcwd []")